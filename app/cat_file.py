@@ -1,72 +1,107 @@
 import argparse
-from pathlib import Path
-import zlib
+from binascii import hexlify
+import sys
+from typing import BinaryIO, Iterable, List, Optional
 
-from tig.core.repository import get_repo_root
+from tig.core.object_database import ObjectDatabase
+from tig.core.output import exit_on_broken_pipe, stdout_writer
+from tig.core.repository import Repository, get_repository
+from tig.core.tree import iter_tree_entries
 
 
-def parse_blob(content: bytes):
-    print(content.decode(), end='') # 简化实现，假设文件内容是文本形式
+def parse_blob(chunks: Iterable[bytes], out: BinaryIO):
+    # 按块原样输出，内存占用与 blob 大小无关，二进制内容也能正确输出
+    for chunk in chunks:
+        out.write(chunk)
 
 
-def parse_tree(content: bytes):
-    # tree entry format: mode name\0sha1
-    i = 0
-    while i < len(content):
-        space_idx = content.find(b' ', i)
-        null_idx = content.find(b'\x00', space_idx)
+def parse_tree(content: bytes, out: BinaryIO):
+    out.write(b''.join(
+        b'%s %s %s\n' % (mode, hexlify(sha1), name)
+        for mode, name, sha1 in iter_tree_entries(content)
+    ))
 
-        mode = content[i:space_idx].decode()
-        name = content[space_idx+1:null_idx].decode()
-        sha1 = content[null_idx+1:null_idx+21].hex() # 40-bit
 
-        print(f"{mode} {sha1} {name}")
-        i = null_idx + 21
+def parse_commit(content: bytes, out: BinaryIO):
+    out.write(content)
 
 
-def parse_commit(content: bytes):
-    print(content.decode(), end='')
+def parse_tag(content: bytes, out: BinaryIO):
+    out.write(content)
 
 
-def parse_tag(content: bytes):
-    print(content.decode(), end='')
+def write_batch(odb: ObjectDatabase, lines: Iterable[bytes], with_contents: bool, out: BinaryIO, flush: bool = False):
+    """每行一个对象名，输出 <sha> <type> <size> (以及对象内容)，不存在的对象输出 <name> missing"""
+    for line in lines:
+        name = line.strip().decode(errors='replace')
+        if not name:
+            continue
+        obj = odb.stream(name) if with_contents else odb.info(name)
+        if obj is None:
+            out.write(f"{name} missing\n".encode())
+        else:
+            out.write(f"{name} {obj[0]} {obj[1]}\n".encode())
+            if with_contents:
+                for chunk in obj[2]:
+                    out.write(chunk)
+                out.write(b'\n')
+        if flush:
+            out.flush()
 
 
-def cat_file(repo_path: Path, file_hash: str):
-    # 1. 根据sha1找到文件路径
-    dot_git_path = repo_path / '.git'
-    assert dot_git_path.exists()
-    target_path = dot_git_path / 'objects' / file_hash[:2] / file_hash [2:]
-    assert target_path.exists(), f"Cannot find object file: {target_path}, may be packed."
+def write_object(odb: ObjectDatabase, file_hash: str, out: BinaryIO):
+    # 1. 根据sha1找到对象
+    obj = odb.stream(file_hash)
+    assert obj is not None, f"Cannot find object: {file_hash}"
 
-    # 2. 读取文件，zlib解压文件内容
-    with open(target_path, 'rb') as fp:
-        data = zlib.decompress(fp.read())
-    
-    # 3.1 解析头部信息，确认对象类型
-    head = data.split(b'\0')[0].decode()
-    content = b'\0'.join(data.split(b'\0')[1:])
-    object_type = head.split(' ')[0]
-    content_size = int(head.split(' ')[-1])
-    
-    # 3.2 根据不同对象类型解析文件的内容
-    print(f"Type: {object_type}, Size: {content_size}")
+    # 2. 确认对象类型
+    object_type, content_size, chunks = obj
+
+    # 3. 根据不同对象类型解析文件的内容，blob 直接流式输出
+    out.write(f"Type: {object_type}, Size: {content_size}\n".encode())
     if object_type == 'blob':
-        parse_blob(content)
-    elif object_type == 'tree':
-        parse_tree(content)
+        parse_blob(chunks, out)
+        return
+
+    content = b''.join(chunks)
+    if object_type == 'tree':
+        parse_tree(content, out)
     elif object_type == 'commit':
-        parse_commit(content)
+        parse_commit(content, out)
     elif object_type == 'tag':
-        parse_tag(content)
+        parse_tag(content, out)
     else:
         raise ValueError(f"Cannot recognize object type: {object_type}")
 
 
-def main():
+def cat_file_batch(repo: Repository, with_contents: bool, flush: bool = False):
+    with ObjectDatabase(repo.objects_dir) as odb, stdout_writer() as out:
+        write_batch(odb, sys.stdin.buffer, with_contents, out, flush)
+
+
+def cat_file(repo: Repository, file_hash: str):
+    with ObjectDatabase(repo.objects_dir) as odb, stdout_writer() as out:
+        write_object(odb, file_hash, out)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
     parser = argparse.ArgumentParser()
-    parser.add_argument("object", type=str)
-    args = parser.parse_args()
+    parser.add_argument("object", type=str, nargs='?')
+    batch_group = parser.add_mutually_exclusive_group()
+    batch_group.add_argument('--batch', action='store_true', help="print header and contents of objects named on stdin")
+    batch_group.add_argument('--batch-check', action='store_true', help="print header of objects named on stdin")
+    parser.add_argument('--flush', action='store_true', help="flush output after each object in batch mode")
+    args = parser.parse_args(argv)
+    if not (args.batch or args.batch_check) and args.object is None:
+        parser.error("object is required unless --batch or --batch-check is given")
+    return args
 
-    repo_root = get_repo_root()
-    cat_file(repo_root, args.object)
+
+def main():
+    args = parse_args()
+    repo = get_repository()
+    with exit_on_broken_pipe():
+        if args.batch or args.batch_check:
+            cat_file_batch(repo, args.batch, args.flush)
+        else:
+            cat_file(repo, args.object)
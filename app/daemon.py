@@ -0,0 +1,238 @@
+import argparse
+import asyncio
+from contextlib import redirect_stderr, redirect_stdout
+import io
+import json
+import os
+from pathlib import Path
+import signal
+import socket
+import struct
+import sys
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.cat_file import parse_args as parse_cat_file_args, write_batch, write_object
+from app.daemon_client import (FRAME_EXIT, FRAME_HEADER, FRAME_INPUT, FRAME_INPUT_END, FRAME_REQUEST, FRAME_STDERR,
+                               FRAME_STDOUT, MAX_FRAME_SIZE, pack_frame, socket_path)
+from app.ls_files import parse_args as parse_ls_files_args
+from app.show_ref import parse_args as parse_show_ref_args, write_refs
+from tig.core.cache import stat_key
+from tig.core.index import GitIndex
+from tig.core.object_database import ObjectDatabase
+from tig.core.refs import RefStore
+from tig.core.repository import Repository, get_repository
+
+
+class FrameWriter:
+    """把命令的输出写成 stdout/stderr 帧，凑满一帧或 flush() 时才发送"""
+
+    def __init__(self, writer: asyncio.StreamWriter, kind: bytes):
+        self.writer = writer
+        self.kind = kind
+        self._buffer = bytearray()
+
+    def write(self, data):
+        # show-ref 的错误信息按文本写入
+        self._buffer += data.encode() if isinstance(data, str) else data
+        while len(self._buffer) >= MAX_FRAME_SIZE:
+            self.writer.write(pack_frame(self.kind, bytes(self._buffer[:MAX_FRAME_SIZE])))
+            del self._buffer[:MAX_FRAME_SIZE]
+
+    def flush(self):
+        if self._buffer:
+            self.writer.write(pack_frame(self.kind, bytes(self._buffer)))
+            self._buffer.clear()
+
+
+class DaemonState:
+    """常驻内存的仓库数据: 对象库 (打开的 pack 和 idx)、ref 和解析好的 index。
+    每个请求开始时比较文件的 stat，只重新加载发生变化的部分"""
+
+    def __init__(self, repo: Repository):
+        self.repo = repo
+        self.odb = ObjectDatabase(repo.objects_dir)
+        # RefStore 自己会在 packed-refs、tables.list 变化时重新加载，松散 ref 每次都从磁盘读取
+        self.refs = RefStore(repo.git_dir, repo.common_dir)
+        self._pack_dir_stat = stat_key(repo.objects_dir / 'pack')
+        self._index: Optional[GitIndex] = None
+        self._index_stat: Optional[Tuple[int, int, int]] = None
+
+    def refresh(self):
+        # 增加或删除 pack 会改变 pack 目录的 mtime; 松散对象的目录列表很便宜，每次都重新读取
+        pack_dir_stat = stat_key(self.repo.objects_dir / 'pack')
+        self.odb.refresh(packs=pack_dir_stat != self._pack_dir_stat)
+        self._pack_dir_stat = pack_dir_stat
+
+    def index(self) -> Optional[GitIndex]:
+        index_stat = stat_key(self.repo.index_file)
+        if index_stat != self._index_stat:
+            self._index = None
+            self._index_stat = index_stat
+            if index_stat is not None:
+                self._index = GitIndex(self.repo.index_file)
+                self._index.parse()
+        return self._index
+
+    def close(self):
+        self.odb.close()
+        self.refs.close()
+
+
+class ArgumentError(Exception):
+    def __init__(self, status: int):
+        self.status = status
+
+
+def parse_command_args(parse: Callable[[List[str]], argparse.Namespace], prog: str, args: List[str],
+                       out: FrameWriter, err: FrameWriter) -> argparse.Namespace:
+    # argparse 出错或 --help 时会写 stderr/stdout 并调用 sys.exit，这里把输出转给客户端;
+    # 用法信息中的程序名取自 sys.argv[0]，临时换成对应的命令名
+    captured_out, captured_err = io.StringIO(), io.StringIO()
+    argv0 = sys.argv[0]
+    sys.argv[0] = prog
+    try:
+        with redirect_stdout(captured_out), redirect_stderr(captured_err):
+            return parse(args)
+    except SystemExit as e:
+        out.write(captured_out.getvalue())
+        err.write(captured_err.getvalue())
+        raise ArgumentError(e.code if isinstance(e.code, int) else 1)
+    finally:
+        sys.argv[0] = argv0
+
+
+class Daemon:
+    def __init__(self, repo: Repository):
+        self.state = DaemonState(repo)
+        self.handlers: Dict[str, Callable] = {
+            'cat-file': self.cat_file,
+            'ls-files': self.ls_files,
+            'show-ref': self.show_ref,
+        }
+
+    async def cat_file(self, args: List[str], inputs: asyncio.Queue, out: FrameWriter, err: FrameWriter) -> int:
+        args = parse_command_args(parse_cat_file_args, 'tig-cat-file', args, out, err)
+        if not (args.batch or args.batch_check):
+            write_object(self.state.odb, args.object, out)
+            return 0
+
+        # 输入按帧到达，只处理完整的行，每批输出后等待客户端读取
+        pending = b''
+        while (chunk := await inputs.get()) is not None:
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            write_batch(self.state.odb, lines, args.batch, out, args.flush)
+            out.flush()
+            await out.writer.drain()
+        write_batch(self.state.odb, [pending], args.batch, out, args.flush)
+        return 0
+
+    async def ls_files(self, args: List[str], inputs: asyncio.Queue, out: FrameWriter, err: FrameWriter) -> int:
+        # index 在加载时已经完整校验过，-j 和校验选项不再起作用
+        args = parse_command_args(parse_ls_files_args, 'tig-ls-files', args, out, err)
+        git_index = self.state.index()
+        if git_index is None:
+            return 0
+        git_index.print_header(out)
+        git_index.print(out)
+        if args.verify == GitIndex.VERIFY_BACKGROUND:
+            out.write(b"Checksum: ok\n")
+        return 0
+
+    async def show_ref(self, args: List[str], inputs: asyncio.Queue, out: FrameWriter, err: FrameWriter) -> int:
+        args = parse_command_args(parse_show_ref_args, 'tig-show-ref', args, out, err)
+        return write_refs(self.state.refs, self.state.odb, out, err, args.patterns, args.heads, args.tags,
+                          args.show_head, args.verify, args.hash_only, args.dereference, args.quiet)
+
+    async def read_inputs(self, reader: asyncio.StreamReader, inputs: asyncio.Queue):
+        # stdin 帧放入队列，结束 (或连接断开) 时放入 None
+        try:
+            while True:
+                kind, size = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+                payload = await reader.readexactly(size) if size else b''
+                if kind == FRAME_INPUT:
+                    await inputs.put(payload)
+                elif kind == FRAME_INPUT_END:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        await inputs.put(None)
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        out = FrameWriter(writer, FRAME_STDOUT)
+        err = FrameWriter(writer, FRAME_STDERR)
+        input_task = None
+        try:
+            kind, size = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+            assert kind == FRAME_REQUEST, f"Unexpected frame: {kind!r}"
+            request = json.loads(await reader.readexactly(size))
+            inputs: asyncio.Queue = asyncio.Queue()
+            input_task = asyncio.create_task(self.read_inputs(reader, inputs))
+
+            handler = self.handlers.get(request['command'])
+            if handler is None:
+                err.write(f"fatal: unsupported command: {request['command']}\n")
+                status = 128
+            else:
+                # 所有请求在同一个事件循环线程中执行，共享的对象库和 index 不需要加锁
+                self.state.refresh()
+                try:
+                    status = await handler(request['args'], inputs, out, err)
+                except ArgumentError as e:
+                    status = e.status
+                except (AssertionError, ValueError, OSError) as e:
+                    out.flush()
+                    err.write(f"fatal: {e}\n")
+                    status = 128
+            out.flush()
+            err.flush()
+            writer.write(pack_frame(FRAME_EXIT, struct.pack('>i', status)))
+            await writer.drain()
+            # 读完客户端剩下的输入再关闭，否则未读的数据会让内核发送 RST，客户端可能收不到退出码
+            await input_task
+        except (asyncio.IncompleteReadError, ConnectionError, AssertionError, ValueError):
+            # 客户端提前退出或请求格式错误
+            if input_task is not None:
+                input_task.cancel()
+        finally:
+            writer.close()
+
+    async def serve(self, path: Path):
+        server = await asyncio.start_unix_server(self.handle_client, path=str(path))
+        print(f"tig-daemon listening on {path}", file=sys.stderr)
+        # 收到 SIGINT 或 SIGTERM 时正常退出，以便删除 socket 文件
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        async with server:
+            await stop.wait()
+
+    def close(self):
+        self.state.close()
+
+
+def run_daemon(repo: Repository, path: Path):
+    # 上一次异常退出留下的 socket 文件会让 bind 失败，先确认没有 daemon 在监听再删除
+    if path.exists():
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            running = probe.connect_ex(str(path)) == 0
+        assert not running, f"tig-daemon is already running at {path}"
+        path.unlink()
+
+    daemon = Daemon(repo)
+    try:
+        asyncio.run(daemon.serve(path))
+    finally:
+        daemon.close()
+        if path.exists():
+            os.unlink(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="serve cat-file, ls-files and show-ref from memory over a Unix socket")
+    parser.add_argument('--socket', type=Path, default=None, help="socket path (default: $GIT_DIR/tig-daemon.sock)")
+    args = parser.parse_args()
+
+    repo = get_repository()
+    run_daemon(repo, args.socket or socket_path(repo))
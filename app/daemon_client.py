@@ -0,0 +1,112 @@
+import argparse
+import json
+import os
+from pathlib import Path
+import socket
+import struct
+import sys
+import threading
+from typing import Optional, Tuple
+
+from tig.core.output import exit_on_broken_pipe
+from tig.core.repository import Repository, get_repository
+
+# 客户端只依赖标准库中很轻的模块，启动时不导入对象库、index 等解析代码
+
+SOCKET_ENVIRONMENT = 'TIG_DAEMON_SOCKET'
+SOCKET_NAME = 'tig-daemon.sock'
+
+# 帧格式: 类型 (1 Byte) + 长度 (uint32) + 数据
+FRAME_HEADER = struct.Struct('>cI')
+FRAME_REQUEST = b'r' # 客户端 -> 服务端: {"command": ..., "args": [...]} (JSON)
+FRAME_INPUT = b'i'   # 客户端 -> 服务端: stdin 数据
+FRAME_INPUT_END = b'd'
+FRAME_STDOUT = b'o'  # 服务端 -> 客户端
+FRAME_STDERR = b'e'
+FRAME_EXIT = b'x'    # 服务端 -> 客户端: 退出码 (int32)，之后连接关闭
+
+MAX_FRAME_SIZE = 1 << 16
+
+# 需要把 stdin 转发给服务端的命令参数
+STDIN_OPTIONS = {'cat-file': ('--batch', '--batch-check')}
+
+
+def socket_path(repo: Repository) -> Path:
+    return Path(os.environ.get(SOCKET_ENVIRONMENT) or repo.git_dir / SOCKET_NAME)
+
+
+def pack_frame(kind: bytes, payload: bytes = b'') -> bytes:
+    return FRAME_HEADER.pack(kind, len(payload)) + payload
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> Optional[bytes]:
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            return None
+        buf += chunk
+    return bytes(buf)
+
+
+def recv_frame(sock: socket.socket) -> Optional[Tuple[bytes, bytes]]:
+    header = _recv_exactly(sock, FRAME_HEADER.size)
+    if header is None:
+        return None
+    kind, size = FRAME_HEADER.unpack(header)
+    payload = _recv_exactly(sock, size) if size else b''
+    return (kind, payload) if payload is not None else None
+
+
+def _forward_stdin(sock: socket.socket):
+    # 在单独的线程中转发 stdin，主线程同时接收输出 (--batch 的调用方可能等输出后再写下一行)
+    fd = sys.stdin.fileno()
+    try:
+        while chunk := os.read(fd, MAX_FRAME_SIZE):
+            sock.sendall(pack_frame(FRAME_INPUT, chunk))
+        sock.sendall(pack_frame(FRAME_INPUT_END))
+    except OSError:
+        pass
+
+
+def run_client(path: Path, command: str, args: list) -> int:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(path))
+    except OSError as e:
+        print(f"fatal: cannot connect to tig-daemon at {path}: {e.strerror}", file=sys.stderr)
+        return 128
+
+    with sock:
+        sock.sendall(pack_frame(FRAME_REQUEST, json.dumps({'command': command, 'args': args}).encode()))
+        if any(arg in STDIN_OPTIONS.get(command, ()) for arg in args):
+            threading.Thread(target=_forward_stdin, args=(sock,), daemon=True).start()
+        else:
+            sock.sendall(pack_frame(FRAME_INPUT_END))
+
+        stdout, stderr = sys.stdout.buffer, sys.stderr.buffer
+        while (frame := recv_frame(sock)) is not None:
+            kind, payload = frame
+            if kind == FRAME_STDOUT:
+                stdout.write(payload)
+                stdout.flush()
+            elif kind == FRAME_STDERR:
+                stderr.write(payload)
+                stderr.flush()
+            elif kind == FRAME_EXIT:
+                return struct.unpack('>i', payload)[0]
+    print("fatal: tig-daemon closed the connection", file=sys.stderr)
+    return 128
+
+
+def main():
+    parser = argparse.ArgumentParser(description="forward a tig command to a running tig-daemon")
+    parser.add_argument('--socket', type=Path, default=None, help="daemon socket (default: $GIT_DIR/tig-daemon.sock)")
+    parser.add_argument('command', type=str, help="cat-file, ls-files or show-ref")
+    parser.add_argument('args', nargs=argparse.REMAINDER, help="arguments of the command")
+    args = parser.parse_args()
+
+    path = args.socket or socket_path(get_repository())
+    with exit_on_broken_pipe():
+        status = run_client(path, args.command, args.args)
+    sys.exit(status)
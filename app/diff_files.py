@@ -0,0 +1,195 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import stat
+from typing import Dict, List, Optional, Tuple
+
+from tig.core.index import GitIndex
+from tig.core.output import exit_on_broken_pipe, stdout_writer, write_lines
+from tig.core.repository import Repository, get_repository
+from tig.core.tree import OUTPUT_NAME_ONLY, OUTPUT_NAME_STATUS, OUTPUT_RAW, S_IFMT, TreeChange, format_change
+
+CE_VALID = 0x8000 # assume-unchanged
+CE_SKIP_WORKTREE = 0x4000 # 扩展 flags
+S_IFGITLINK = 0o160000
+
+EMPTY_BLOB_SHA1 = bytes.fromhex('e69de29bb2d1d6434b8b29ae775ad8c2d48c5391')
+HASH_CHUNK_SIZE = 1 << 20
+
+# 与 preload-index.c 一致: 最多 20 个线程，每个线程至少处理这么多 entry
+MAX_STAT_THREADS = 20
+MIN_ENTRIES_PER_THREAD = 500
+
+# stat 字段在 GitIndex.stat_data 中的位置
+CTIME_SEC, CTIME_NANO, MTIME_SEC, MTIME_NANO, DEV, INO, MODE, UID, GID, SIZE = range(GitIndex.STAT_FIELDS)
+
+
+def worktree_mode(st: os.stat_result) -> int:
+    # 工作区文件对应的 index mode，目录 (不是子模块时) 视为文件已被删除
+    if stat.S_ISLNK(st.st_mode):
+        return 0o120000
+    if stat.S_ISREG(st.st_mode):
+        return 0o100755 if st.st_mode & 0o100 else 0o100644
+    if stat.S_ISDIR(st.st_mode):
+        return S_IFGITLINK
+    return 0
+
+
+def hash_worktree_file(path: bytes, st: os.stat_result) -> bytes:
+    # 按 blob 对象计算 sha1: "blob <size>\0" + 内容 (符号链接的内容是链接目标)
+    if stat.S_ISLNK(st.st_mode):
+        content = os.readlink(path)
+        return hashlib.sha1(b'blob %d\x00' % len(content) + content).digest()
+    with open(path, 'rb') as fp:
+        h = hashlib.sha1(b'blob %d\x00' % os.fstat(fp.fileno()).st_size)
+        while chunk := fp.read(HASH_CHUNK_SIZE):
+            h.update(chunk)
+    return h.digest()
+
+
+def stat_changed(stat_data, base: int, st: os.stat_result) -> bool:
+    # ce_match_stat_basic (read-cache.c): 默认不比较纳秒和 dev
+    return (
+        stat_data[base+MTIME_SEC] != st.st_mtime_ns // 1_000_000_000 & 0xffffffff
+        or stat_data[base+CTIME_SEC] != st.st_ctime_ns // 1_000_000_000 & 0xffffffff
+        or stat_data[base+UID] != st.st_uid & 0xffffffff
+        or stat_data[base+GID] != st.st_gid & 0xffffffff
+        or stat_data[base+INO] != st.st_ino & 0xffffffff
+        or stat_data[base+SIZE] != st.st_size & 0xffffffff
+    )
+
+
+def check_entries(git_index: GitIndex, root: bytes, ks: List[int], index_mtime: int) -> List[Tuple[int, str, int]]:
+    """检查一组 entry 的工作区状态，返回有变化的 (entry 下标, 状态, 工作区 mode)。
+    只有 stat 数据不一致，或者文件在 index 写入的同一秒内被修改过 (racy) 时才计算文件的 sha1"""
+    stat_data, sha1s, paths = git_index.stat_data, git_index.sha1s, git_index.paths
+    fields = GitIndex.STAT_FIELDS
+    changes = []
+    for k in ks:
+        path = root + paths[k]
+        try:
+            st = os.lstat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            changes.append((k, 'D', 0))
+            continue
+
+        base = k * fields
+        mode = stat_data[base+MODE]
+        new_mode = worktree_mode(st)
+        if mode == S_IFGITLINK:
+            # 子模块只检查目录是否存在
+            if new_mode != S_IFGITLINK:
+                changes.append((k, 'T' if new_mode else 'D', new_mode))
+            continue
+        if new_mode == S_IFGITLINK or not new_mode:
+            changes.append((k, 'D', 0))
+            continue
+        if new_mode & S_IFMT != mode & S_IFMT:
+            changes.append((k, 'T', new_mode))
+            continue
+        if new_mode != mode:
+            # 只有可执行位不同，不需要比较内容
+            changes.append((k, 'M', new_mode))
+            continue
+
+        sha1 = sha1s[20*k:20*k+20]
+        changed = stat_changed(stat_data, base, st)
+        # 写 index 时会把 racy 的 entry 的 size 置 0 ("smudge")，这种 entry 也需要比较内容
+        changed = changed or (stat_data[base+SIZE] == 0 and sha1 != EMPTY_BLOB_SHA1)
+        # racy: 文件的 mtime 不早于 index 本身的 mtime 时，stat 一致也不能说明内容没变
+        racy = stat_data[base+MTIME_SEC] >= index_mtime
+        if (changed or racy) and hash_worktree_file(path, st) != sha1:
+            changes.append((k, 'M', new_mode))
+    return changes
+
+
+def check_unmerged(git_index: GitIndex, root: bytes, path: bytes, ks: List[int]) -> List[Tuple[int, TreeChange]]:
+    # 与 git diff-files 一致: 先输出 U，再把 stage 2 (ours) 与工作区比较。
+    # stage 条目没有 stat 数据，工作区文件存在时总是视为已修改
+    try:
+        new_mode = worktree_mode(os.lstat(root + path))
+    except (FileNotFoundError, NotADirectoryError):
+        new_mode = 0
+    if new_mode == S_IFGITLINK:
+        new_mode = 0
+    changes = [(ks[0], ('U', b'0', b'%o' % new_mode, None, None, path))]
+    for k in ks:
+        if (git_index.flags[k] & GitIndex.CE_STAGEMASK) >> GitIndex.CE_STAGESHIFT == 2:
+            mode = git_index.stat_data[k*GitIndex.STAT_FIELDS+MODE]
+            status = 'D' if not new_mode else 'T' if new_mode & S_IFMT != mode & S_IFMT else 'M'
+            changes.append((k, (status, b'%o' % mode, b'%o' % new_mode, git_index.sha1s[20*k:20*k+20], None, path)))
+    return changes
+
+
+def group_by_directory(paths: List[bytes], ks: List[int]) -> List[List[int]]:
+    # index 按路径排序，同一目录下的文件是连续的; 把相邻的目录合并成足够大的任务
+    groups = []
+    current = []
+    current_dir = None
+    for k in ks:
+        dir_name = paths[k].rpartition(b'/')[0]
+        if dir_name != current_dir and len(current) >= MIN_ENTRIES_PER_THREAD:
+            groups.append(current)
+            current = []
+        current_dir = dir_name
+        current.append(k)
+    if current:
+        groups.append(current)
+    return groups
+
+
+def diff_files(repo: Repository, output_format: str = OUTPUT_RAW, jobs: Optional[int] = None):
+    assert repo.work_tree is not None, "diff-files must be run in a work tree"
+    index_file = repo.index_file
+    if not index_file.exists():
+        return
+
+    index_mtime = os.stat(index_file).st_mtime_ns // 1_000_000_000
+    git_index = GitIndex(index_file)
+    git_index.parse()
+
+    # 冲突中的路径 (stage > 0) 单独处理，跳过 assume-unchanged 和 skip-worktree 的 entry
+    unmerged: Dict[bytes, List[int]] = {}
+    ks = []
+    for k, path in enumerate(git_index.paths):
+        if git_index.flags[k] & GitIndex.CE_STAGEMASK:
+            unmerged.setdefault(path, []).append(k)
+        elif not (git_index.flags[k] & CE_VALID or git_index.ext_flags[k] & CE_SKIP_WORKTREE):
+            ks.append(k)
+
+    root = os.fsencode(repo.work_tree) + b'/'
+    groups = group_by_directory(git_index.paths, ks)
+    threads = min(jobs or MAX_STAT_THREADS, len(groups))
+    if threads > 1:
+        # lstat 和读文件时会释放 GIL，多个线程可以同时等待文件系统
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(pool.map(lambda group: check_entries(git_index, root, group, index_mtime), groups))
+    else:
+        results = [check_entries(git_index, root, ks, index_mtime)]
+
+    changes: List[Tuple[int, TreeChange]] = []
+    for k, status, new_mode in (change for result in results for change in result):
+        mode = git_index.stat_data[k*GitIndex.STAT_FIELDS+MODE]
+        sha1 = git_index.sha1s[20*k:20*k+20]
+        changes.append((k, (status, b'%o' % mode, b'%o' % new_mode, sha1, None, git_index.paths[k])))
+    for path, stage_ks in unmerged.items():
+        changes.extend(check_unmerged(git_index, root, path, stage_ks))
+    changes.sort(key=lambda item: item[0])
+
+    with stdout_writer() as out:
+        write_lines(out, (format_change(change, output_format) for _, change in changes))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    format_group = parser.add_mutually_exclusive_group()
+    format_group.add_argument('--name-only', action='store_const', dest='output_format', const=OUTPUT_NAME_ONLY, help="show only names of changed files")
+    format_group.add_argument('--name-status', action='store_const', dest='output_format', const=OUTPUT_NAME_STATUS, help="show only names and status of changed files")
+    parser.set_defaults(output_format=OUTPUT_RAW)
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="number of threads for checking the working tree")
+    args = parser.parse_args()
+
+    repo = get_repository()
+    with exit_on_broken_pipe():
+        diff_files(repo, args.output_format, args.jobs)
@@ -0,0 +1,88 @@
+import argparse
+from itertools import chain
+import sys
+from typing import List, Optional
+
+from tig.core.object_database import ObjectDatabase
+from tig.core.output import exit_on_broken_pipe, stdout_writer, write_lines
+from tig.core.refs import RefStore
+from tig.core.repository import Repository, get_repository
+from tig.core.revision import resolve_revision
+from tig.core.tree import OUTPUT_NAME_ONLY, OUTPUT_NAME_STATUS, OUTPUT_RAW, Pathspec, TreeWalker, format_change, peel_to_tree
+
+
+def commit_parents(odb: ObjectDatabase, file_hash: str) -> Optional[List[str]]:
+    # 不是提交时返回 None
+    obj = odb.read(file_hash)
+    if obj is None or obj[0] != 'commit':
+        return None
+    content = obj[1]
+    return [
+        line[7:47].decode()
+        for line in content[:content.find(b'\n\n')].split(b'\n')
+        if line.startswith(b'parent ')
+    ]
+
+
+def diff_tree(repo: Repository, tree_ishes: List[str], paths: List[str], recursive: bool = False,
+              output_format: str = OUTPUT_RAW):
+    hashes = []
+    with RefStore(repo.git_dir, repo.common_dir) as refs:
+        for k, tree_ish in enumerate(tree_ishes):
+            file_hash = resolve_revision(refs, tree_ish)
+            if file_hash is None and k > 0:
+                # 第二个参数不是对象名时当作路径
+                paths = tree_ishes[k:] + paths
+                break
+            assert file_hash is not None, f"Not a valid object name: {tree_ish}"
+            hashes.append(file_hash)
+
+    with ObjectDatabase(repo.objects_dir) as odb, stdout_writer() as out:
+        header = b''
+        if len(hashes) == 1:
+            # 只给出一个提交时，与它唯一的父提交比较 (根提交和合并提交不输出)
+            parents = commit_parents(odb, hashes[0])
+            assert parents is not None, f"Not a commit: {tree_ishes[0]}"
+            if len(parents) != 1:
+                return
+            header = hashes[0].encode() + b'\n'
+            hashes.insert(0, parents[0])
+
+        old_tree, new_tree = (peel_to_tree(odb, file_hash) for file_hash in hashes)
+        assert old_tree is not None and new_tree is not None, "Not a tree object"
+
+        walker = TreeWalker(odb)
+        pathspec = Pathspec(paths) if paths else None
+        changes = iter(walker.diff(bytes.fromhex(old_tree), bytes.fromhex(new_tree), recursive, pathspec))
+        # 只有存在差异时才输出提交的 sha1
+        first = next(changes, None)
+        if first is None:
+            return
+        out.write(header)
+        write_lines(out, (format_change(change, output_format) for change in chain([first], changes)))
+
+
+def main():
+    # "--" 之后的参数都是路径
+    argv = sys.argv[1:]
+    paths = []
+    if '--' in argv:
+        paths = argv[argv.index('--')+1:]
+        argv = argv[:argv.index('--')]
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('tree_ish', type=str, nargs='+', help="a commit, or two trees/commits to compare, optionally followed by paths")
+    parser.add_argument('-r', action='store_true', dest='recursive', help="recurse into subtrees")
+    format_group = parser.add_mutually_exclusive_group()
+    format_group.add_argument('--name-only', action='store_const', dest='output_format', const=OUTPUT_NAME_ONLY, help="show only names of changed files")
+    format_group.add_argument('--name-status', action='store_const', dest='output_format', const=OUTPUT_NAME_STATUS, help="show only names and status of changed files")
+    parser.set_defaults(output_format=OUTPUT_RAW)
+    args = parser.parse_args(argv)
+
+    # 未用 "--" 分隔时，前两个参数之后的都是路径
+    tree_ishes = args.tree_ish[:2]
+    paths = args.tree_ish[2:] + paths
+
+    repo = get_repository()
+    with exit_on_broken_pipe():
+        diff_tree(repo, tree_ishes, paths, args.recursive, args.output_format)
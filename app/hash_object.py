@@ -0,0 +1,54 @@
+import argparse
+import sys
+from typing import BinaryIO, Iterable, List, Optional
+
+from tig.core.object_database import ObjectDatabase
+from tig.core.object_writer import OBJECT_TYPES, LooseObjectWriter, hash_files, hash_object
+from tig.core.output import exit_on_broken_pipe, stdout_writer, write_lines
+from tig.core.repository import get_repository
+
+
+def write_hashes(hashes: Iterable[str], out: BinaryIO):
+    write_lines(out, (f"{file_hash}\n".encode() for file_hash in hashes))
+
+
+def hash_objects(paths: List[str], object_type: str = 'blob', stdin: bool = False, write: bool = False,
+                 jobs: Optional[int] = None, fsync: bool = True):
+    # 与 git 一致: 先输出 stdin 内容的 sha1，再按顺序输出各个文件的 sha1
+    content = sys.stdin.buffer.read() if stdin else None
+    if not write:
+        # 只计算 sha1 时不需要仓库
+        with stdout_writer() as out:
+            if content is not None:
+                out.write(f"{hash_object(object_type, content)}\n".encode())
+            write_hashes(hash_files(paths, object_type, jobs=jobs), out)
+        return
+
+    repo = get_repository()
+    with ObjectDatabase(repo.objects_dir) as odb, LooseObjectWriter(odb, fsync=fsync) as writer, \
+            stdout_writer() as out:
+        if content is not None:
+            out.write(f"{writer.write(object_type, content)}\n".encode())
+        write_hashes(hash_files(paths, object_type, writer, jobs), out)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', type=str, nargs='*', help="files to hash")
+    parser.add_argument('-t', dest='object_type', choices=OBJECT_TYPES, default='blob', help="type of the object (default: blob)")
+    parser.add_argument('-w', action='store_true', dest='write', help="write the objects into the object database")
+    parser.add_argument('--stdin', action='store_true', help="read the object from stdin")
+    parser.add_argument('--stdin-paths', action='store_true', help="read file names from stdin, one per line")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="number of processes for hashing and compressing files")
+    parser.add_argument('--no-fsync', action='store_false', dest='fsync', help="do not fsync written objects")
+    args = parser.parse_args()
+    if args.stdin and args.stdin_paths:
+        parser.error("--stdin and --stdin-paths are incompatible")
+    if args.stdin_paths and args.files:
+        parser.error("--stdin-paths does not take file arguments")
+
+    paths = args.files
+    if args.stdin_paths:
+        paths = [line for line in sys.stdin.read().splitlines() if line]
+    with exit_on_broken_pipe():
+        hash_objects(paths, args.object_type, args.stdin, args.write, args.jobs, args.fsync)
@@ -0,0 +1,52 @@
+import argparse
+from binascii import hexlify
+from typing import Dict, List
+
+from tig.core.object_database import ObjectDatabase
+from tig.core.output import exit_on_broken_pipe, stdout_writer, write_lines
+from tig.core.refs import RefStore
+from tig.core.repository import Repository, get_repository
+from tig.core.revision import resolve_revision
+from tig.core.tree import TreeWalker, object_type_of_mode, peel_to_tree
+
+# mode -> 输出中的 "<mode> <type>"，mode 补齐为 6 位 (tree 中 tree 的 mode 存储为 40000)
+_mode_prefixes: Dict[bytes, bytes] = {}
+
+
+def format_mode(mode) -> bytes:
+    prefix = _mode_prefixes.get(mode)
+    if prefix is None:
+        mode = bytes(mode)
+        prefix = _mode_prefixes[mode] = b'%06o %s' % (int(mode, 8), object_type_of_mode(mode).encode())
+    return prefix
+
+
+def ls_tree(repo: Repository, tree_ishes: List[str], recursive: bool = False, show_trees: bool = False,
+            name_only: bool = False):
+    with RefStore(repo.git_dir, repo.common_dir) as refs, ObjectDatabase(repo.objects_dir) as odb, stdout_writer() as out:
+        # 多个版本共用一个 TreeWalker，相同的子树只展开一次
+        walker = TreeWalker(odb)
+        for tree_ish in tree_ishes:
+            file_hash = resolve_revision(refs, tree_ish)
+            assert file_hash is not None, f"Not a valid object name: {tree_ish}"
+            tree_hash = peel_to_tree(odb, file_hash)
+            assert tree_hash is not None, f"Not a tree object: {tree_ish}"
+
+            entries = walker.walk(bytes.fromhex(tree_hash), recursive, show_trees)
+            if name_only:
+                write_lines(out, (path + b'\n' for _, path, _ in entries))
+            else:
+                write_lines(out, (b'%s %s\t%s\n' % (format_mode(mode), hexlify(sha1), path) for mode, path, sha1 in entries))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('tree_ish', type=str, nargs='+', help="one or more trees, commits or tags to list")
+    parser.add_argument('-r', action='store_true', dest='recursive', help="recurse into subtrees")
+    parser.add_argument('-t', action='store_true', dest='show_trees', help="show tree entries even when recursing")
+    parser.add_argument('--name-only', action='store_true', help="list only file names")
+    args = parser.parse_args()
+
+    repo = get_repository()
+    with exit_on_broken_pipe():
+        ls_tree(repo, args.tree_ish, args.recursive, args.show_trees, args.name_only)
@@ -0,0 +1,61 @@
+import argparse
+import sys
+
+from tig.core.commit_graph import CommitGraph
+from tig.core.object_database import ObjectDatabase
+from tig.core.refs import RefStore
+from tig.core.repository import Repository, get_repository
+from tig.core.revision import Commit, CommitCache, is_ancestor, merge_bases, peel_to_commit, resolve_revision
+
+
+def find_commit(refs: RefStore, cache: CommitCache, name: str) -> Commit:
+    # 与 rev-list 一样接受 sha1、ref 名和标签; 不在 commit-graph 中的提交 (graph 写入之后的提交) 从对象中解析
+    file_hash = resolve_revision(refs, name)
+    commit_hash = peel_to_commit(cache.odb, file_hash) if file_hash is not None else None
+    if commit_hash is None:
+        print(f"fatal: Not a valid object name {name}", file=sys.stderr)
+        sys.exit(128)
+    return cache.lookup(bytes.fromhex(commit_hash))
+
+
+def merge_base(repo: Repository, one: str, two: str, show_all: bool = False):
+    graph = CommitGraph.load(repo.objects_dir)
+    try:
+        with RefStore(repo.git_dir, repo.common_dir) as refs, ObjectDatabase(repo.objects_dir) as odb:
+            cache = CommitCache(odb, graph)
+            bases = merge_bases(cache, find_commit(refs, cache, one), find_commit(refs, cache, two))
+        if not show_all:
+            bases = bases[:1]
+        for commit in bases:
+            print(commit.sha1.hex())
+        return bool(bases)
+    finally:
+        if graph is not None:
+            graph.close()
+
+
+def merge_base_is_ancestor(repo: Repository, ancestor: str, descendant: str) -> bool:
+    graph = CommitGraph.load(repo.objects_dir)
+    try:
+        with RefStore(repo.git_dir, repo.common_dir) as refs, ObjectDatabase(repo.objects_dir) as odb:
+            cache = CommitCache(odb, graph)
+            return is_ancestor(cache, find_commit(refs, cache, ancestor), find_commit(refs, cache, descendant))
+    finally:
+        if graph is not None:
+            graph.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('commits', type=str, nargs=2)
+    mode_group = parser.add_mutually_exclusive_group()
+    mode_group.add_argument('-a', '--all', action='store_true', help="output all merge bases")
+    mode_group.add_argument('--is-ancestor', action='store_true', help="exit with 0 if the first commit is an ancestor of the second")
+    args = parser.parse_args()
+
+    repo = get_repository()
+    if args.is_ancestor:
+        found = merge_base_is_ancestor(repo, *args.commits)
+    else:
+        found = merge_base(repo, *args.commits, show_all=args.all)
+    sys.exit(0 if found else 1)
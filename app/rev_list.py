@@ -0,0 +1,128 @@
+import argparse
+from binascii import hexlify
+from itertools import islice
+from typing import List, Optional, Tuple
+
+from tig.core.bitmap import BitmapIndex, PackBitmap
+from tig.core.commit_graph import CommitGraph
+from tig.core.object_database import ObjectDatabase
+from tig.core.output import exit_on_broken_pipe, stdout_writer, write_lines
+from tig.core.refs import RefStore
+from tig.core.repository import Repository, get_repository
+from tig.core.revision import CommitCache, RevisionWalker, peel_to_commit, resolve_revision, traverse_objects
+
+def parse_revisions(revisions: List[str]) -> List[Tuple[str, bool]]:
+    # A..B 等价于 ^A B，省略的一端为 HEAD
+    result = []
+    for revision in revisions:
+        if '..' in revision:
+            one, two = revision.split('..', 1)
+            result.append((one or 'HEAD', True))
+            result.append((two or 'HEAD', False))
+        elif revision.startswith('^'):
+            result.append((revision[1:], True))
+        else:
+            result.append((revision, False))
+    return result
+
+
+def rev_list_bitmap(odb: ObjectDatabase, bitmap: PackBitmap, starts: List[Tuple[str, str, bool]],
+                    objects: bool = False, count_only: bool = False):
+    # 可达集合 = 起点位图的 OR 去掉排除点位图的 OR，不需要逐个遍历提交
+    index = BitmapIndex(bitmap, odb)
+    wants = index.reachable(bytes.fromhex(file_hash) for _, file_hash, exclude in starts if not exclude)
+    haves = [bytes.fromhex(file_hash) for _, file_hash, exclude in starts if exclude]
+    if haves:
+        wants = wants.and_not(index.reachable(haves))
+
+    type_names = PackBitmap.TYPE_NAMES if objects else ('commit',)
+    if count_only:
+        total = wants.count() if objects else (wants & index.type_bitmap('commit')).count()
+        print(total)
+        return
+
+    with stdout_writer() as out:
+        write_lines(out, (hexlify(sha1) + b'\n' for sha1 in index.iter_objects(wants, type_names)))
+
+
+def rev_list(repo: Repository, revisions: List[str], all_refs: bool = False, count_only: bool = False,
+             max_count: Optional[int] = None, first_parent: bool = False,
+             objects: bool = False, use_bitmap_index: bool = False):
+    with RefStore(repo.git_dir, repo.common_dir) as refs:
+        starts = []
+        for name, exclude in parse_revisions(revisions):
+            file_hash = resolve_revision(refs, name)
+            assert file_hash is not None, f"Bad revision: {name}"
+            starts.append((name, file_hash, exclude))
+        if all_refs:
+            starts.extend((name, file_hash, False) for name, file_hash, _ in refs.iter_refs())
+            head = refs.resolve('HEAD')
+            if head is not None:
+                starts.append(('HEAD', head, False))
+
+    if use_bitmap_index and max_count is None and not first_parent:
+        bitmap = PackBitmap.load(repo.objects_dir / 'pack')
+        if bitmap is not None:
+            with bitmap, ObjectDatabase(repo.objects_dir) as odb:
+                rev_list_bitmap(odb, bitmap, starts, objects, count_only)
+            return
+
+    graph = CommitGraph.load(repo.objects_dir)
+    try:
+        with ObjectDatabase(repo.objects_dir) as odb:
+            cache = CommitCache(odb, graph)
+            walker = RevisionWalker(cache, first_parent)
+            tags, excluded_tags = [], []
+            for name, file_hash, exclude in starts:
+                # --objects 时还要输出起点中的附注标签，被排除的标签不输出
+                commit_hash = peel_to_commit(odb, file_hash, (excluded_tags if exclude else tags) if objects else None)
+                if commit_hash is None:
+                    # --all 中指向 tree/blob 的标签直接忽略
+                    assert all_refs, f"Not a commit: {name}"
+                    continue
+                walker.add(cache.lookup(bytes.fromhex(commit_hash)), exclude)
+
+            commits = iter(walker)
+            if max_count is not None:
+                commits = islice(commits, max_count)
+
+            if objects:
+                # 没有 pack bitmap 时逐个展开提交的 tree，输出与 git 相同: tree、blob 和标签后面跟着路径或标签名
+                excluded = {sha1 for sha1, _ in excluded_tags}
+                entries = traverse_objects(cache, commits, [tag for tag in tags if tag[0] not in excluded])
+                if count_only:
+                    print(sum(1 for _ in entries))
+                    return
+                with stdout_writer() as out:
+                    write_lines(out, (hexlify(sha1) + b'\n' if name is None else b'%s %s\n' % (hexlify(sha1), name)
+                                      for sha1, name in entries))
+                return
+
+            if count_only:
+                print(sum(1 for _ in commits))
+                return
+
+            with stdout_writer() as out:
+                write_lines(out, (hexlify(commit.sha1) + b'\n' for commit in commits))
+    finally:
+        if graph is not None:
+            graph.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('revisions', type=str, nargs='*', help="commits to start from, ^A to exclude, A..B for ranges")
+    parser.add_argument('--all', action='store_true', help="start from all refs followed by HEAD")
+    parser.add_argument('--count', action='store_true', help="print the number of commits instead of listing them")
+    parser.add_argument('-n', '--max-count', type=int, default=None, help="limit the number of commits to output")
+    parser.add_argument('--first-parent', action='store_true', help="follow only the first parent of merge commits")
+    parser.add_argument('--objects', action='store_true', help="list all reachable objects, not only commits")
+    parser.add_argument('--use-bitmap-index', action='store_true', help="answer from the pack bitmap when there is one")
+    args = parser.parse_args()
+    if not args.revisions and not args.all:
+        parser.error("at least one revision or --all is required")
+
+    repo = get_repository()
+    with exit_on_broken_pipe():
+        rev_list(repo, args.revisions, args.all, args.count, args.max_count, args.first_parent,
+                 args.objects, args.use_bitmap_index)
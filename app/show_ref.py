@@ -1,80 +1,150 @@
-from pathlib import Path
+import argparse
+from fnmatch import fnmatchcase
+from itertools import chain
+import sys
+from typing import BinaryIO, Iterator, List, Optional, TextIO
 
-from tig.core.repository import get_repo_root
+from tig.core.object_database import ObjectDatabase
+from tig.core.output import exit_on_broken_pipe, stdout_writer, write_lines
+from tig.core.refs import Ref, RefStore
+from tig.core.repository import Repository, get_repository
 
 
-def get_packed_refs_info(repo_path: Path):
-    dot_git_path = repo_path / '.git'
-    assert dot_git_path.exists()
-    packed_refs_path = dot_git_path / 'packed-refs'
-    if not packed_refs_path.exists():
-        return {}
+def _is_wildcard(pattern: str) -> bool:
+    return any(c in pattern for c in '*?[')
 
-    ref_table: dict[str, str] = {}
-    with open(packed_refs_path, 'r') as fp:
-        for line in fp.readlines():
-            line = line.strip()
-            if line.startswith('#'):
+
+def match_pattern(name: str, pattern: str) -> bool:
+    # 与 git show-ref 一致: 模式与名称的末尾若干段相同，"main" 匹配 refs/heads/main 和 refs/remotes/origin/main;
+    # 含通配符的模式按 fnmatch 匹配完整名称
+    if _is_wildcard(pattern):
+        return fnmatchcase(name, pattern)
+    return name == pattern or name.endswith('/' + pattern)
+
+
+def scan_prefixes(bases: List[str], patterns: List[str]) -> List[str]:
+    """需要扫描的名称前缀，互不包含且按顺序排列，依次扫描得到的就是有序的结果。
+    所有模式都以 refs/ 开头时只扫描模式的字面前缀，否则要扫描 bases 下的全部 ref"""
+    prefixes = bases
+    if patterns and all(pattern.startswith('refs/') for pattern in patterns):
+        prefixes = []
+        for pattern in patterns:
+            literal = pattern
+            if _is_wildcard(pattern):
+                literal = pattern[:min(pattern.find(c) for c in '*?[' if c in pattern)]
+            for base in bases:
+                # 取两个前缀中较长的一个，没有交集时跳过
+                if literal.startswith(base):
+                    prefixes.append(literal)
+                elif base.startswith(literal):
+                    prefixes.append(base)
+    prefixes = sorted(set(prefixes))
+    return [prefix for k, prefix in enumerate(prefixes) if not any(prefix.startswith(other) for other in prefixes[:k])]
+
+
+def iter_matching_refs(refs: RefStore, bases: List[str], patterns: List[str]) -> Iterator[Ref]:
+    for prefix in scan_prefixes(bases, patterns):
+        for ref in refs.iter_refs(prefix):
+            if not patterns or any(match_pattern(ref[0], pattern) for pattern in patterns):
+                yield ref
+
+
+def peel_tag(odb: ObjectDatabase, file_hash: str) -> str:
+    # 沿附注标签链找到第一个不是标签的对象，不是标签时返回自身
+    while True:
+        info = odb.info(file_hash)
+        if info is None or info[0] != 'tag':
+            return file_hash
+        content = odb.read(file_hash)[1]
+        assert content.startswith(b'object '), f"Bad tag object: {file_hash}"
+        file_hash = content[7:47].decode()
+
+
+def write_refs(refs: RefStore, odb: ObjectDatabase, out: BinaryIO, err: TextIO, patterns: Optional[List[str]] = None,
+               heads: bool = False, tags: bool = False, show_head: bool = False, verify: bool = False,
+               hash_only: Optional[int] = None, dereference: bool = False, quiet: bool = False) -> int:
+    """输出匹配的 ref，返回退出码: 0 有匹配，1 没有匹配，128 --verify 的名称不存在"""
+    patterns = patterns or []
+    if verify:
+        # 只接受完整的 ref 名称，每个都是一次二分查找
+        found = []
+        for pattern in patterns:
+            sha1 = refs.resolve(pattern) if pattern == 'HEAD' or pattern.startswith('refs/') else None
+            if sha1 is None:
+                if quiet:
+                    return 1
+                err.write(f"fatal: '{pattern}' - not a valid ref\n")
+                return 128
+            found.append((pattern, sha1, refs.peeled(pattern)))
+        matched = iter(found)
+    else:
+        bases = [prefix for prefix, wanted in (('refs/heads/', heads), ('refs/tags/', tags)) if wanted] or ['refs/']
+        matched = iter_matching_refs(refs, bases, patterns)
+        if show_head:
+            head = refs.resolve('HEAD')
+            if head is not None:
+                matched = chain([('HEAD', head, refs.peeled('HEAD'))], matched)
+
+    any_matched = False
+
+    def lines() -> Iterator[bytes]:
+        nonlocal any_matched
+        for name, sha1, peeled in matched:
+            any_matched = True
+            if quiet:
                 continue
-            elif line.startswith('^'):
-                ...
-            else:
-                sha1 = line.split(' ')[0]
-                rel_path_str = line.split(' ')[1]
-                ref_table[rel_path_str] = sha1
-
-    return ref_table
-
-
-def collect_refs_info(dir: Path) -> list:
-    if not dir.exists():
-        return []
-    
-    refs = []
-    for file in dir.glob('*'):
-        if file.is_file():
-            with open(file, 'r') as fp:
-                data = fp.read().strip()
-            refs.append((data, file))
-    return refs
-
-
-def show_ref(repo_path: Path, ref_table: dict[str, str] = {}):
-    dot_git_path = repo_path / '.git'
-    assert dot_git_path.exists()
-    refs_dir = dot_git_path / 'refs'
-
-    # 收集ref信息
-    refs = []
-    refs.extend(collect_refs_info(refs_dir / 'heads'))
-    refs.extend(collect_refs_info(refs_dir / 'tags'))
-
-    for sub_dir in (refs_dir / 'remotes').glob('*'):
-        if sub_dir.is_dir():
-            refs.extend(collect_refs_info(sub_dir))
-
-    # 构建ref表，解决 'ref: xxx' 的情况
-    ref_table: dict[str, str] = ref_table # rel_path_str, hash
-    to_parse_ref: dict[str, str] = {} # ref: xxx, hash -> rel_path_str
-    for item in refs:
-        sha1: str = item[0]
-        fpath: Path = item[1]
-        if sha1.startswith('ref: '):
-            to_parse_ref[sha1.removeprefix('ref: ')] = str(fpath.absolute().relative_to(dot_git_path))
-        else:
-            ref_table[str(fpath.absolute().relative_to(dot_git_path))] = sha1
-    
-    for sha1, rel_path_str in to_parse_ref.items():
-        if sha1 in ref_table:
-            ref_table[rel_path_str] = ref_table[sha1]
-        else:
-            ref_table[rel_path_str] = sha1
-
-    for rel_path_str, sha1 in sorted(ref_table.items(), key=lambda x: x[0]):
-        print(f"{sha1:40} {rel_path_str}")
+            yield f"{sha1[:hash_only]}\n".encode() if hash_only is not None else f"{sha1} {name}\n".encode()
+            if dereference:
+                if peeled is None:
+                    # 松散 ref 没有记录剥离后的值，需要读取对象
+                    peeled = peel_tag(odb, sha1)
+                if peeled != sha1:
+                    # 与 git 一致，--hash 时剥离后的一行也带名称
+                    yield f"{peeled[:hash_only]} {name}^{{}}\n".encode()
+
+    write_lines(out, lines())
+    return 0 if any_matched else 1
+
+
+def show_ref(repo: Repository, patterns: Optional[List[str]] = None, heads: bool = False, tags: bool = False,
+             show_head: bool = False, verify: bool = False, hash_only: Optional[int] = None,
+             dereference: bool = False, quiet: bool = False) -> int:
+    # ObjectDatabase 只在 -d 需要读取标签对象时才打开 pack
+    with RefStore(repo.git_dir, repo.common_dir) as refs, ObjectDatabase(repo.objects_dir) as odb, \
+            stdout_writer() as out:
+        return write_refs(refs, odb, out, sys.stderr, patterns, heads, tags, show_head, verify,
+                          hash_only, dereference, quiet)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    # --hash 的长度只支持 "--hash=<n>" 的写法，否则 "-s main" 中的 main 会被当成长度
+    argv = list(sys.argv[1:] if argv is None else argv)
+    hash_length = 40
+    for k, arg in enumerate(argv):
+        if arg.startswith('--hash='):
+            hash_length = min(max(int(arg[7:]), 4), 40)
+            argv[k] = '--hash'
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('patterns', type=str, nargs='*', help="show only refs matching these patterns")
+    parser.add_argument('--heads', action='store_true', help="only show refs under refs/heads")
+    parser.add_argument('--tags', action='store_true', help="only show refs under refs/tags")
+    parser.add_argument('--head', action='store_true', dest='show_head', help="show HEAD as well")
+    parser.add_argument('--verify', action='store_true', help="look up the given full ref names exactly")
+    parser.add_argument('-s', '--hash', action='store_true', help="only show the object names, --hash=<n> abbreviates them to n characters")
+    parser.add_argument('-d', '--dereference', action='store_true', help="also show the objects annotated tags point to")
+    parser.add_argument('-q', '--quiet', action='store_true', help="do not print anything, only set the exit status")
+    args = parser.parse_args(argv)
+    if args.verify and not args.patterns:
+        parser.error("--verify requires a reference")
+    args.hash_only = hash_length if args.hash else None
+    return args
 
 
 def main():
-    repo_root = get_repo_root()
-    ref_table = get_packed_refs_info(repo_root)
-    show_ref(repo_root, ref_table)
+    args = parse_args()
+    repo = get_repository()
+    with exit_on_broken_pipe():
+        status = show_ref(repo, args.patterns, args.heads, args.tags, args.show_head, args.verify,
+                          args.hash_only, args.dereference, args.quiet)
+    sys.exit(status)
@@ -1,118 +1,301 @@
 import argparse
-from dataclasses import dataclass
+from array import array
+from binascii import hexlify
+import bisect
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 import hashlib
+import mmap
+import os
 from pathlib import Path
 import struct
-from typing import List
-
-@dataclass
-class PackIndexEntry:
-    sha1: bytes
-    crc32: int
-    offset: int
-
-    def __repr__(self):
-        return f"{self.sha1.hex()} {self.offset}"
-
-
-class GitPackIndex:
-    """Git version 2"""
-
-    IDX_SIGNATURE = b'\xff\x74\x4f\x63' # b'\xfftOc'
-    IDX_VERSION = 2
-
-    def __init__(self, idx_file: Path):
-        self.idx_file = idx_file
-        self.entries: List[PackIndexEntry] = []
-        self.fanout_table = []
-
-    def parse(self):
-        with open(self.idx_file, 'rb') as f:
-            data = f.read()
-        
-        # 1. 解析头部 (8 Byets)
-        pos = 0
-        signature = data[pos:pos+4]
-        pos += 4
-        version = struct.unpack('>I', data[pos:pos+4])[0]
-        pos += 4
-
-        assert signature == self.IDX_SIGNATURE
-        assert version == self.IDX_VERSION
-
-        # 2. 解析 Fan-out 表 (256个uint32)
-        self.fanout_table = []
-        for i in range(256):
-            count = struct.unpack('>I', data[pos:pos+4])[0]
-            self.fanout_table.append(count)
-            pos += 4
-        
-        # 对象总数 = fanout_table 的最后一项
-        total_objects = self.fanout_table[-1]
-        print(f"Object counts: {total_objects}")
-
-        # 3. 解析SHA-1列表 (20 Bytes * total_objects)
-        sha1_list = []
-        for _ in range(total_objects):
-            sha1 = data[pos:pos+20]
-            sha1_list.append(sha1)
-            pos += 20
-        
-        # 4. 解析CRC32列表(4 Bytes * total_objects)
-        crc32_list = []
-        for _ in range(total_objects):
-            crc32 = struct.unpack('>I', data[pos:pos+4])[0]
-            crc32_list.append(crc32)
-            pos += 4
-
-        # 5. 解析偏移量列表 (4 Bytes / 8 Bytes(large offset) * n)
-        offsets = []
-        for _ in range(total_objects):
-            # 先读取4B的偏移
-            offset = struct.unpack('>I', data[pos:pos+4])[0]
-            pos += 4
-
-            if offset & 0x80000000:
-                # 清除高位标志, 读取后4B
-                offset = offset & 0x7fffffff
-                offset_high = struct.unpack('>I', data[pos:pos+4])[0]
-                pos += 4
-                offset = (offset << 32) | offset_high
-            
-            offsets.append(offset)
-
-        # 6. TODO: 验证pack文件的SHA-1
-        self.packfile_sha1 = data[pos:pos+20]
-        pos += 20
-
-        # 7. 验证idx文件的SHA-1
-        expected_idx_sha1 = data[pos:pos+20]
-        actual_idx_sha1 = hashlib.sha1(data[:-20]).digest()
-        assert expected_idx_sha1 == actual_idx_sha1, f"idx file SHA-1 does not match, the file may be broken!"
-
-        # 构建pack index entry列表
-        self.entries = [
-            PackIndexEntry(sha1, crc32, offset)
-            for sha1, crc32, offset in zip(sha1_list, crc32_list, offsets)
-        ]
-
-    def print(self):
-        for entry in sorted(self.entries, key=lambda e: e.offset):
-            print(entry)        
-
-
-def verfiy_pack(idx_file: Path):
+from typing import BinaryIO, Iterator, List, Optional
+import zlib
+
+from tig.core.midx import MultiPackIndex
+from tig.core.output import exit_on_broken_pipe, stdout_writer, write_lines
+from tig.core.pack import GitPack, GitPackIndex
+
+VERIFY_CHUNK_SIZE = 1 << 20
+
+
+def _sha1_file(path: Path, end: int, chunk_size: int = VERIFY_CHUNK_SIZE) -> bytes:
+    # 分块流式计算文件前 end 字节的 SHA-1，内存占用与文件大小无关
+    h = hashlib.sha1()
+    with open(path, 'rb') as fp:
+        remaining = end
+        while remaining > 0:
+            chunk = fp.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            h.update(chunk)
+            remaining -= len(chunk)
+    return h.digest()
+
+
+def _crc32_range(pack_file: Path, starts: array, ends: array, crcs: array) -> List[int]:
+    # 在子进程中运行: 计算一段连续对象 [start, end) 的 CRC32，返回不匹配对象的偏移
+    bad = []
+    with open(pack_file, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for start, end, expected in zip(starts, ends, crcs):
+            crc = 0
+            for pos in range(start, end, VERIFY_CHUNK_SIZE):
+                crc = zlib.crc32(data[pos:min(pos + VERIFY_CHUNK_SIZE, end)], crc)
+            if crc != expected:
+                bad.append(start)
+    return bad
+
+
+def _check_pack_header(pack_index: GitPackIndex, pack_file: Path, header: bytes) -> List[str]:
+    assert header[0:4] == GitPack.PACK_SIGNATURE, f"Not a pack file: {pack_file}"
+    n_objects = struct.unpack('>I', header[8:12])[0]
+    if n_objects != pack_index.total_objects:
+        return [f"pack has {n_objects} objects, but idx has {pack_index.total_objects}"]
+    return []
+
+
+def _check_pack_checksum(pack_index: GitPackIndex, actual_sha1: bytes, trailer: bytes) -> List[str]:
+    errors = []
+    if actual_sha1 != trailer:
+        errors.append(f"pack checksum mismatch: {actual_sha1.hex()} != {trailer.hex()}")
+    if actual_sha1 != pack_index.packfile_sha1:
+        errors.append(f"pack checksum does not match idx: {actual_sha1.hex()} != {pack_index.packfile_sha1.hex()}")
+    return errors
+
+
+def verify_pack_data(pack_index: GitPackIndex, pack_file: Path, jobs: Optional[int] = None) -> List[str]:
+    """校验 pack 文件的 SHA-1 以及每个对象的 CRC32，返回错误信息列表"""
+    pack_size = pack_file.stat().st_size
+    with open(pack_file, 'rb') as fp:
+        header = fp.read(12)
+        fp.seek(pack_size - 20)
+        trailer = fp.read(20)
+    errors = _check_pack_header(pack_index, pack_file, header)
+
+    # 1. 按偏移排序，对象 i 的压缩数据范围为 [offset_i, offset_{i+1})，最后一个对象到 trailer 为止
+    offsets = pack_index.offsets()
+    order = pack_index.offset_order(offsets)
+    starts = array('Q', (offsets[i] for i in order))
+    ends = array('Q', starts[1:])
+    ends.append(pack_size - 20)
+    crcs = array('I', (pack_index.crc32_at(i) for i in order))
+
+    # 2. 按字节数把对象切分成若干连续区间，分发到进程池
+    jobs = jobs or os.cpu_count() or 1
+    target = max((pack_size - 32) // (jobs * 4), VERIFY_CHUNK_SIZE)
+    ranges = []
+    lo = 0
+    for hi in range(1, len(starts) + 1):
+        if hi == len(starts) or ends[hi - 1] - starts[lo] >= target:
+            ranges.append((lo, hi))
+            lo = hi
+
+    bad_offsets = []
+    if jobs == 1:
+        for lo, hi in ranges:
+            bad_offsets.extend(_crc32_range(pack_file, starts[lo:hi], ends[lo:hi], crcs[lo:hi]))
+        actual_sha1 = _sha1_file(pack_file, pack_size - 20)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [
+                pool.submit(_crc32_range, pack_file, starts[lo:hi], ends[lo:hi], crcs[lo:hi])
+                for lo, hi in ranges
+            ]
+            # CRC 在子进程中计算的同时，主进程流式计算整个 pack 的 SHA-1
+            actual_sha1 = _sha1_file(pack_file, pack_size - 20)
+            for future in futures:
+                bad_offsets.extend(future.result())
+
+    # 3. 汇总结果
+    errors.extend(_check_pack_checksum(pack_index, actual_sha1, trailer))
+    for offset in bad_offsets:
+        errors.append(f"CRC32 mismatch for object at offset {offset}")
+    return errors
+
+
+def verify_pack_verbose(pack_index: GitPackIndex, pack_file: Path, out: BinaryIO) -> List[str]:
+    """类似 git verify-pack -v: 按偏移顺序对 pack 做一次顺序扫描，同时解析对象头部、计算每个对象的 CRC32
+    和整个 pack 的 SHA-1，输出类型、大小、delta 深度和 base，不解压任何对象。返回错误信息列表"""
+    offsets = pack_index.offsets()
+    order = pack_index.offset_order(offsets)
+    starts = array('Q', (offsets[i] for i in order))
+    n = len(order)
+    pack_end = pack_file.stat().st_size - 20
+    # 与 git verify-pack -v 一致，类型名左对齐到 6 个字符
+    type_names = {obj_type: name.encode().ljust(6) for obj_type, name in GitPack.TYPE_NAMES.items()}
+
+    # 按偏移顺序下标 k 记录对象的大小、delta base 的下标、最终类型和 delta 深度;
+    # 类型 0 表示尚未确定 (base 位于更后面的 REF_DELTA)
+    sizes = array('Q', bytes(8 * n))
+    bases = array('q', [-1]) * n
+    types = bytearray(n)
+    depths = array('I', bytes(4 * n))
+
+    def format_line(k: int) -> bytes:
+        end = starts[k + 1] if k + 1 < n else pack_end
+        delta_info = b''
+        if bases[k] >= 0:
+            delta_info = b' %d %s' % (depths[k], hexlify(pack_index.sha1_at(order[bases[k]])))
+        return b'%s %s %d %d %d%s\n' % (hexlify(pack_index.sha1_at(order[k])), type_names[types[k]], sizes[k],
+                                         end - starts[k], starts[k], delta_info)
+
+    with GitPack(pack_file, pack_index) as pack:
+        data = pack._data
+        errors = _check_pack_header(pack_index, pack_file, data[0:12])
+        h = hashlib.sha1(data[0:starts[0] if n else pack_end])
+
+        def base_of(k: int, obj_type: int, pos: int) -> int:
+            if obj_type == GitPack.OBJ_OFS_DELTA:
+                base_offset, _ = pack._read_ofs_delta_offset(starts[k], pos)
+            else:
+                base_i = pack_index.find_index(data[pos:pos+20])
+                assert base_i >= 0, f"Cannot find delta base of object at {starts[k]}"
+                base_offset = pack_index.offset_at(base_i)
+            return bisect.bisect_left(starts, base_offset)
+
+        def lines() -> Iterator[bytes]:
+            emitted = 0
+            for k in range(n):
+                # 对象的字节只读取一次: 同一块数据既更新 CRC32 也更新整个 pack 的 SHA-1
+                start = starts[k]
+                end = starts[k + 1] if k + 1 < n else pack_end
+                crc = 0
+                for pos in range(start, end, VERIFY_CHUNK_SIZE):
+                    chunk = data[pos:min(pos + VERIFY_CHUNK_SIZE, end)]
+                    crc = zlib.crc32(chunk, crc)
+                    h.update(chunk)
+                if crc != pack_index.crc32_at(order[k]):
+                    errors.append(f"CRC32 mismatch for object at offset {start}")
+
+                obj_type, sizes[k], pos = pack._read_object_header(start)
+                if obj_type >= GitPack.OBJ_OFS_DELTA:
+                    base = bases[k] = base_of(k, obj_type, pos)
+                    # OFS_DELTA 的 base 总在前面，已经确定; REF_DELTA 的 base 在后面时留到扫描结束
+                    if base < k and types[base]:
+                        types[k] = types[base]
+                        depths[k] = depths[base] + 1
+                else:
+                    types[k] = obj_type
+
+                # 按偏移顺序输出，遇到尚未确定的对象时暂缓
+                while emitted <= k and types[emitted]:
+                    yield format_line(emitted)
+                    emitted += 1
+
+            # 剩下的对象只需沿着内存中记录的 base 下标补齐，不再读取 pack
+            for k in range(emitted, n):
+                chain = []
+                j = k
+                while not types[j]:
+                    chain.append(j)
+                    j = bases[j]
+                for c in reversed(chain):
+                    types[c] = types[j]
+                    depths[c] = depths[j] + 1
+                    j = c
+                yield format_line(k)
+
+        write_lines(out, lines())
+        errors.extend(_check_pack_checksum(pack_index, h.digest(), data[pack_end:pack_end+20]))
+
+    def objects(count: int) -> bytes:
+        return b'%d object' % count if count == 1 else b'%d objects' % count
+
+    chain_lengths = Counter(depths)
+    if chain_lengths[0]:
+        out.write(b'non delta: %s\n' % objects(chain_lengths[0]))
+    for depth in sorted(chain_lengths):
+        if depth > 0:
+            out.write(b'chain length = %d: %s\n' % (depth, objects(chain_lengths[depth])))
+    return errors
+
+
+def verify_midx_data(midx: MultiPackIndex) -> List[str]:
+    """检查 multi-pack-index 与各个 pack idx 的一致性，返回错误信息列表"""
+    errors = []
+    pack_dir = midx.midx_file.parent
+    pack_indexes: List[Optional[GitPackIndex]] = []
+    for name in midx.pack_names:
+        idx_file = pack_dir / name
+        if not idx_file.exists() or not idx_file.with_suffix('.pack').exists():
+            errors.append(f"pack {name} referenced by multi-pack-index does not exist")
+            pack_indexes.append(None)
+            continue
+        pack_index = GitPackIndex(idx_file)
+        pack_index.parse()
+        pack_indexes.append(pack_index)
+
+    # 1. midx 中的对象按 SHA-1 严格递增，且与所在 pack 的 idx 记录的偏移一致
+    prev_sha1 = b''
+    for sha1, pack_int_id, offset in midx:
+        if sha1 <= prev_sha1:
+            errors.append(f"multi-pack-index OIDs are out of order at {sha1.hex()}")
+        prev_sha1 = sha1
+        if pack_int_id >= len(pack_indexes):
+            errors.append(f"object {sha1.hex()} has bad pack id {pack_int_id}")
+            continue
+        pack_index = pack_indexes[pack_int_id]
+        if pack_index is None:
+            continue
+        i = pack_index.find_index(sha1)
+        if i < 0:
+            errors.append(f"object {sha1.hex()} is not in {midx.pack_names[pack_int_id]}")
+        elif pack_index.offset_at(i) != offset:
+            errors.append(f"object {sha1.hex()} offset mismatch: {offset} != {pack_index.offset_at(i)}")
+
+    # 2. 每个 pack idx 中的对象都能在 midx 中找到
+    for name, pack_index in zip(midx.pack_names, pack_indexes):
+        if pack_index is None:
+            continue
+        for i in range(pack_index.total_objects):
+            if midx.find_index(pack_index.sha1_at(i)) < 0:
+                errors.append(f"object {pack_index.sha1_at(i).hex()} in {name} is missing from multi-pack-index")
+        pack_index.close()
+    return errors
+
+
+def verify_midx(midx_file: Path):
+    assert midx_file.exists()
+
+    with MultiPackIndex(midx_file) as midx:
+        midx.verify()
+        print(f"Object counts: {midx.total_objects}")
+        print(f"Pack counts: {len(midx.pack_names)}")
+        errors = verify_midx_data(midx)
+    assert not errors, f"{midx_file}: bad\n" + '\n'.join(errors)
+    print(f"{midx_file}: ok")
+
+
+def verfiy_pack(idx_file: Path, jobs: Optional[int] = None, verbose: bool = False):
     assert idx_file.exists()
 
     pack_index = GitPackIndex(idx_file)
     pack_index.parse()
-    pack_index.print()
+    pack_index.verify()
+
+    pack_file = idx_file.with_suffix('.pack')
+    with stdout_writer() as out:
+        if verbose:
+            # -v 在同一次扫描中完成校验
+            errors = verify_pack_verbose(pack_index, pack_file, out)
+        else:
+            pack_index.print(out)
+    if not verbose:
+        errors = verify_pack_data(pack_index, pack_file, jobs)
+    assert not errors, f"{pack_file}: bad\n" + '\n'.join(errors)
+    print(f"{pack_file}: ok")
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('idx_file', type=Path)
+    parser.add_argument('idx_file', type=Path, help="pack .idx file, or objects/pack/multi-pack-index")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="number of processes for CRC32 verification (-v verifies in its single pass instead)")
+    parser.add_argument('-v', '--verbose', action='store_true', help="show type, size and delta chain of each object")
     args = parser.parse_args()
 
-    verfiy_pack(args.idx_file)
+    with exit_on_broken_pipe():
+        if args.idx_file.name == MultiPackIndex.FILE_NAME:
+            verify_midx(args.idx_file)
+        else:
+            verfiy_pack(args.idx_file, args.jobs, args.verbose)
 
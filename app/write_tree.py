@@ -0,0 +1,107 @@
+import argparse
+from bisect import bisect_left
+from typing import Dict, Optional
+
+from tig.core.index import CacheTree, GitIndex
+from tig.core.object_database import ObjectDatabase
+from tig.core.object_writer import LooseObjectWriter
+from tig.core.repository import Repository, get_repository
+
+CE_INTENT_TO_ADD = 0x2000 # 扩展 flags
+S_IFGITLINK = 0o160000
+MODE_FIELD = 6 # stat 字段中 ce_mode 的位置
+
+
+class TreeBuilder:
+    """由 index 的 entry 构建 tree 对象 (cache-tree.c 的 update_one)。
+    index 中的路径按字节序排列，一个目录下的 entry 是连续的一段，并且与 tree 中 entry 的顺序一致;
+    TREE 扩展中仍然有效、对象也存在的目录直接复用其 sha1，不再展开"""
+
+    def __init__(self, git_index: GitIndex, writer: LooseObjectWriter, missing_ok: bool = False):
+        self.git_index = git_index
+        self.writer = writer
+        self.missing_ok = missing_ok
+
+    def build(self, prefix: str = '') -> str:
+        paths = self.git_index.paths
+        base = prefix.strip('/').encode()
+        if base:
+            base += b'/'
+            lo = bisect_left(paths, base)
+            hi = bisect_left(paths, base[:-1] + b'0') # '0' 是 '/' 的下一个字符
+        else:
+            lo, hi = 0, len(paths)
+        cache_tree = self.git_index.cache_tree
+        node = cache_tree.find(prefix.strip('/')) if cache_tree is not None else None
+        sha1 = self._build(lo, hi, base, node)
+        assert sha1 is not None or not base, f"prefix {prefix} not found"
+        # 空的 index 写出空 tree
+        return (sha1 or bytes.fromhex(self.writer.write('tree', b''))).hex()
+
+    def _cached(self, node: Optional[CacheTree], count: int) -> Optional[bytes]:
+        # entry_count 为 -1 表示失效; entry 数不一致 (例如含有 intent-to-add 的 entry) 时也不复用
+        if node is None or node.entry_count != count or node.sha1 is None:
+            return None
+        if not self.writer.exists(node.sha1.hex()):
+            return None
+        return node.sha1
+
+    def _build(self, lo: int, hi: int, base: bytes, node: Optional[CacheTree]) -> Optional[bytes]:
+        # 返回 [lo, hi) 这段 entry 组成的 tree 的 sha1，目录中没有 entry 时返回 None
+        cached = self._cached(node, hi - lo)
+        if cached is not None:
+            return cached
+
+        git_index = self.git_index
+        paths, sha1s, flags, ext_flags = git_index.paths, git_index.sha1s, git_index.flags, git_index.ext_flags
+        children: Dict[str, CacheTree] = {child.name: child for child in node.children} if node is not None else {}
+        entries = []
+        k = lo
+        while k < hi:
+            name = paths[k][len(base):]
+            slash = name.find(b'/')
+            if slash >= 0:
+                # 子目录: 以 "<目录>/" 开头的一段 entry
+                dir_name = name[:slash]
+                end = bisect_left(paths, base + dir_name + b'0', k, hi)
+                sha1 = self._build(k, end, base + dir_name + b'/', children.get(dir_name.decode(errors='replace')))
+                if sha1 is not None:
+                    entries.append(b'40000 %s\x00%s' % (dir_name, sha1))
+                k = end
+                continue
+
+            stage = (flags[k] & GitIndex.CE_STAGEMASK) >> GitIndex.CE_STAGESHIFT
+            assert stage == 0, f"{paths[k].decode(errors='replace')}: unmerged (stage {stage}), cannot write a tree"
+            if ext_flags[k] & CE_INTENT_TO_ADD:
+                # intent-to-add 的 entry 还没有内容，不写入 tree
+                k += 1
+                continue
+            mode = git_index.stat_data[k*GitIndex.STAT_FIELDS+MODE_FIELD]
+            sha1 = sha1s[20*k:20*k+20]
+            if not self.missing_ok and mode != S_IFGITLINK:
+                assert self.writer.exists(sha1.hex()), f"invalid object {mode:o} {sha1.hex()} for '{paths[k].decode(errors='replace')}'"
+            entries.append(b'%o %s\x00%s' % (mode, name, sha1))
+            k += 1
+
+        if not entries:
+            return None
+        return bytes.fromhex(self.writer.write('tree', b''.join(entries)))
+
+
+def write_tree(repo: Repository, prefix: str = '', missing_ok: bool = False, fsync: bool = True) -> str:
+    git_index = GitIndex(repo.index_file)
+    if repo.index_file.exists():
+        git_index.parse()
+    with ObjectDatabase(repo.objects_dir) as odb, LooseObjectWriter(odb, fsync=fsync) as writer:
+        return TreeBuilder(git_index, writer, missing_ok).build(prefix)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--prefix', type=str, default='', help="write the tree object of this subdirectory")
+    parser.add_argument('--missing-ok', action='store_true', help="do not check that the objects in the index exist")
+    parser.add_argument('--no-fsync', action='store_false', dest='fsync', help="do not fsync written objects")
+    args = parser.parse_args()
+
+    repo = get_repository()
+    print(write_tree(repo, args.prefix, args.missing_ok, args.fsync))
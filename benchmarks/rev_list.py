@@ -0,0 +1,111 @@
+"""tig-rev-list 的基准测试: 用 git fast-import 生成一段合成历史，分别在没有辅助文件、有 commit-graph、
+有 pack bitmap 时计时。
+
+    pip install -e .
+    python benchmarks/rev_list.py --commits 200000 --dir /tmp/tig-bench
+
+历史的形状: 主线上每个提交修改 1000 个文件中的一个，每 100 个提交合并一次从 50 个提交之前分出的旁支提交。
+每条命令运行 --repeat 次取最短时间，并检查输出与 git 一致"""
+import argparse
+import os
+from pathlib import Path
+import shutil
+import subprocess
+import sys
+import time
+from typing import List, Tuple
+
+START_TIME = 1600000000
+NUM_FILES = 1000
+MERGE_INTERVAL = 100
+BRANCH_DISTANCE = 50
+
+
+def fast_import_stream(num_commits: int) -> bytes:
+    # mark 按创建顺序编号，主线提交 i 的 mark 记录在 main_marks 中
+    lines = []
+    main_marks = []
+    mark = 0
+
+    def commit(ref: str, message: str, path: str, parent: int = 0, merge: int = 0):
+        nonlocal mark
+        mark += 1
+        content = f"{message}\n".encode()
+        lines.append(b'commit %s\nmark :%d\n' % (ref.encode(), mark))
+        lines.append(b'committer Bench <bench@example.com> %d +0000\n' % (START_TIME + mark))
+        lines.append(b'data %d\n%s\n' % (len(message), message.encode()))
+        if parent:
+            lines.append(b'from :%d\n' % parent)
+        if merge:
+            lines.append(b'merge :%d\n' % merge)
+        lines.append(b'M 644 inline %s\ndata %d\n%s\n' % (path.encode(), len(content), content))
+        return mark
+
+    for i in range(num_commits):
+        path = f"dir{i % 10}/file{i % NUM_FILES}"
+        side = 0
+        if i % MERGE_INTERVAL == MERGE_INTERVAL - 1 and i >= BRANCH_DISTANCE:
+            side = commit('refs/heads/side', f"side {i}", f"side/file{i % NUM_FILES}", main_marks[i - BRANCH_DISTANCE])
+        main_marks.append(commit('refs/heads/main', f"main {i}", path, main_marks[-1] if main_marks else 0, side))
+    return b''.join(lines)
+
+
+def create_repository(path: Path, num_commits: int):
+    if path.exists():
+        shutil.rmtree(path)
+    subprocess.run(['git', 'init', '-q', '-b', 'main', str(path)], check=True)
+    subprocess.run(['git', 'fast-import', '--quiet'], cwd=path, input=fast_import_stream(num_commits), check=True)
+    subprocess.run(['git', 'repack', '-adq'], cwd=path, check=True)
+
+
+def best_time(command: List[str], cwd: Path, repeat: int) -> Tuple[float, bytes]:
+    best = float('inf')
+    output = b''
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.run(command, cwd=cwd, stdout=subprocess.PIPE, check=True).stdout
+        best = min(best, time.perf_counter() - start)
+    return best, output
+
+
+def compare(label: str, args: List[str], cwd: Path, repeat: int):
+    git_time, git_output = best_time(['git', 'rev-list'] + args, cwd, repeat)
+    tig_time, tig_output = best_time(['tig-rev-list'] + args, cwd, repeat)
+    assert tig_output == git_output, f"{label}: tig-rev-list {' '.join(args)} differs from git"
+    # 排除点的 sha1 只显示前 8 位
+    shown_args = ' '.join(arg[:8] if arg.startswith('^') else arg for arg in args)
+    print(f"{label:<16} {shown_args:<52} git {git_time:6.2f}s   tig {tig_time:6.2f}s", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--commits', type=int, default=200000, help="number of commits on the main line")
+    parser.add_argument('--dir', type=Path, default=Path('/tmp/tig-bench'), help="where to create the repository")
+    parser.add_argument('--repeat', type=int, default=3, help="run each command this many times and keep the best")
+    args = parser.parse_args()
+    assert shutil.which('tig-rev-list'), "tig-rev-list is not installed, run `pip install -e .` first"
+
+    print(f"creating {args.commits} commits in {args.dir}", file=sys.stderr)
+    create_repository(args.dir, args.commits)
+    git_version = subprocess.run(['git', 'version'], stdout=subprocess.PIPE, text=True, check=True).stdout.split()[-1]
+    print(f"python {sys.version.split()[0]}, git {git_version}, {os.cpu_count()} cpus")
+
+    # tig-rev-list 不解析 A~n，排除点直接用 sha1
+    base = subprocess.run(['git', 'rev-parse', f"main~{min(1000, args.commits - 1)}"], cwd=args.dir,
+                          stdout=subprocess.PIPE, text=True, check=True).stdout.strip()
+    compare('no commit-graph', ['--count', '--all'], args.dir, args.repeat)
+    compare('no commit-graph', [f"^{base}", 'main'], args.dir, args.repeat)
+
+    subprocess.run(['git', 'commit-graph', 'write', '--reachable'], cwd=args.dir, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    compare('commit-graph', ['--count', '--all'], args.dir, args.repeat)
+    compare('commit-graph', [f"^{base}", 'main'], args.dir, args.repeat)
+    compare('commit-graph', ['--count', '--objects', '--all'], args.dir, args.repeat)
+
+    subprocess.run(['git', 'repack', '-adbq'], cwd=args.dir, check=True)
+    compare('pack bitmap', ['--use-bitmap-index', '--count', '--objects', '--all'], args.dir, args.repeat)
+    compare('pack bitmap', ['--use-bitmap-index', '--count', '--objects', f"^{base}", 'main'], args.dir, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
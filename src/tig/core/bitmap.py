@@ -0,0 +1,473 @@
+from array import array
+import mmap
+from pathlib import Path
+import struct
+import sys
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from tig.core.object_database import ObjectDatabase
+from tig.core.pack import GitPackIndex
+from tig.core.tree import MODE_GITLINK, iter_tree_entries, object_type_of_mode
+
+WORD_BITS = 64
+ALL_ONES = (1 << WORD_BITS) - 1
+
+# 一个 run length word (RLW) 的布局: bit 0 为填充位，bit 1-32 为填充的字数，bit 33-63 为其后 literal 字的个数
+RLW_RUNNING_BITS = 32
+RLW_LITERAL_BITS = 31
+RLW_MAX_RUNNING_LENGTH = (1 << RLW_RUNNING_BITS) - 1
+RLW_MAX_LITERAL_WORDS = (1 << RLW_LITERAL_BITS) - 1
+
+# (填充位, 字数, literal 字) —— literal 为 None 时表示字数个全 0 或全 1 的字
+Segment = Tuple[int, int, Optional[array]]
+
+
+def _read_words(data, pos: int, count: int) -> array:
+    words = array('Q', data[pos:pos + 8 * count])
+    if sys.byteorder == 'little':
+        words.byteswap()
+    return words
+
+
+class _EWAHBuilder:
+    """按顺序追加填充字和 literal 字，生成规范的 EWAH 字序列 (全 0/全 1 的 literal 会被合并到填充中)"""
+
+    def __init__(self):
+        self.words = array('Q')
+        self._rlw = -1 # 当前 RLW 在 words 中的下标
+        self._running_bit = 0
+        self._running_length = 0
+        self._literal_words = 0
+
+    def _flush_rlw(self):
+        if self._rlw >= 0:
+            self.words[self._rlw] = (
+                self._running_bit
+                | self._running_length << 1
+                | self._literal_words << (1 + RLW_RUNNING_BITS)
+            )
+
+    def _new_rlw(self, running_bit: int = 0):
+        self._flush_rlw()
+        self._rlw = len(self.words)
+        self.words.append(0)
+        self._running_bit = running_bit
+        self._running_length = 0
+        self._literal_words = 0
+
+    def add_fill(self, bit: int, count: int):
+        while count:
+            if (self._rlw < 0 or self._literal_words
+                    or (self._running_length and self._running_bit != bit)
+                    or self._running_length == RLW_MAX_RUNNING_LENGTH):
+                self._new_rlw(bit)
+            self._running_bit = bit
+            n = min(count, RLW_MAX_RUNNING_LENGTH - self._running_length)
+            self._running_length += n
+            count -= n
+
+    def add_literal(self, word: int):
+        if word == 0 or word == ALL_ONES:
+            self.add_fill(word & 1, 1)
+            return
+        if self._rlw < 0 or self._literal_words == RLW_MAX_LITERAL_WORDS:
+            self._new_rlw()
+        self.words.append(word)
+        self._literal_words += 1
+
+    def build(self, bit_size: int) -> 'EWAHBitmap':
+        self._flush_rlw()
+        return EWAHBitmap(bit_size, self.words)
+
+
+class EWAHBitmap:
+    """EWAH 压缩位图 (ewah/ewah_bitmap.c)。第 i 位位于第 i // 64 个字的第 i % 64 位 (从最低位开始)。
+    集合运算直接在压缩后的字上进行，两边都是填充字时整段一次处理，不展开成普通位图"""
+
+    def __init__(self, bit_size: int = 0, words: Optional[array] = None):
+        self.bit_size = bit_size
+        self.words = words if words is not None else array('Q')
+
+    @classmethod
+    def read_from(cls, data, pos: int) -> Tuple['EWAHBitmap', int]:
+        # 序列化格式: bit 数 (4B) + 字数 (4B) + 字 (8B * n) + 最后一个 RLW 的位置 (4B)，均为大端
+        bit_size, word_count = struct.unpack_from('>II', data, pos)
+        words = _read_words(data, pos + 8, word_count)
+        return cls(bit_size, words), pos + 8 + 8 * word_count + 4
+
+    @staticmethod
+    def serialized_size(data, pos: int) -> int:
+        return 8 + 8 * struct.unpack_from('>I', data, pos + 4)[0] + 4
+
+    @classmethod
+    def from_positions(cls, positions: Iterable[int], bit_size: int = 0) -> 'EWAHBitmap':
+        # positions 必须升序
+        builder = _EWAHBuilder()
+        current_word, current = 0, 0
+        for pos in positions:
+            word_index = pos // WORD_BITS
+            if word_index != current_word:
+                builder.add_literal(current)
+                builder.add_fill(0, word_index - current_word - 1)
+                current_word, current = word_index, 0
+            current |= 1 << (pos % WORD_BITS)
+            bit_size = max(bit_size, pos + 1)
+        if current:
+            builder.add_literal(current)
+        return builder.build(bit_size)
+
+    def segments(self) -> Iterator[Segment]:
+        words = self.words
+        i, n = 0, len(words)
+        while i < n:
+            rlw = words[i]
+            running_length = (rlw >> 1) & RLW_MAX_RUNNING_LENGTH
+            literal_words = rlw >> (1 + RLW_RUNNING_BITS)
+            if running_length:
+                yield rlw & 1, running_length, None
+            if literal_words:
+                yield 0, literal_words, words[i+1:i+1+literal_words]
+            i += 1 + literal_words
+
+    def count(self) -> int:
+        total = 0
+        for bit, length, literals in self.segments():
+            if literals is None:
+                total += WORD_BITS * length * bit
+            else:
+                total += sum(word.bit_count() for word in literals)
+        return total
+
+    def __iter__(self) -> Iterator[int]:
+        # 按升序返回所有为 1 的位
+        base = 0
+        for bit, length, literals in self.segments():
+            if literals is None:
+                if bit:
+                    yield from range(base, base + WORD_BITS * length)
+            else:
+                for k, word in enumerate(literals):
+                    offset = base + WORD_BITS * k
+                    while word:
+                        low = word & -word
+                        yield offset + low.bit_length() - 1
+                        word ^= low
+            base += WORD_BITS * length
+
+    def to_bitset(self) -> bytearray:
+        # 展开成普通位图: 第 i 位为 bitset[i >> 3] 的第 i & 7 位
+        expanded = array('Q')
+        for bit, length, literals in self.segments():
+            if literals is None:
+                expanded.extend([ALL_ONES if bit else 0] * length)
+            else:
+                expanded.extend(literals)
+        if sys.byteorder == 'big':
+            expanded.byteswap()
+        return bytearray(expanded.tobytes())
+
+    def _combine(self, other: 'EWAHBitmap', op: Callable[[int, int], int]) -> 'EWAHBitmap':
+        builder = _EWAHBuilder()
+        segments_a, segments_b = self.segments(), other.segments()
+        a = b = None
+        used_a = used_b = 0 # 当前段中已经处理的字数
+        while True:
+            if a is None or used_a == a[1]:
+                a, used_a = next(segments_a, None), 0
+            if b is None or used_b == b[1]:
+                b, used_b = next(segments_b, None), 0
+            if a is None and b is None:
+                break
+            # 较短的一边用全 0 补齐
+            if a is None:
+                a = (0, b[1] - used_b, None)
+            if b is None:
+                b = (0, a[1] - used_a, None)
+
+            n = min(a[1] - used_a, b[1] - used_b)
+            word_a = ALL_ONES if a[0] else 0
+            word_b = ALL_ONES if b[0] else 0
+            if a[2] is None and b[2] is None:
+                builder.add_fill(op(word_a, word_b) & 1, n)
+            elif a[2] is None and op(word_a, 0) == op(word_a, ALL_ONES):
+                # 结果与另一边无关，例如 1 OR x、0 ANDNOT x
+                builder.add_fill(op(word_a, 0) & 1, n)
+            elif b[2] is None and op(0, word_b) == op(ALL_ONES, word_b):
+                builder.add_fill(op(0, word_b) & 1, n)
+            else:
+                literals_a = a[2][used_a:used_a+n] if a[2] is not None else [word_a] * n
+                literals_b = b[2][used_b:used_b+n] if b[2] is not None else [word_b] * n
+                for x, y in zip(literals_a, literals_b):
+                    builder.add_literal(op(x, y))
+            used_a += n
+            used_b += n
+        return builder.build(max(self.bit_size, other.bit_size))
+
+    def __or__(self, other: 'EWAHBitmap') -> 'EWAHBitmap':
+        return self._combine(other, lambda x, y: x | y)
+
+    def __and__(self, other: 'EWAHBitmap') -> 'EWAHBitmap':
+        return self._combine(other, lambda x, y: x & y)
+
+    def __xor__(self, other: 'EWAHBitmap') -> 'EWAHBitmap':
+        return self._combine(other, lambda x, y: x ^ y)
+
+    def and_not(self, other: 'EWAHBitmap') -> 'EWAHBitmap':
+        return self._combine(other, lambda x, y: x & ~y & ALL_ONES)
+
+    def __repr__(self):
+        return f"EWAHBitmap(bit_size={self.bit_size}, words={len(self.words)})"
+
+
+class PackBitmap:
+    """pack-*.bitmap (version 1): pack 中部分提交可达对象的位图，第 i 位对应 pack 中 (按偏移排序的) 第 i 个对象。
+    只在打开时扫描各个位图的位置，位图本身 (以及 XOR 链) 在第一次访问时才解码"""
+
+    BITMAP_SIGNATURE = b'BITM'
+    BITMAP_VERSION = 1
+
+    BITMAP_OPT_FULL_DAG = 0x1
+    BITMAP_OPT_HASH_CACHE = 0x4
+    BITMAP_OPT_LOOKUP_TABLE = 0x10
+
+    HEADER_SIZE = 12 + 20 # signature + version + flags + entry count + pack checksum
+    ENTRY_HEADER_SIZE = 6 # 提交在 idx 中的下标 (4B) + xor offset (1B) + flags (1B)
+
+    TYPE_NAMES = ('commit', 'tree', 'blob', 'tag')
+
+    def __init__(self, bitmap_file: Path, pack_index: GitPackIndex):
+        self.bitmap_file = bitmap_file
+        self.pack_index = pack_index
+        self.flags = 0
+        self.num_entries = 0
+        self._data = None
+        self._type_positions: Dict[str, int] = {}
+        self._entries: Dict[int, int] = {} # 提交在 idx 中的下标 -> entry 序号
+        self._entry_positions: List[int] = []
+        self._xor_offsets: List[int] = []
+        self._decoded: Dict[int, EWAHBitmap] = {}
+        self._pack_positions: Optional[array] = None # idx 下标 -> pack 中的位置
+        self._pack_order: Optional[array] = None # pack 中的位置 -> idx 下标
+
+    @classmethod
+    def load(cls, pack_dir: Path) -> Optional['PackBitmap']:
+        # 使用第一个带有 .bitmap 的 pack (git 同一时间只会使用一个 pack bitmap)
+        for bitmap_file in sorted(pack_dir.glob('pack-*.bitmap')):
+            idx_file = bitmap_file.with_suffix('.idx')
+            if idx_file.exists():
+                pack_index = GitPackIndex(idx_file)
+                pack_index.parse()
+                bitmap = cls(bitmap_file, pack_index)
+                bitmap.parse()
+                return bitmap
+        return None
+
+    def parse(self):
+        with open(self.bitmap_file, 'rb') as fp:
+            data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self._data = data
+
+        # 1. 头部
+        signature = data[0:4]
+        version, self.flags, self.num_entries = struct.unpack_from('>HHI', data, 4)
+        assert signature == self.BITMAP_SIGNATURE, f"Not a bitmap file: {self.bitmap_file}"
+        assert version == self.BITMAP_VERSION, f"Unsupported bitmap version: {version}"
+        assert data[12:32] == self.pack_index.packfile_sha1, f"Bitmap does not match its pack: {self.bitmap_file}"
+
+        # 2. commit/tree/blob/tag 四个类型位图
+        pos = self.HEADER_SIZE
+        for type_name in self.TYPE_NAMES:
+            self._type_positions[type_name] = pos
+            pos += EWAHBitmap.serialized_size(data, pos)
+
+        # 3. 各个提交的位图，只记录位置
+        self._entries = {}
+        self._entry_positions = []
+        self._xor_offsets = []
+        for i in range(self.num_entries):
+            idx_pos, xor_offset, _ = struct.unpack_from('>IBB', data, pos)
+            assert xor_offset <= i, f"Bad xor offset in bitmap entry {i}"
+            self._entries[idx_pos] = i
+            self._xor_offsets.append(xor_offset)
+            pos += self.ENTRY_HEADER_SIZE
+            self._entry_positions.append(pos)
+            pos += EWAHBitmap.serialized_size(data, pos)
+
+    def close(self):
+        if self._data is not None:
+            self._data.close()
+        self._data = None
+        self._decoded.clear()
+        self.pack_index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def num_objects(self) -> int:
+        return self.pack_index.total_objects
+
+    def type_bitmap(self, type_name: str) -> EWAHBitmap:
+        return EWAHBitmap.read_from(self._data, self._type_positions[type_name])[0]
+
+    def _entry_bitmap(self, i: int) -> EWAHBitmap:
+        # 位图可能存储为与前面第 xor_offset 个位图的异或
+        bitmap = self._decoded.get(i)
+        if bitmap is None:
+            bitmap = EWAHBitmap.read_from(self._data, self._entry_positions[i])[0]
+            xor_offset = self._xor_offsets[i]
+            if xor_offset:
+                bitmap = bitmap ^ self._entry_bitmap(i - xor_offset)
+            self._decoded[i] = bitmap
+        return bitmap
+
+    def commit_bitmap(self, sha1: bytes) -> Optional[EWAHBitmap]:
+        idx_pos = self.pack_index.find_index(sha1)
+        if idx_pos < 0 or idx_pos not in self._entries:
+            return None
+        return self._entry_bitmap(self._entries[idx_pos])
+
+    def _load_pack_order(self):
+        if self._pack_order is None:
+            self._pack_order = self.pack_index.offset_order()
+            positions = array('I', bytes(4 * len(self._pack_order)))
+            for pack_pos, idx_pos in enumerate(self._pack_order):
+                positions[idx_pos] = pack_pos
+            self._pack_positions = positions
+
+    def pack_position(self, sha1: bytes) -> int:
+        # 对象在位图中的位置，不在 pack 中时返回 -1
+        idx_pos = self.pack_index.find_index(sha1)
+        if idx_pos < 0:
+            return -1
+        self._load_pack_order()
+        return self._pack_positions[idx_pos]
+
+    def sha1_at(self, pack_pos: int) -> bytes:
+        self._load_pack_order()
+        return self.pack_index.sha1_at(self._pack_order[pack_pos])
+
+
+def _bit_is_set(bitset: bytearray, pos: int) -> bool:
+    return (pos >> 3) < len(bitset) and bool(bitset[pos >> 3] >> (pos & 7) & 1)
+
+
+def _set_bit(bitset: bytearray, pos: int):
+    if (pos >> 3) >= len(bitset):
+        bitset.extend(bytes((pos >> 3) - len(bitset) + 1))
+    bitset[pos >> 3] |= 1 << (pos & 7)
+
+
+def _or_bitset(bitset: bytearray, bitmap: EWAHBitmap) -> bytearray:
+    other = bitmap.to_bitset()
+    size = max(len(bitset), len(other))
+    merged = int.from_bytes(bitset, 'little') | int.from_bytes(other, 'little')
+    return bytearray(merged.to_bytes(size, 'little'))
+
+
+def _parse_commit_links(content: bytes) -> List[Tuple[bytes, str]]:
+    links = []
+    for line in content[:content.find(b'\n\n')].split(b'\n'):
+        if line.startswith(b'tree '):
+            links.append((bytes.fromhex(line[5:45].decode()), 'tree'))
+        elif line.startswith(b'parent '):
+            links.append((bytes.fromhex(line[7:47].decode()), 'commit'))
+    return links
+
+
+def _parse_tree_links(content: bytes) -> List[Tuple[bytes, str]]:
+    # gitlink (160000) 指向子模块中的提交，不属于本仓库
+    return [
+        (bytes(sha1), object_type_of_mode(mode))
+        for mode, _, sha1 in iter_tree_entries(content)
+        if mode != MODE_GITLINK
+    ]
+
+
+class BitmapIndex:
+    """用 pack bitmap 计算可达对象集合 (pack-bitmap.c)。
+    起点都有位图时只需要对位图做 OR; 否则从没有位图的起点开始遍历，遇到有位图的提交或已经在集合中的对象就停止。
+    不在 pack 中的对象 (例如新写入的松散对象) 被分配到 pack 对象之后的扩展位置上"""
+
+    def __init__(self, bitmap: PackBitmap, odb: ObjectDatabase):
+        self.bitmap = bitmap
+        self.odb = odb
+        self._extended: Dict[bytes, int] = {} # sha1 -> 扩展位置
+        self._extended_sha1s: List[bytes] = []
+        self._extended_types: Dict[str, List[int]] = {type_name: [] for type_name in PackBitmap.TYPE_NAMES}
+
+    def position(self, sha1: bytes, type_name: Optional[str] = None) -> int:
+        pos = self.bitmap.pack_position(sha1)
+        if pos >= 0:
+            return pos
+        pos = self._extended.get(sha1)
+        if pos is None:
+            pos = self._extended[sha1] = self.bitmap.num_objects + len(self._extended_sha1s)
+            self._extended_sha1s.append(sha1)
+            if type_name is None:
+                type_name = self.odb.info(sha1.hex())[0]
+            self._extended_types[type_name].append(pos)
+        return pos
+
+    def sha1_at(self, pos: int) -> bytes:
+        if pos < self.bitmap.num_objects:
+            return self.bitmap.sha1_at(pos)
+        return self._extended_sha1s[pos - self.bitmap.num_objects]
+
+    def type_bitmap(self, type_name: str) -> EWAHBitmap:
+        bitmap = self.bitmap.type_bitmap(type_name)
+        extended = self._extended_types[type_name]
+        if extended:
+            bitmap = bitmap | EWAHBitmap.from_positions(extended)
+        return bitmap
+
+    def reachable(self, tips: Iterable[bytes]) -> EWAHBitmap:
+        result = EWAHBitmap()
+        pending = []
+        for sha1 in tips:
+            bitmap = self.bitmap.commit_bitmap(sha1)
+            if bitmap is not None:
+                result = result | bitmap
+            else:
+                pending.append((sha1, None))
+        if not pending:
+            return result
+
+        seen = result.to_bitset()
+        found = []
+        while pending:
+            sha1, type_name = pending.pop()
+            pos = self.position(sha1, type_name)
+            if _bit_is_set(seen, pos):
+                continue
+            if type_name in (None, 'commit'):
+                bitmap = self.bitmap.commit_bitmap(sha1)
+                if bitmap is not None:
+                    result = result | bitmap
+                    seen = _or_bitset(seen, bitmap)
+                    continue
+            _set_bit(seen, pos)
+            found.append(pos)
+            if type_name == 'blob':
+                continue
+
+            obj = self.odb.read(sha1.hex())
+            assert obj is not None, f"Cannot find object: {sha1.hex()}"
+            if obj[0] == 'commit':
+                pending.extend(_parse_commit_links(obj[1]))
+            elif obj[0] == 'tree':
+                pending.extend(_parse_tree_links(obj[1]))
+            elif obj[0] == 'tag':
+                assert obj[1].startswith(b'object '), f"Bad tag object: {sha1.hex()}"
+                pending.append((bytes.fromhex(obj[1][7:47].decode()), None))
+
+        return result | EWAHBitmap.from_positions(sorted(found))
+
+    def iter_objects(self, bitmap: EWAHBitmap, type_names: Iterable[str] = PackBitmap.TYPE_NAMES) -> Iterator[bytes]:
+        # 与 git 一致: 按类型输出，同一类型内按 pack 中的顺序
+        for type_name in type_names:
+            for pos in bitmap & self.type_bitmap(type_name):
+                yield self.sha1_at(pos)
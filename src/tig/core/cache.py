@@ -0,0 +1,107 @@
+from array import array
+import hashlib
+import os
+from pathlib import Path
+import struct
+import tempfile
+import time
+from typing import List, Optional, Tuple
+
+CACHE_DIR_ENVIRONMENT = 'TIG_CACHE_DIR'
+
+
+def stat_key(path: Path) -> Optional[Tuple[int, int, int]]:
+    # 文件被重写后 inode、大小或 mtime 至少有一个会变化; 文件不存在时返回 None
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+class MetadataCache:
+    """解析结果的磁盘缓存，默认关闭，设置 TIG_CACHE_DIR 后启用。
+    每个缓存文件对应一个源文件和一种数据，以源文件的 (路径, mtime, 大小, inode) 为键，
+    任何一项变化都视为失效; 内容是若干个 array 的原始字节，读取时不需要再解析。
+
+    缓存文件格式: 'TIGC' + version (uint32) + 键 (mtime_ns, size, ino: 3 个 uint64) + 数组个数 (uint32)，
+    之后每个数组是 typecode (1 Byte) + 字节数 (uint64) + 本机字节序的数据"""
+
+    SIGNATURE = b'TIGC'
+    VERSION = 1
+    HEADER_FORMAT = '<4sIQQQI'
+    ARRAY_HEADER_FORMAT = '<cQ'
+
+    # mtime 在这个时间之内的文件可能在同一个时间戳内再次被修改 (racy)，先不缓存
+    RACY_SECONDS = 2
+
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = cache_dir
+
+    def _cache_file(self, kind: str, path: Path) -> Path:
+        name = hashlib.sha1(f"{kind}\0{os.path.abspath(path)}".encode()).hexdigest()
+        return self.cache_dir / f"{kind}-{name}"
+
+    def load(self, kind: str, path: Path) -> Optional[List[array]]:
+        key = stat_key(path)
+        if key is None:
+            return None
+        try:
+            with open(self._cache_file(kind, path), 'rb') as fp:
+                data = fp.read()
+        except FileNotFoundError:
+            return None
+
+        header_size = struct.calcsize(self.HEADER_FORMAT)
+        if len(data) < header_size:
+            return None
+        signature, version, mtime_ns, size, ino, count = struct.unpack_from(self.HEADER_FORMAT, data)
+        if signature != self.SIGNATURE or version != self.VERSION or (mtime_ns, size, ino) != key:
+            return None
+
+        arrays = []
+        pos = header_size
+        array_header_size = struct.calcsize(self.ARRAY_HEADER_FORMAT)
+        for _ in range(count):
+            typecode, nbytes = struct.unpack_from(self.ARRAY_HEADER_FORMAT, data, pos)
+            pos += array_header_size
+            if pos + nbytes > len(data):
+                return None
+            arrays.append(array(typecode.decode(), data[pos:pos+nbytes]))
+            pos += nbytes
+        return arrays
+
+    def store(self, kind: str, path: Path, arrays: List[array]):
+        key = stat_key(path)
+        if key is None or key[0] >= time.time_ns() - self.RACY_SECONDS * 1_000_000_000:
+            return
+        parts = [struct.pack(self.HEADER_FORMAT, self.SIGNATURE, self.VERSION, *key, len(arrays))]
+        for item in arrays:
+            parts.append(struct.pack(self.ARRAY_HEADER_FORMAT, item.typecode.encode(), len(item) * item.itemsize))
+            parts.append(item.tobytes())
+
+        # 先写临时文件再改名，并发的读者只会看到完整的缓存文件
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=self.cache_dir, prefix='tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(b''.join(parts))
+            os.replace(tmp_name, self._cache_file(kind, path))
+        except OSError:
+            # 缓存只是优化，写不进去时忽略
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+
+
+_cache: Optional[MetadataCache] = None
+
+
+def get_metadata_cache() -> Optional[MetadataCache]:
+    # 没有设置 TIG_CACHE_DIR 时返回 None，调用方照常解析
+    global _cache
+    cache_dir = os.environ.get(CACHE_DIR_ENVIRONMENT)
+    if not cache_dir:
+        return None
+    if _cache is None or _cache.cache_dir != Path(cache_dir):
+        _cache = MetadataCache(Path(cache_dir))
+    return _cache
@@ -0,0 +1,224 @@
+import mmap
+from pathlib import Path
+import struct
+from typing import Dict, List, Optional, Tuple
+
+
+class CommitGraphFile:
+    """单个 commit-graph 文件 (version 1, SHA-1)，所有数据在访问时直接从 mmap 中解码"""
+
+    GRAPH_SIGNATURE = b'CGPH'
+    GRAPH_VERSION = 1
+    OID_VERSION_SHA1 = 1
+
+    HEADER_SIZE = 8
+    CHUNK_LOOKUP_WIDTH = 12 # 4 Bytes chunk id + 8 Bytes offset
+    COMMIT_DATA_WIDTH = 20 + 16 # root tree + 2 个父提交下标 + generation / commit time
+
+    CHUNK_OID_FANOUT = b'OIDF'
+    CHUNK_OID_LOOKUP = b'OIDL'
+    CHUNK_COMMIT_DATA = b'CDAT'
+    CHUNK_GENERATION_DATA = b'GDA2'
+    CHUNK_GENERATION_DATA_OVERFLOW = b'GDO2'
+    CHUNK_EXTRA_EDGES = b'EDGE'
+    CHUNK_BASE_GRAPHS = b'BASE'
+
+    def __init__(self, graph_file: Path):
+        self.graph_file = graph_file
+        self.fanout_table = ()
+        self.num_commits = 0
+        self.num_base_graphs = 0
+        self.chunks: Dict[bytes, Tuple[int, int]] = {}
+        self._data = None
+
+    def parse(self):
+        with open(self.graph_file, 'rb') as fp:
+            data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self._data = data
+
+        # 1. 解析头部 (8 Bytes)
+        signature = data[0:4]
+        version, oid_version, n_chunks, self.num_base_graphs = struct.unpack_from('>BBBB', data, 4)
+        assert signature == self.GRAPH_SIGNATURE, f"Not a commit-graph: {self.graph_file}"
+        assert version == self.GRAPH_VERSION, f"Unsupported commit-graph version: {version}"
+        assert oid_version == self.OID_VERSION_SHA1, f"Unsupported hash version: {oid_version}"
+
+        # 2. 解析 chunk 查找表，最后一项的 id 为 0
+        self.chunks = {}
+        pos = self.HEADER_SIZE
+        lookup = [struct.unpack_from('>4sQ', data, pos + i * self.CHUNK_LOOKUP_WIDTH) for i in range(n_chunks + 1)]
+        for (chunk_id, start), (_, end) in zip(lookup, lookup[1:]):
+            self.chunks[chunk_id] = (start, end)
+        for chunk_id in (self.CHUNK_OID_FANOUT, self.CHUNK_OID_LOOKUP, self.CHUNK_COMMIT_DATA):
+            assert chunk_id in self.chunks, f"commit-graph is missing required chunk {chunk_id.decode()}"
+
+        self.fanout_table = struct.unpack_from('>256I', data, self.chunks[self.CHUNK_OID_FANOUT][0])
+        self.num_commits = self.fanout_table[-1]
+        self._oid_pos = self.chunks[self.CHUNK_OID_LOOKUP][0]
+        self._commit_data_pos = self.chunks[self.CHUNK_COMMIT_DATA][0]
+
+    @property
+    def has_generation_data(self) -> bool:
+        return self.CHUNK_GENERATION_DATA in self.chunks
+
+    @property
+    def base_graph_hashes(self) -> List[bytes]:
+        if self.CHUNK_BASE_GRAPHS not in self.chunks:
+            return []
+        start, end = self.chunks[self.CHUNK_BASE_GRAPHS]
+        return [self._data[pos:pos+20] for pos in range(start, end, 20)]
+
+    def close(self):
+        if self._data is not None:
+            self._data.close()
+        self._data = None
+
+    def sha1_at(self, i: int) -> bytes:
+        pos = self._oid_pos + 20 * i
+        return self._data[pos:pos+20]
+
+    def find_index(self, sha1: bytes) -> int:
+        first = sha1[0]
+        lo = self.fanout_table[first - 1] if first > 0 else 0
+        hi = self.fanout_table[first]
+        data = self._data
+        base = self._oid_pos
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = base + 20 * mid
+            cur = data[pos:pos+20]
+            if cur < sha1:
+                lo = mid + 1
+            elif cur > sha1:
+                hi = mid
+            else:
+                return mid
+        return -1
+
+    def commit_data_at(self, i: int) -> Tuple[bytes, int, int, int, int]:
+        # root tree, parent1, parent2, 拓扑层级 (高 30 bit), 提交时间 (34 bit)
+        pos = self._commit_data_pos + self.COMMIT_DATA_WIDTH * i
+        tree = self._data[pos:pos+20]
+        parent1, parent2, word1, word2 = struct.unpack_from('>IIII', self._data, pos + 20)
+        level = word1 >> 2
+        commit_time = ((word1 & 0x3) << 32) | word2
+        return tree, parent1, parent2, level, commit_time
+
+    def extra_edges_from(self, index: int) -> List[int]:
+        # EDGE 中从 index 开始的父提交列表，最高位为 1 的一项是最后一个
+        start = self.chunks[self.CHUNK_EXTRA_EDGES][0]
+        parents = []
+        while True:
+            edge = struct.unpack_from('>I', self._data, start + 4 * index)[0]
+            parents.append(edge & 0x7fffffff)
+            if edge & 0x80000000:
+                return parents
+            index += 1
+
+    def generation_offset_at(self, i: int) -> int:
+        # GDA2: corrected commit date 相对提交时间的偏移; 最高位为 1 时，低 31 位是 GDO2 中的下标
+        offset = struct.unpack_from('>I', self._data, self.chunks[self.CHUNK_GENERATION_DATA][0] + 4 * i)[0]
+        if offset & 0x80000000:
+            overflow_pos = self.chunks[self.CHUNK_GENERATION_DATA_OVERFLOW][0]
+            offset = struct.unpack_from('>Q', self._data, overflow_pos + 8 * (offset & 0x7fffffff))[0]
+        return offset
+
+
+class CommitGraph:
+    """objects/info/commit-graph 或 commit-graphs/commit-graph-chain 中的一组 commit-graph。
+    提交用全局下标表示: base 层的提交在前，上层依次在后 (与 git 中 parent 下标的编号方式一致)"""
+
+    GRAPH_PARENT_NONE = 0x70000000
+
+    def __init__(self, layers: List[CommitGraphFile]):
+        self.layers = layers
+        self._layer_starts = []
+        total = 0
+        for layer in layers:
+            self._layer_starts.append(total)
+            total += layer.num_commits
+        self.num_commits = total
+        # 只有所有层都有 GDA2 时才使用 corrected commit date 作为 generation number
+        self.use_generation_data = bool(layers) and all(layer.has_generation_data for layer in layers)
+
+    @classmethod
+    def load(cls, objects_dir: Path) -> Optional['CommitGraph']:
+        info_dir = objects_dir / 'info'
+        chain_file = info_dir / 'commit-graphs' / 'commit-graph-chain'
+        graph_files = []
+        if chain_file.exists():
+            for line in chain_file.read_text().split():
+                graph_files.append(info_dir / 'commit-graphs' / f"graph-{line}.graph")
+        elif (info_dir / 'commit-graph').exists():
+            graph_files.append(info_dir / 'commit-graph')
+        if not graph_files:
+            return None
+
+        layers = []
+        for graph_file in graph_files:
+            layer = CommitGraphFile(graph_file)
+            layer.parse()
+            assert layer.num_base_graphs == len(layers), f"commit-graph chain is broken at {graph_file}"
+            layers.append(layer)
+        return cls(layers)
+
+    def close(self):
+        for layer in self.layers:
+            layer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _locate(self, pos: int) -> Tuple[CommitGraphFile, int]:
+        for layer, start in zip(reversed(self.layers), reversed(self._layer_starts)):
+            if pos >= start:
+                return layer, pos - start
+        raise IndexError(pos)
+
+    def find(self, sha1: bytes) -> int:
+        # 返回提交的全局下标，不在 commit-graph 中时返回 -1
+        for layer, start in zip(self.layers, self._layer_starts):
+            i = layer.find_index(sha1)
+            if i >= 0:
+                return start + i
+        return -1
+
+    def sha1_at(self, pos: int) -> bytes:
+        layer, i = self._locate(pos)
+        return layer.sha1_at(i)
+
+    def tree_at(self, pos: int) -> bytes:
+        layer, i = self._locate(pos)
+        return layer.commit_data_at(i)[0]
+
+    def read_commit(self, pos: int) -> Tuple[List[int], int]:
+        # 一次解码得到父提交下标和提交时间，遍历历史时不需要解压提交对象
+        layer, i = self._locate(pos)
+        _, parent1, parent2, _, commit_time = layer.commit_data_at(i)
+        if parent1 == self.GRAPH_PARENT_NONE:
+            return [], commit_time
+        if parent2 == self.GRAPH_PARENT_NONE:
+            return [parent1], commit_time
+        if parent2 & 0x80000000:
+            # 章鱼合并: 第 2 个及之后的父提交存放在 EDGE 中
+            return [parent1] + layer.extra_edges_from(parent2 & 0x7fffffff), commit_time
+        return [parent1, parent2], commit_time
+
+    def parents(self, pos: int) -> List[int]:
+        return self.read_commit(pos)[0]
+
+    def commit_time(self, pos: int) -> int:
+        layer, i = self._locate(pos)
+        return layer.commit_data_at(i)[4]
+
+    def generation(self, pos: int) -> int:
+        # v2 (corrected commit date) 或 v1 (拓扑层级)，二者都满足 generation(父提交) < generation(子提交)
+        layer, i = self._locate(pos)
+        _, _, _, level, commit_time = layer.commit_data_at(i)
+        if self.use_generation_data:
+            return commit_time + layer.generation_offset_at(i)
+        return level
+
@@ -0,0 +1,496 @@
+from array import array
+from binascii import hexlify
+from collections.abc import Sequence
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+import hashlib
+import mmap
+import os
+from pathlib import Path
+import struct
+import sys
+from typing import BinaryIO, Dict, List, Optional, Tuple
+from dataclasses import dataclass, field
+
+from tig.core.output import OUTPUT_BATCH_SIZE, stdout_writer
+
+
+@dataclass
+class IndexEntry:
+    # stat_data
+    ## srtuct cache_time
+    ### sd_ctime
+    ctime_sec: int
+    ctime_nano: int
+    ### sd_mtime
+    mtime_sec: int
+    mtime_nano: int
+    
+    dev: int
+    ino: int
+    uid: int
+    gid: int
+    size: int
+
+    ce_mode: int
+    ce_flags: int
+
+    sha1: bytes
+    path: str
+
+    ce_ext_flags: int = 0 # index v3+ 的扩展 flags (skip-worktree, intent-to-add)
+
+    def __post_init__(self):
+        CE_STAGEMASK = 0x3000
+        CE_STAGESHIFT = 12
+        self.stage = ((CE_STAGEMASK & self.ce_flags) >> CE_STAGESHIFT) # ce_stage macro in read-cache-ll.h
+
+    def __repr__(self) -> str:
+        mode_str = oct(self.ce_mode)[2:].zfill(6)
+        sha1_str = self.sha1.hex()
+        return f"{mode_str} {sha1_str} {self.stage:<7d} {self.path}"
+
+
+@dataclass
+class CacheTree:
+    """TREE 扩展中的一个目录节点 (cache-tree.c)，entry_count 为 -1 表示该节点已失效"""
+    name: str
+    entry_count: int
+    subtree_count: int
+    sha1: Optional[bytes]
+    children: List['CacheTree'] = field(default_factory=list)
+
+    def find(self, path: str) -> Optional['CacheTree']:
+        node = self
+        for name in path.split('/') if path else []:
+            node = next((child for child in node.children if child.name == name), None)
+            if node is None:
+                return None
+        return node
+
+
+@dataclass
+class ResolveUndoEntry:
+    """REUC 扩展: 冲突解决前各 stage 的 mode 和 sha1 (mode 为 0 表示该 stage 不存在)"""
+    path: str
+    modes: Tuple[int, int, int]
+    sha1s: Tuple[Optional[bytes], Optional[bytes], Optional[bytes]]
+
+
+@dataclass
+class UntrackedCache:
+    """UNTR 扩展，只解析头部的环境标识、flags 和 exclude 文件名，目录数据保留原始字节"""
+    idents: List[bytes]
+    dir_flags: int
+    exclude_per_dir: str
+    data: bytes
+
+
+@dataclass
+class EndOfIndexEntries:
+    """EOIE 扩展: 扩展区起始偏移，以及各扩展头部的 SHA-1"""
+    offset: int
+    sha1: bytes
+
+
+@dataclass
+class IndexEntryOffset:
+    """IEOT 扩展中的一项: 一个 entry 块在文件中的偏移和其中的 entry 数量"""
+    offset: int
+    count: int
+
+
+@dataclass
+class IndexEntryBlock:
+    """一段连续 entry 的解析结果，头部字段保留为大端原始字节，便于批量解码与拼接"""
+    stat_data: bytes
+    sha1s: bytes
+    flags: bytes
+    ext_flags: array
+    paths: List[bytes]
+    end: int
+
+
+def _read_offset_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    # 与 pack 中 OFS_DELTA 相同的变长编码 (varint.c)
+    c = data[pos]
+    pos += 1
+    value = c & 0x7f
+    while c & 0x80:
+        c = data[pos]
+        pos += 1
+        value = ((value + 1) << 7) | (c & 0x7f)
+    return value, pos
+
+
+def parse_entry_block(data: bytes, pos: int, count: int, version: int) -> IndexEntryBlock:
+    """从 pos 开始解析 count 个 entry (create_from_disk in read-cache.c)"""
+    header_size = GitIndex.ENTRY_HEADER_SIZE
+    find = data.find
+    positions = array('Q')
+    paths = []
+    ext_flags = array('H')
+
+    if version == 2:
+        # entry = 62 Bytes 元数据 + 路径 (以null字节结尾) + 对齐到 8 Bytes 的填充
+        for _ in range(count):
+            path_end = find(b'\x00', pos + header_size)
+            positions.append(pos)
+            paths.append(data[pos+header_size:path_end])
+            pos += (path_end - pos + 8) & ~7
+        ext_flags.frombytes(bytes(2 * count))
+    elif version == 3:
+        # 设置了 CE_EXTENDED 的 entry 在 flags 后还有 2 Bytes 的扩展 flags
+        for _ in range(count):
+            flags = (data[pos+60] << 8) | data[pos+61]
+            path_pos = pos + header_size
+            if flags & GitIndex.CE_EXTENDED:
+                ext_flags.append((data[path_pos] << 8) | data[path_pos+1])
+                path_pos += 2
+            else:
+                ext_flags.append(0)
+            path_end = find(b'\x00', path_pos)
+            positions.append(pos)
+            paths.append(data[path_pos:path_end])
+            pos += (path_end - pos + 8) & ~7
+    elif version == 4:
+        # 路径前缀压缩: varint N 表示去掉上一个路径末尾的 N 字节，再拼接以null结尾的后缀，没有填充
+        prev = b''
+        for _ in range(count):
+            flags = (data[pos+60] << 8) | data[pos+61]
+            path_pos = pos + header_size
+            if flags & GitIndex.CE_EXTENDED:
+                ext_flags.append((data[path_pos] << 8) | data[path_pos+1])
+                path_pos += 2
+            else:
+                ext_flags.append(0)
+            strip, path_pos = _read_offset_varint(data, path_pos)
+            path_end = find(b'\x00', path_pos)
+            prev = prev[:len(prev)-strip] + data[path_pos:path_end]
+            positions.append(pos)
+            paths.append(prev)
+            pos = path_end + 1
+    else:
+        raise ValueError(f"Unsupported index version: {version}")
+
+    # 批量截取定长头部
+    view = memoryview(data)
+    block = IndexEntryBlock(
+        stat_data=b''.join([view[p:p+40] for p in positions]),
+        sha1s=b''.join([view[p+40:p+60] for p in positions]),
+        flags=b''.join([view[p+60:p+62] for p in positions]),
+        ext_flags=ext_flags,
+        paths=paths,
+        end=pos,
+    )
+    view.release()
+    return block
+
+
+def _parse_entry_block_file(index_file: Path, pos: int, count: int, version: int) -> IndexEntryBlock:
+    # 在子进程中运行
+    with open(index_file, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return parse_entry_block(data, pos, count, version)
+
+
+def parse_cache_tree(data: bytes) -> CacheTree:
+    # 先序遍历: path\0 entry_count SP subtree_count LF [sha1]
+    def parse_node(start: int) -> Tuple[CacheTree, int]:
+        name_end = data.index(b'\x00', start)
+        line_end = data.index(b'\n', name_end)
+        entry_count, subtree_count = map(int, data[name_end+1:line_end].split(b' '))
+        pos = line_end + 1
+        sha1 = None
+        if entry_count >= 0:
+            sha1 = data[pos:pos+20]
+            pos += 20
+        node = CacheTree(data[start:name_end].decode(errors='replace'), entry_count, subtree_count, sha1)
+        for _ in range(subtree_count):
+            child, pos = parse_node(pos)
+            node.children.append(child)
+        return node, pos
+
+    return parse_node(0)[0]
+
+
+def parse_resolve_undo(data: bytes) -> List[ResolveUndoEntry]:
+    # path\0 mode1\0 mode2\0 mode3\0 (八进制 ASCII)，之后是 mode 非 0 的各 stage 的 sha1
+    entries = []
+    pos = 0
+    while pos < len(data):
+        path_end = data.index(b'\x00', pos)
+        path = data[pos:path_end].decode(errors='replace')
+        pos = path_end + 1
+        modes = []
+        for _ in range(3):
+            mode_end = data.index(b'\x00', pos)
+            modes.append(int(data[pos:mode_end], 8))
+            pos = mode_end + 1
+        sha1s = []
+        for mode in modes:
+            if mode:
+                sha1s.append(data[pos:pos+20])
+                pos += 20
+            else:
+                sha1s.append(None)
+        entries.append(ResolveUndoEntry(path, tuple(modes), tuple(sha1s)))
+    return entries
+
+
+def parse_untracked_cache(data: bytes) -> UntrackedCache:
+    # varint(ident 长度) + 以null分隔的环境标识，之后是 ondisk_untracked_cache (dir.c)
+    ident_len, pos = _read_offset_varint(data, 0)
+    idents = [ident for ident in data[pos:pos+ident_len].split(b'\x00') if ident]
+    pos += ident_len
+    pos += 2 * 36 # info/exclude 与 core.excludesfile 的 stat_data
+    dir_flags = struct.unpack_from('>I', data, pos)[0]
+    pos += 4 + 2 * 20 # 二者的 sha1
+    exclude_end = data.index(b'\x00', pos)
+    exclude_per_dir = data[pos:exclude_end].decode(errors='replace')
+    return UntrackedCache(idents, dir_flags, exclude_per_dir, data[exclude_end+1:])
+
+
+def parse_end_of_index_entries(data: bytes) -> EndOfIndexEntries:
+    offset = struct.unpack_from('>I', data, 0)[0]
+    return EndOfIndexEntries(offset, data[4:24])
+
+
+def parse_index_entry_offsets(data: bytes) -> List[IndexEntryOffset]:
+    version = struct.unpack_from('>I', data, 0)[0]
+    assert version == 1, f"Unsupported IEOT version: {version}"
+    return [IndexEntryOffset(offset, count) for offset, count in struct.iter_unpack('>II', data[4:])]
+
+
+class IndexEntries(Sequence):
+    """按需构建 IndexEntry 的序列视图"""
+
+    def __init__(self, index: 'GitIndex'):
+        self.index = index
+
+    def __len__(self):
+        return len(self.index.paths)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.index.entry_at(k) for k in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.index.entry_at(i)
+
+    def __iter__(self):
+        entry_at = self.index.entry_at
+        for k in range(len(self)):
+            yield entry_at(k)
+
+
+class GitIndex:
+    CACHE_SIGNATURE = b'\x44\x49\x52\x43' # 'DIRC'
+
+    SUPPORTED_VERSIONS = (2, 3, 4)
+    ENTRY_HEADER_SIZE = 62 # 40 Bytes stat 数据 + 20 Bytes sha1 + 2 Bytes flags
+    STAT_FIELDS = 10
+
+    CE_EXTENDED = 0x4000
+    CE_STAGEMASK = 0x3000
+    CE_STAGESHIFT = 12
+
+    NULL_SHA1 = b'\x00' * 20
+
+    # 校验和模式: 解析完成前同步校验 / 后台线程校验 / 跳过校验
+    VERIFY_FULL = 'full'
+    VERIFY_BACKGROUND = 'background'
+    VERIFY_NONE = 'none'
+
+    # 每个进程至少分到这么多 entry 才值得并行 (参考 read-cache.c 中的 THREAD_COST)
+    MIN_ENTRIES_PER_JOB = 10000
+
+    EXTENSION_PARSERS = {
+        b'TREE': parse_cache_tree,
+        b'REUC': parse_resolve_undo,
+        b'UNTR': parse_untracked_cache,
+        b'EOIE': parse_end_of_index_entries,
+        b'IEOT': parse_index_entry_offsets,
+    }
+
+    def __init__(self, index_file: Path):
+        self.index_file = index_file
+        self.version = 0
+        # 列式存储: 每个 entry 的 10 个 uint32 stat 字段、sha1、flags、扩展 flags、路径
+        self.stat_data = array('I')
+        self.sha1s = b''
+        self.flags = array('H')
+        self.ext_flags = array('H')
+        self.paths: List[bytes] = []
+        # 扩展: signature -> 解析后的对象 (未识别的扩展保留原始字节)，以及各扩展的大小
+        self.extensions: Dict[bytes, object] = {}
+        self.extension_sizes: Dict[bytes, int] = {}
+        self._checksum_future: Optional[Future] = None
+
+    @property
+    def cache_tree(self) -> Optional[CacheTree]:
+        return self.extensions.get(b'TREE')
+
+    @property
+    def resolve_undo(self) -> Optional[List[ResolveUndoEntry]]:
+        return self.extensions.get(b'REUC')
+
+    @property
+    def untracked_cache(self) -> Optional[UntrackedCache]:
+        return self.extensions.get(b'UNTR')
+
+    @property
+    def end_of_index_entries(self) -> Optional[EndOfIndexEntries]:
+        return self.extensions.get(b'EOIE')
+
+    @property
+    def index_entry_offsets(self) -> Optional[List[IndexEntryOffset]]:
+        return self.extensions.get(b'IEOT')
+
+    @property
+    def entries(self) -> IndexEntries:
+        return IndexEntries(self)
+
+    def entry_at(self, k: int) -> IndexEntry:
+        base = k * self.STAT_FIELDS
+        ctime_sec, ctime_nano, mtime_sec, mtime_nano, dev, ino, mode, uid, gid, size = self.stat_data[base:base+self.STAT_FIELDS]
+        sha1 = self.sha1s[20*k:20*k+20]
+        path = self.paths[k].decode(errors='replace')
+        return IndexEntry(ctime_sec, ctime_nano, mtime_sec, mtime_nano, dev, ino, uid, gid, size, mode, self.flags[k], sha1, path, self.ext_flags[k])
+
+    def parse(self, jobs: Optional[int] = None, verify: str = VERIFY_FULL):
+        assert verify in (self.VERIFY_FULL, self.VERIFY_BACKGROUND, self.VERIFY_NONE), f"Unknown verify mode: {verify}"
+        with open(self.index_file, 'rb') as fp:
+            data = fp.read()
+
+        # 校验和可以放到后台线程计算 (hashlib 计算时会释放 GIL)，与解析、输出同时进行
+        self._checksum_future = None
+        if verify == self.VERIFY_BACKGROUND:
+            executor = ThreadPoolExecutor(max_workers=1)
+            self._checksum_future = executor.submit(self.verify_checksum, data)
+            executor.shutdown(wait=False)
+
+        # 1. 解析Header
+        pos = 0
+        signature = data[pos:pos+4]
+        pos += 4
+        assert signature == self.CACHE_SIGNATURE
+        version = struct.unpack('>I', data[pos:pos+4])[0]
+        pos += 4
+        assert version in self.SUPPORTED_VERSIONS, f"Unsupported index version: {version}"
+        self.version = version
+        n_entries = struct.unpack('>I', data[pos:pos+4])[0]
+        pos += 4
+
+        # 2. 如果有 EOIE 扩展，可以先解析扩展区拿到 IEOT，再按块并行解析 entries
+        jobs = min(jobs or os.cpu_count() or 1, n_entries // self.MIN_ENTRIES_PER_JOB)
+        eoie = self.read_end_of_index_entries(data) if jobs > 1 else None
+        if eoie is not None:
+            self.parse_extensions(data, eoie.offset)
+        if eoie is not None and self.index_entry_offsets:
+            blocks = self.parse_entry_blocks_parallel(self.index_entry_offsets, jobs)
+            assert sum(len(block.paths) for block in blocks) == n_entries
+            assert blocks[-1].end == eoie.offset
+        else:
+            blocks = [parse_entry_block(data, pos, n_entries, version)]
+            if eoie is None:
+                # 3. 解析扩展: 4 Bytes signature + 4 Bytes size + data，直到末尾 20 Bytes 的checksum
+                self.parse_extensions(data, blocks[-1].end)
+
+        # 4. 合并各块，并把定长头部批量解码到列式数组 (大端序)
+        self.stat_data = array('I', b''.join(block.stat_data for block in blocks))
+        self.sha1s = b''.join(block.sha1s for block in blocks)
+        self.flags = array('H', b''.join(block.flags for block in blocks))
+        if sys.byteorder == 'little':
+            self.stat_data.byteswap()
+            self.flags.byteswap()
+        self.ext_flags = array('H')
+        self.paths = []
+        for block in blocks:
+            self.ext_flags.extend(block.ext_flags)
+            self.paths.extend(block.paths)
+
+        # 检验校验和
+        if verify == self.VERIFY_FULL:
+            assert self.verify_checksum(data), f"index checksum mismatch: {self.index_file}"
+
+    def verify_checksum(self, data: bytes) -> bool:
+        expected_checksum = data[-20:]
+        if expected_checksum == self.NULL_SHA1:
+            # index.skipHash: 写入时没有计算校验和
+            return True
+        with memoryview(data) as view, view[:-20] as content:
+            return hashlib.sha1(content).digest() == expected_checksum
+
+    def wait_checksum(self) -> Optional[bool]:
+        # 等待后台校验结束，返回校验结果; 没有在后台校验时返回 None
+        if self._checksum_future is None:
+            return None
+        return self._checksum_future.result()
+
+    def read_end_of_index_entries(self, data: bytes) -> Optional[EndOfIndexEntries]:
+        # EOIE 总是最后一个扩展，固定位于 checksum 之前: signature + size(24) + offset + sha1
+        pos = len(data) - 20 - 8 - 24
+        if pos < 12 or data[pos:pos+4] != b'EOIE' or struct.unpack_from('>I', data, pos + 4)[0] != 24:
+            return None
+        return parse_end_of_index_entries(data[pos+8:pos+32])
+
+    def parse_entry_blocks_parallel(self, offsets: List[IndexEntryOffset], jobs: int) -> List[IndexEntryBlock]:
+        # 每个子进程自己 mmap index 文件解析其中的块，结果按 IEOT 中的顺序合并
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [
+                pool.submit(_parse_entry_block_file, self.index_file, item.offset, item.count, self.version)
+                for item in offsets
+            ]
+            return [future.result() for future in futures]
+
+    def parse_extensions(self, data: bytes, pos: int):
+        self.extensions = {}
+        self.extension_sizes = {}
+        extensions_start = pos
+        headers_sha1 = hashlib.sha1()
+        end = len(data) - 20
+        while pos + 8 <= end:
+            signature = data[pos:pos+4]
+            size = struct.unpack_from('>I', data, pos + 4)[0]
+            ext_data = data[pos+8:pos+8+size]
+            self.extension_sizes[signature] = size
+            parser = self.EXTENSION_PARSERS.get(signature)
+            self.extensions[signature] = parser(ext_data) if parser else ext_data
+            if signature != b'EOIE':
+                headers_sha1.update(data[pos:pos+8])
+            pos += 8 + size
+
+        # EOIE 记录了扩展区的起始位置和各扩展头部的 SHA-1，二者应与实际一致
+        eoie = self.end_of_index_entries
+        if eoie is not None:
+            assert eoie.offset == extensions_start, "EOIE offset does not match the end of index entries"
+            assert eoie.sha1 == headers_sha1.digest(), "EOIE hash does not match the index extensions"
+
+    def print_header(self, out: BinaryIO):
+        # 版本、entry 数和各个扩展，按扩展在文件中的顺序输出
+        lines = [f"Version: {self.version}\n", f"Total entries: {len(self.paths)}\n"]
+        for signature, size in self.extension_sizes.items():
+            lines.append(f"Extension: {signature.decode(errors='replace')}, Size: {size}\n")
+        out.write(''.join(lines).encode())
+
+    def print(self, out: Optional[BinaryIO] = None):
+        if out is None:
+            with stdout_writer() as out:
+                return self.print(out)
+
+        # 直接从列式数组按批格式化，与 IndexEntry.__repr__ 的输出一致
+        stat_data, flags, sha1s, paths = self.stat_data, self.flags, self.sha1s, self.paths
+        mode_field = 6 # stat 字段中 ce_mode 的位置
+        for lo in range(0, len(paths), OUTPUT_BATCH_SIZE):
+            hi = min(lo + OUTPUT_BATCH_SIZE, len(paths))
+            hexes = hexlify(sha1s[20*lo:20*hi])
+            out.write(b''.join([
+                b'%06o %s %-7d %s\n' % (
+                    stat_data[k*self.STAT_FIELDS+mode_field],
+                    hexes[40*(k-lo):40*(k-lo)+40],
+                    (flags[k] & self.CE_STAGEMASK) >> self.CE_STAGESHIFT,
+                    paths[k],
+                )
+                for k in range(lo, hi)
+            ]))
@@ -0,0 +1,131 @@
+import hashlib
+import mmap
+from pathlib import Path
+import struct
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+class MultiPackIndex:
+    """objects/pack/multi-pack-index (version 1, SHA-1)，一次 fan-out + 二分查找即可得到对象所在的 pack 和偏移"""
+
+    FILE_NAME = 'multi-pack-index'
+    MIDX_SIGNATURE = b'MIDX'
+    MIDX_VERSION = 1
+    OID_VERSION_SHA1 = 1
+
+    HEADER_SIZE = 12
+    CHUNK_LOOKUP_WIDTH = 12 # 4 Bytes chunk id + 8 Bytes offset
+
+    CHUNK_PACK_NAMES = b'PNAM'
+    CHUNK_OID_FANOUT = b'OIDF'
+    CHUNK_OID_LOOKUP = b'OIDL'
+    CHUNK_OBJECT_OFFSETS = b'OOFF'
+    CHUNK_LARGE_OFFSETS = b'LOFF'
+
+    HASH_CHUNK_SIZE = 1 << 20
+
+    def __init__(self, midx_file: Path):
+        self.midx_file = midx_file
+        self.pack_names: List[str] = []
+        self.fanout_table = ()
+        self.total_objects = 0
+        self.chunks: Dict[bytes, Tuple[int, int]] = {}
+        self._data = None
+
+    def parse(self):
+        with open(self.midx_file, 'rb') as fp:
+            data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self._data = data
+
+        # 1. 解析头部 (12 Bytes)
+        signature = data[0:4]
+        version, oid_version, n_chunks, n_base_files, n_packs = struct.unpack_from('>BBBBI', data, 4)
+        assert signature == self.MIDX_SIGNATURE, f"Not a multi-pack-index: {self.midx_file}"
+        assert version == self.MIDX_VERSION, f"Unsupported multi-pack-index version: {version}"
+        assert oid_version == self.OID_VERSION_SHA1, f"Unsupported hash version: {oid_version}"
+        assert n_base_files == 0, "Incremental multi-pack-index is not supported"
+
+        # 2. 解析 chunk 查找表: (n_chunks + 1) 项，最后一项的 id 为 0，只用于给出最后一个 chunk 的结束位置
+        self.chunks = {}
+        pos = self.HEADER_SIZE
+        lookup = [struct.unpack_from('>4sQ', data, pos + i * self.CHUNK_LOOKUP_WIDTH) for i in range(n_chunks + 1)]
+        for (chunk_id, start), (_, end) in zip(lookup, lookup[1:]):
+            self.chunks[chunk_id] = (start, end)
+        for chunk_id in (self.CHUNK_PACK_NAMES, self.CHUNK_OID_FANOUT, self.CHUNK_OID_LOOKUP, self.CHUNK_OBJECT_OFFSETS):
+            assert chunk_id in self.chunks, f"multi-pack-index is missing required chunk {chunk_id.decode()}"
+
+        # 3. pack 名称 (以null分隔，按名称排序)
+        start, end = self.chunks[self.CHUNK_PACK_NAMES]
+        self.pack_names = [name.decode() for name in data[start:end].split(b'\x00') if name][:n_packs]
+        assert len(self.pack_names) == n_packs, "multi-pack-index pack names are truncated"
+
+        # 4. fan-out 表，其余 chunk 在访问时直接从 mmap 中解码
+        self.fanout_table = struct.unpack_from('>256I', data, self.chunks[self.CHUNK_OID_FANOUT][0])
+        self.total_objects = self.fanout_table[-1]
+        self._oid_pos = self.chunks[self.CHUNK_OID_LOOKUP][0]
+        self._offset_pos = self.chunks[self.CHUNK_OBJECT_OFFSETS][0]
+        self._large_offset_pos = self.chunks.get(self.CHUNK_LARGE_OFFSETS, (0, 0))[0]
+
+    def close(self):
+        if self._data is not None:
+            self._data.close()
+        self._data = None
+
+    def __enter__(self):
+        if self._data is None:
+            self.parse()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def sha1_at(self, i: int) -> bytes:
+        pos = self._oid_pos + 20 * i
+        return self._data[pos:pos+20]
+
+    def pack_offset_at(self, i: int) -> Tuple[int, int]:
+        # 每项 8 Bytes: pack 下标 + 偏移; 偏移最高位为 1 时，低 31 位是 LOFF 中的下标
+        pack_int_id, offset = struct.unpack_from('>II', self._data, self._offset_pos + 8 * i)
+        if offset & 0x80000000:
+            assert self._large_offset_pos, "multi-pack-index is missing the LOFF chunk"
+            offset = struct.unpack_from('>Q', self._data, self._large_offset_pos + 8 * (offset & 0x7fffffff))[0]
+        return pack_int_id, offset
+
+    def find_index(self, sha1: bytes) -> int:
+        first = sha1[0]
+        lo = self.fanout_table[first - 1] if first > 0 else 0
+        hi = self.fanout_table[first]
+        data = self._data
+        base = self._oid_pos
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = base + 20 * mid
+            cur = data[pos:pos+20]
+            if cur < sha1:
+                lo = mid + 1
+            elif cur > sha1:
+                hi = mid
+            else:
+                return mid
+        return -1
+
+    def find(self, sha1: bytes) -> Optional[Tuple[str, int]]:
+        # 返回对象所在 pack 的 idx 文件名和对象在 pack 中的偏移
+        i = self.find_index(sha1)
+        if i < 0:
+            return None
+        pack_int_id, offset = self.pack_offset_at(i)
+        return self.pack_names[pack_int_id], offset
+
+    def __iter__(self) -> Iterator[Tuple[bytes, int, int]]:
+        for i in range(self.total_objects):
+            yield (self.sha1_at(i), *self.pack_offset_at(i))
+
+    def verify(self):
+        # 验证 multi-pack-index 文件末尾的 SHA-1 (分块计算)
+        data = self._data
+        end = len(data) - 20
+        h = hashlib.sha1()
+        for pos in range(0, end, self.HASH_CHUNK_SIZE):
+            h.update(data[pos:min(pos + self.HASH_CHUNK_SIZE, end)])
+        assert data[end:] == h.digest(), "multi-pack-index SHA-1 does not match, the file may be broken!"
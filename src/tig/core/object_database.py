@@ -0,0 +1,303 @@
+from abc import ABC, abstractmethod
+import os
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+import zlib
+
+from tig.core.midx import MultiPackIndex
+from tig.core.pack import DeltaBaseCache, GitPack, GitPackIndex
+from tig.core.repository import Repository
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# 对象的类型、大小和按块返回的内容
+ObjectStream = Tuple[str, int, Iterator[bytes]]
+
+
+def is_object_name(name: str) -> bool:
+    # 完整的 40 位小写十六进制 sha1
+    return len(name) == 40 and all(c in '0123456789abcdef' for c in name)
+
+
+def _iter_inflate_file(path: Path, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    # 分块读取并解压，每次输出不超过 chunk_size 字节
+    with open(path, 'rb') as fp:
+        decomp = zlib.decompressobj()
+        while not decomp.eof:
+            chunk = decomp.unconsumed_tail or fp.read(chunk_size)
+            assert chunk, f"Unexpected end of object file: {path}"
+            out = decomp.decompress(chunk, chunk_size)
+            if out:
+                yield out
+
+
+class ObjectStore(ABC):
+    """对象存储后端的接口，ObjectDatabase 按顺序在各个后端中查找对象"""
+
+    @abstractmethod
+    def contains(self, file_hash: str) -> bool:
+        ...
+
+    @abstractmethod
+    def stream(self, file_hash: str) -> Optional[ObjectStream]:
+        ...
+
+    def info(self, file_hash: str) -> Optional[Tuple[str, int]]:
+        obj = self.stream(file_hash)
+        if obj is None:
+            return None
+        obj[2].close()
+        return obj[0], obj[1]
+
+    def refresh(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class LooseObjectStore(ObjectStore):
+    """objects/xx/yyyy 形式的松散对象，每个 xx 目录的文件列表只读取一次"""
+
+    def __init__(self, objects_dir: Path):
+        self.objects_dir = objects_dir
+        self._listings: Dict[str, Set[str]] = {}
+
+    def _listing(self, fanout: str) -> Set[str]:
+        names = self._listings.get(fanout)
+        if names is None:
+            try:
+                names = set(os.listdir(self.objects_dir / fanout))
+            except (FileNotFoundError, NotADirectoryError):
+                names = set()
+            self._listings[fanout] = names
+        return names
+
+    def add(self, file_hash: str):
+        # 新写入的松散对象需要登记到缓存的目录列表中
+        self._listing(file_hash[:2]).add(file_hash[2:])
+
+    def contains(self, file_hash: str) -> bool:
+        return file_hash[2:] in self._listing(file_hash[:2])
+
+    def stream(self, file_hash: str) -> Optional[ObjectStream]:
+        if not self.contains(file_hash):
+            return None
+        target_path = self.objects_dir / file_hash[:2] / file_hash[2:]
+
+        # 头部 "type size\0" 位于第一个解压块中，剩余部分按块返回
+        chunks = _iter_inflate_file(target_path)
+        head = b''
+        null_idx = -1
+        for chunk in chunks:
+            head += chunk
+            null_idx = head.find(b'\x00')
+            if null_idx >= 0:
+                break
+        assert null_idx >= 0, f"Bad object header: {target_path}"
+        object_type, content_size = head[:null_idx].decode().split(' ')
+
+        def body() -> Iterator[bytes]:
+            if null_idx + 1 < len(head):
+                yield head[null_idx+1:]
+            yield from chunks
+
+        return object_type, int(content_size), body()
+
+    def refresh(self):
+        self._listings.clear()
+
+
+class PackObjectStore(ObjectStore):
+    """objects/pack 中的所有 pack，idx 和 pack 的 mmap 在多次查找之间保持打开。
+    存在 multi-pack-index 时，其覆盖的 pack 只需一次查找，其余 pack 逐个查找"""
+
+    def __init__(self, pack_dir: Path, cache: Optional[DeltaBaseCache] = None):
+        self.pack_dir = pack_dir
+        # 所有 pack 共用一个 delta base 缓存
+        self.cache = cache if cache is not None else DeltaBaseCache()
+        self.midx: Optional[MultiPackIndex] = None
+        self._opened: Dict[str, Optional[GitPack]] = {} # idx 文件名 -> GitPack
+        self._unindexed: Optional[List[GitPack]] = None # 不在 multi-pack-index 中的 pack
+
+    def _load(self):
+        if self._unindexed is not None:
+            return
+        midx_file = self.pack_dir / MultiPackIndex.FILE_NAME
+        if midx_file.exists():
+            self.midx = MultiPackIndex(midx_file)
+            self.midx.parse()
+        covered = set(self.midx.pack_names) if self.midx else set()
+        self._unindexed = []
+        for idx_file in sorted(self.pack_dir.glob('*.idx')):
+            if idx_file.name not in covered:
+                pack = self._open_pack(idx_file.name)
+                if pack is not None:
+                    self._unindexed.append(pack)
+
+    def _open_pack(self, idx_name: str) -> Optional[GitPack]:
+        if idx_name not in self._opened:
+            idx_file = self.pack_dir / idx_name
+            pack_file = idx_file.with_suffix('.pack')
+            pack = None
+            if idx_file.exists() and pack_file.exists():
+                pack_index = GitPackIndex(idx_file)
+                pack_index.parse()
+                pack = GitPack(pack_file, pack_index, self.cache)
+            self._opened[idx_name] = pack
+        return self._opened[idx_name]
+
+    @property
+    def packs(self) -> List[GitPack]:
+        self._load()
+        if self.midx is not None:
+            for idx_name in self.midx.pack_names:
+                self._open_pack(idx_name)
+        return [pack for pack in self._opened.values() if pack is not None]
+
+    def find(self, file_hash: str) -> Optional[Tuple[GitPack, int]]:
+        self._load()
+        sha1 = bytes.fromhex(file_hash)
+        if self.midx is not None:
+            found = self.midx.find(sha1)
+            if found is not None:
+                pack = self._open_pack(found[0])
+                if pack is not None:
+                    return pack, found[1]
+        for pack in self._unindexed:
+            i = pack.pack_index.find_index(sha1)
+            if i >= 0:
+                return pack, pack.pack_index.offset_at(i)
+        return None
+
+    def contains(self, file_hash: str) -> bool:
+        return self.find(file_hash) is not None
+
+    def stream(self, file_hash: str) -> Optional[ObjectStream]:
+        found = self.find(file_hash)
+        if found is None:
+            return None
+        pack, offset = found
+        return pack.stream_object_at(offset)
+
+    def info(self, file_hash: str) -> Optional[Tuple[str, int]]:
+        # 只解析头部得到类型和大小，不解压对象内容
+        found = self.find(file_hash)
+        if found is None:
+            return None
+        pack, offset = found
+        return pack.object_info_at(offset)
+
+    def refresh(self):
+        self.close()
+
+    def close(self):
+        for pack in self._opened.values():
+            if pack is not None:
+                pack.close()
+                pack.pack_index.close()
+        if self.midx is not None:
+            self.midx.close()
+        self._opened = {}
+        self._unindexed = None
+        self.midx = None
+
+
+class ObjectDatabase:
+    """按 sha1 查找对象: 依次搜索松散对象、pack 以及 objects/info/alternates 中的对象库，
+    并缓存确定不存在的 sha1，避免重复的无效查找"""
+
+    MAX_ALTERNATE_DEPTH = 5 # 与 git 一致，alternates 最多嵌套 5 层
+
+    def __init__(self, objects_dir: Path, use_alternates: bool = True):
+        self.objects_dir = objects_dir
+        self.cache = DeltaBaseCache()
+        self.loose = LooseObjectStore(objects_dir)
+        self.backends: List[ObjectStore] = [self.loose, PackObjectStore(objects_dir / 'pack', self.cache)]
+        if use_alternates:
+            for alternate_dir in self.read_alternates(objects_dir):
+                self.backends.append(LooseObjectStore(alternate_dir))
+                self.backends.append(PackObjectStore(alternate_dir / 'pack', self.cache))
+        self._missing: Set[str] = set()
+
+    @classmethod
+    def from_repo(cls, repo: Repository) -> 'ObjectDatabase':
+        return cls(repo.objects_dir)
+
+    @classmethod
+    def read_alternates(cls, objects_dir: Path) -> List[Path]:
+        # 每行一个对象库路径 (相对路径相对于当前 objects 目录)，'#' 开头为注释
+        result = []
+        seen = {objects_dir.resolve()}
+        pending = [(objects_dir, 0)]
+        while pending:
+            current, depth = pending.pop(0)
+            if depth >= cls.MAX_ALTERNATE_DEPTH:
+                continue
+            alternates_file = current / 'info' / 'alternates'
+            if not alternates_file.exists():
+                continue
+            for line in alternates_file.read_text().splitlines():
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                alternate_dir = (current / line).resolve()
+                if alternate_dir in seen or not alternate_dir.is_dir():
+                    continue
+                seen.add(alternate_dir)
+                result.append(alternate_dir)
+                pending.append((alternate_dir, depth + 1))
+        return result
+
+    def add_backend(self, backend: ObjectStore):
+        self.backends.append(backend)
+        self._missing.clear()
+
+    def add_loose(self, file_hash: str):
+        # 刚写入的松散对象: 登记到目录列表，并从不存在的缓存中移除
+        self.loose.add(file_hash)
+        self._missing.discard(file_hash)
+
+    def _lookup(self, file_hash: str, method: str):
+        file_hash = file_hash.lower()
+        if file_hash in self._missing or not is_object_name(file_hash):
+            return None
+        for backend in self.backends:
+            result = getattr(backend, method)(file_hash)
+            if result:
+                return result
+        self._missing.add(file_hash)
+        return None
+
+    def contains(self, file_hash: str) -> bool:
+        return bool(self._lookup(file_hash, 'contains'))
+
+    def stream(self, file_hash: str) -> Optional[ObjectStream]:
+        return self._lookup(file_hash, 'stream')
+
+    def info(self, file_hash: str) -> Optional[Tuple[str, int]]:
+        return self._lookup(file_hash, 'info')
+
+    def read(self, file_hash: str) -> Optional[Tuple[str, bytes]]:
+        obj = self.stream(file_hash)
+        if obj is None:
+            return None
+        return obj[0], b''.join(obj[2])
+
+    def refresh(self, packs: bool = True):
+        # 仓库内容发生变化 (新的松散对象或 pack) 后，清空所有缓存;
+        # packs=False 时只重新读取松散对象，已经打开的 pack 和 idx 保持不变
+        self._missing.clear()
+        for backend in self.backends:
+            if packs or isinstance(backend, LooseObjectStore):
+                backend.refresh()
+
+    def close(self):
+        for backend in self.backends:
+            backend.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,201 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import hashlib
+from itertools import chain
+import os
+from pathlib import Path
+import tempfile
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import zlib
+
+from tig.core.object_database import ObjectDatabase
+
+OBJECT_TYPES = ('blob', 'tree', 'commit', 'tag')
+
+# 与 core.looseCompression 的默认值一致: Z_BEST_SPEED，松散对象之后通常还会被打进 pack 重新压缩
+LOOSE_COMPRESSION_LEVEL = 1
+
+# 超过这个大小的文件分块计算 sha1，需要写入时再读一遍压缩，内存占用与文件大小无关
+BIG_FILE_THRESHOLD = 32 << 20
+READ_CHUNK_SIZE = 1 << 20
+
+# 每个进程至少处理这么多文件，文件很少时不值得启动进程池
+MIN_FILES_PER_JOB = 64
+
+# 每写入这么多对象，一起改名到最终位置，并对涉及的目录 fsync 一次
+FSYNC_BATCH_SIZE = 1024
+
+
+def object_header(object_type: str, size: int) -> bytes:
+    return f"{object_type} {size}\x00".encode()
+
+
+def hash_object(object_type: str, content: bytes) -> str:
+    return hashlib.sha1(object_header(object_type, len(content)) + content).hexdigest()
+
+
+def write_temp_object(objects_dir: Path, file_hash: str, chunks: Iterable[bytes], level: int = LOOSE_COMPRESSION_LEVEL,
+                      fsync: bool = True) -> str:
+    """把 "type size\\0" + 内容压缩写入对象所在的 xx 目录下的临时文件，返回临时文件路径。
+    与 git 一样，临时文件分散在各个 xx 目录中 (大量文件集中在一个目录里创建很慢)，对象文件是只读的;
+    fsync 时在改名前把数据写到磁盘，目录的 fsync 由 LooseObjectWriter 批量完成"""
+    fanout_dir = objects_dir / file_hash[:2]
+    fanout_dir.mkdir(exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=fanout_dir, prefix='tmp_obj_')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            comp = zlib.compressobj(level)
+            for chunk in chunks:
+                fp.write(comp.compress(chunk))
+            fp.write(comp.flush())
+            fp.flush()
+            os.fchmod(fd, 0o444)
+            if fsync:
+                os.fdatasync(fd)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return tmp_path
+
+
+def hash_file(path: str, object_type: str = 'blob', odb: Optional[ObjectDatabase] = None,
+              level: int = LOOSE_COMPRESSION_LEVEL, fsync: bool = True) -> Tuple[str, Optional[str]]:
+    """计算文件作为对象的 sha1，返回 (sha1, 临时文件路径)。
+    odb 为 None 时只计算 sha1; 否则对象不存在时压缩写入临时文件，已经存在 (松散对象、pack 或 alternates) 时跳过"""
+    with open(path, 'rb') as fp:
+        size = os.fstat(fp.fileno()).st_size
+        header = object_header(object_type, size)
+        if size <= BIG_FILE_THRESHOLD:
+            content = fp.read()
+            assert len(content) == size, f"File changed while hashing: {path}"
+            file_hash = hashlib.sha1(header + content).hexdigest()
+            if odb is None or odb.contains(file_hash):
+                return file_hash, None
+            return file_hash, write_temp_object(odb.objects_dir, file_hash, [header, content], level, fsync)
+
+        h = hashlib.sha1(header)
+        read_size = 0
+        while chunk := fp.read(READ_CHUNK_SIZE):
+            h.update(chunk)
+            read_size += len(chunk)
+        assert read_size == size, f"File changed while hashing: {path}"
+        file_hash = h.hexdigest()
+        if odb is None or odb.contains(file_hash):
+            return file_hash, None
+        fp.seek(0)
+        chunks = chain([header], iter(partial(fp.read, READ_CHUNK_SIZE), b''))
+        return file_hash, write_temp_object(odb.objects_dir, file_hash, chunks, level, fsync)
+
+
+def _fsync_dir(path: Path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class LooseObjectWriter:
+    """把对象写成 objects/xx/yyyy 形式的松散对象，已经存在的对象不再写入。
+    对象先写入临时文件，每 batch_size 个一起链接到最终位置 (与 git 的 finalize_object_file 一样用 link，
+    不会覆盖已有的对象)，然后每个涉及的目录只 fsync 一次"""
+
+    def __init__(self, odb: ObjectDatabase, level: int = LOOSE_COMPRESSION_LEVEL, fsync: bool = True,
+                 batch_size: int = FSYNC_BATCH_SIZE):
+        self.odb = odb
+        self.level = level
+        self.fsync = fsync
+        self.batch_size = batch_size
+        self._pending: Dict[str, str] = {} # sha1 -> 临时文件路径
+
+    def exists(self, file_hash: str) -> bool:
+        return file_hash in self._pending or self.odb.contains(file_hash)
+
+    def write(self, object_type: str, content: bytes) -> str:
+        file_hash = hash_object(object_type, content)
+        if not self.exists(file_hash):
+            header = object_header(object_type, len(content))
+            self.add_temp(file_hash, write_temp_object(self.odb.objects_dir, file_hash, [header, content], self.level, self.fsync))
+        return file_hash
+
+    def add_temp(self, file_hash: str, tmp_path: Optional[str]):
+        # 接收 hash_file 的结果; 同一批中内容相同的文件会各自写出临时文件，只保留一个
+        if tmp_path is None:
+            return
+        if self.exists(file_hash):
+            os.unlink(tmp_path)
+            return
+        self._pending[file_hash] = tmp_path
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        # 写临时文件时可能新建了 xx 目录，objects 目录本身也要 fsync
+        dirs = {self.odb.objects_dir}
+        for file_hash, tmp_path in self._pending.items():
+            fanout_dir = self.odb.objects_dir / file_hash[:2]
+            target_path = fanout_dir / file_hash[2:]
+            try:
+                os.link(tmp_path, target_path)
+                os.unlink(tmp_path)
+            except FileExistsError:
+                # 其他进程已经写入了同样的对象
+                os.unlink(tmp_path)
+            except OSError:
+                # 不支持硬链接的文件系统
+                os.replace(tmp_path, target_path)
+            dirs.add(fanout_dir)
+            self.odb.add_loose(file_hash)
+        if self.fsync:
+            for path in dirs:
+                _fsync_dir(path)
+        self._pending.clear()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_worker_odb: Optional[ObjectDatabase] = None
+
+
+def _init_worker(objects_dir: Optional[Path]):
+    # 每个子进程打开自己的 ObjectDatabase (pack 和 idx 的 mmap)，用来判断对象是否已经存在
+    global _worker_odb
+    _worker_odb = ObjectDatabase(objects_dir) if objects_dir is not None else None
+
+
+def _hash_file_in_worker(path: str, object_type: str, level: int, fsync: bool) -> Tuple[str, Optional[str]]:
+    return hash_file(path, object_type, _worker_odb, level, fsync)
+
+
+def hash_files(paths: List[str], object_type: str = 'blob', writer: Optional[LooseObjectWriter] = None,
+               jobs: Optional[int] = None) -> Iterator[str]:
+    """按顺序返回每个文件的 sha1，writer 不为 None 时同时写入对象。
+    读取、计算 sha1、压缩和写临时文件都在进程池中进行，主进程只负责改名和目录的 fsync"""
+    level = writer.level if writer is not None else LOOSE_COMPRESSION_LEVEL
+    fsync = writer.fsync if writer is not None else False
+    jobs = min(jobs or os.cpu_count() or 1, len(paths) // MIN_FILES_PER_JOB)
+    if jobs <= 1:
+        for path in paths:
+            file_hash, tmp_path = hash_file(path, object_type, writer.odb if writer is not None else None, level, fsync)
+            if writer is not None:
+                writer.add_temp(file_hash, tmp_path)
+            yield file_hash
+        return
+
+    objects_dir = writer.odb.objects_dir if writer is not None else None
+    task = partial(_hash_file_in_worker, object_type=object_type, level=level, fsync=fsync)
+    chunksize = max(1, min(256, len(paths) // (jobs * 4)))
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(objects_dir,)) as pool:
+        for file_hash, tmp_path in pool.map(task, paths, chunksize=chunksize):
+            if writer is not None:
+                writer.add_temp(file_hash, tmp_path)
+            yield file_hash
@@ -0,0 +1,43 @@
+from contextlib import contextmanager
+import io
+import os
+import sys
+from itertools import islice
+from typing import BinaryIO, Iterable, Iterator
+
+OUTPUT_BUFFER_SIZE = 1 << 20
+OUTPUT_BATCH_SIZE = 4096
+
+
+@contextmanager
+def stdout_writer(buffer_size: int = OUTPUT_BUFFER_SIZE) -> Iterator[BinaryIO]:
+    """在 stdout 上打开一个大缓冲区的二进制 writer"""
+    # 先把 print() 写入的文本刷出去，保证输出顺序
+    sys.stdout.flush()
+    try:
+        out = open(sys.stdout.fileno(), 'wb', buffering=buffer_size, closefd=False)
+    except (AttributeError, io.UnsupportedOperation):
+        # stdout 被替换成了没有文件描述符的对象
+        out = sys.stdout.buffer
+
+    yield out
+    out.flush()
+
+
+def write_lines(out: BinaryIO, lines: Iterable[bytes], batch_size: int = OUTPUT_BATCH_SIZE):
+    """把逐行产生的输出每 batch_size 行拼接成一次写入，减少 writer 上的方法调用"""
+    it = iter(lines)
+    while batch := list(islice(it, batch_size)):
+        out.write(b''.join(batch))
+
+
+@contextmanager
+def exit_on_broken_pipe():
+    """输出被 `| head` 等提前关闭时安静退出，而不是打印 BrokenPipeError 的 traceback"""
+    try:
+        yield
+    except BrokenPipeError:
+        # 把 stdout 重定向到 /dev/null，避免解释器退出时 flush 剩余缓冲区再次报错
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        sys.exit(1)
@@ -0,0 +1,499 @@
+from array import array
+from binascii import hexlify
+from collections import OrderedDict
+from collections.abc import Hashable, Sequence
+import hashlib
+import mmap
+from pathlib import Path
+import struct
+import sys
+from typing import BinaryIO, Iterator, Optional, Tuple
+import zlib
+
+from tig.core.cache import get_metadata_cache
+from tig.core.output import OUTPUT_BATCH_SIZE, stdout_writer
+
+
+class PackIndexEntry:
+    """idx 中第 i 个对象的轻量视图，crc32 / offset 在访问时才解码"""
+
+    __slots__ = ('index', 'i')
+
+    def __init__(self, index: 'GitPackIndex', i: int):
+        self.index = index
+        self.i = i
+
+    @property
+    def sha1(self) -> bytes:
+        return self.index.sha1_at(self.i)
+
+    @property
+    def crc32(self) -> int:
+        return self.index.crc32_at(self.i)
+
+    @property
+    def offset(self) -> int:
+        return self.index.offset_at(self.i)
+
+    def __repr__(self):
+        return f"{self.sha1.hex()} {self.offset}"
+
+
+class PackIndexEntries(Sequence):
+    """按 SHA-1 顺序排列的 entry 序列，不预先构建列表"""
+
+    def __init__(self, index: 'GitPackIndex'):
+        self.index = index
+
+    def __len__(self):
+        return self.index.total_objects
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [PackIndexEntry(self.index, j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return PackIndexEntry(self.index, i)
+
+    def __iter__(self):
+        index = self.index
+        for i in range(index.total_objects):
+            yield PackIndexEntry(index, i)
+
+
+class GitPackIndex:
+    """Git version 2"""
+
+    IDX_SIGNATURE = b'\xff\x74\x4f\x63' # b'\xfftOc'
+    IDX_VERSION = 2
+
+    HEADER_SIZE = 8
+    FANOUT_SIZE = 256 * 4
+    HASH_CHUNK_SIZE = 1 << 20
+
+    def __init__(self, idx_file: Path, use_mmap: bool = True):
+        self.idx_file = idx_file
+        self.use_mmap = use_mmap
+        self.fanout_table = ()
+        self.total_objects = 0
+        self._data = None
+
+    def parse(self):
+        # 只解析头部和 fan-out 表，其余内容在访问时直接从 mmap 中解码
+        with open(self.idx_file, 'rb') as fp:
+            if self.use_mmap:
+                data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                data = fp.read()
+        self._data = data
+
+        # 1. 解析头部 (8 Byets)
+        signature = data[0:4]
+        version = struct.unpack_from('>I', data, 4)[0]
+        assert signature == self.IDX_SIGNATURE
+        assert version == self.IDX_VERSION
+
+        # 2. 解析 Fan-out 表 (256个uint32)
+        self.fanout_table = struct.unpack_from('>256I', data, self.HEADER_SIZE)
+
+        # 对象总数 = fanout_table 的最后一项
+        n = self.total_objects = self.fanout_table[-1]
+
+        # 3. 计算各个表的起始位置: SHA-1 (20B * n), CRC32 (4B * n), 偏移量 (4B * n), 大偏移量 (8B * m)
+        self._sha1_pos = self.HEADER_SIZE + self.FANOUT_SIZE
+        self._crc32_pos = self._sha1_pos + 20 * n
+        self._offset_pos = self._crc32_pos + 4 * n
+        self._large_offset_pos = self._offset_pos + 4 * n
+        assert len(data) >= self._large_offset_pos + 40, f"idx file is truncated: {self.idx_file}"
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._data = None
+
+    def __enter__(self):
+        if self._data is None:
+            self.parse()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def entries(self) -> PackIndexEntries:
+        return PackIndexEntries(self)
+
+    @property
+    def packfile_sha1(self) -> bytes:
+        return self._data[-40:-20]
+
+    def sha1_at(self, i: int) -> bytes:
+        pos = self._sha1_pos + 20 * i
+        return self._data[pos:pos+20]
+
+    def crc32_at(self, i: int) -> int:
+        return struct.unpack_from('>I', self._data, self._crc32_pos + 4 * i)[0]
+
+    def offset_at(self, i: int) -> int:
+        offset = struct.unpack_from('>I', self._data, self._offset_pos + 4 * i)[0]
+        if offset & 0x80000000:
+            # 最高位为 1 时，低 31 位是大偏移量表 (8 Bytes) 中的下标
+            offset = struct.unpack_from('>Q', self._data, self._large_offset_pos + 8 * (offset & 0x7fffffff))[0]
+        return offset
+
+    def offsets(self) -> array:
+        # 批量解码整个偏移量表，再单独修正少量的大偏移量; 启用了元数据缓存时直接读取上次的结果
+        cache = get_metadata_cache()
+        if cache is not None:
+            cached = cache.load('idx-offsets', self.idx_file)
+            if cached is not None:
+                return cached[0]
+
+        start, end = self._offset_pos, self._large_offset_pos
+        offsets = array('I', self._data[start:end])
+        if sys.byteorder == 'little':
+            offsets.byteswap()
+        offsets = array('Q', offsets)
+        for i, offset in enumerate(offsets):
+            if offset & 0x80000000:
+                offsets[i] = self.offset_at(i)
+
+        if cache is not None:
+            cache.store('idx-offsets', self.idx_file, [offsets])
+        return offsets
+
+    def offset_order(self, offsets: Optional[array] = None) -> array:
+        # 对偏移数组做 argsort，得到按 pack 中物理顺序排列的 entry 下标 (只取决于 idx 文件，可以缓存)
+        cache = get_metadata_cache()
+        if cache is not None:
+            cached = cache.load('idx-order', self.idx_file)
+            if cached is not None:
+                return cached[0]
+
+        if offsets is None:
+            offsets = self.offsets()
+        order = array('I', sorted(range(self.total_objects), key=offsets.__getitem__))
+
+        if cache is not None:
+            cache.store('idx-order', self.idx_file, [order])
+        return order
+
+    def find_index(self, sha1: bytes) -> int:
+        # 用 fan-out 表确定首字节对应的区间 [lo, hi)，再直接在 SHA-1 表上二分查找
+        first = sha1[0]
+        lo = self.fanout_table[first - 1] if first > 0 else 0
+        hi = self.fanout_table[first]
+        data = self._data
+        base = self._sha1_pos
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = base + 20 * mid
+            cur = data[pos:pos+20]
+            if cur < sha1:
+                lo = mid + 1
+            elif cur > sha1:
+                hi = mid
+            else:
+                return mid
+        return -1
+
+    def find(self, sha1: bytes) -> Optional[PackIndexEntry]:
+        i = self.find_index(sha1)
+        return PackIndexEntry(self, i) if i >= 0 else None
+
+    def verify(self):
+        # 验证idx文件的SHA-1 (分块计算，避免复制整个文件)
+        data = self._data
+        end = len(data) - 20
+        h = hashlib.sha1()
+        for pos in range(0, end, self.HASH_CHUNK_SIZE):
+            h.update(data[pos:min(pos + self.HASH_CHUNK_SIZE, end)])
+        assert data[end:] == h.digest(), "idx file SHA-1 does not match, the file may be broken!"
+
+    def print(self, out: Optional[BinaryIO] = None):
+        if out is None:
+            with stdout_writer() as out:
+                return self.print(out)
+
+        out.write(b'Object counts: %d\n' % self.total_objects)
+        offsets = self.offsets()
+        order = self.offset_order(offsets)
+        sha1_at = self.sha1_at
+        for lo in range(0, len(order), OUTPUT_BATCH_SIZE):
+            out.write(b''.join([
+                b'%s %d\n' % (hexlify(sha1_at(i)), offsets[i])
+                for i in order[lo:lo+OUTPUT_BATCH_SIZE]
+            ]))
+
+
+class DeltaBaseCache:
+    """按 (pack, 偏移) 缓存已解压的对象，LRU 淘汰，总字节数不超过 limit (对应 core.deltaBaseCacheLimit)，
+    可以由多个 GitPack 共用"""
+
+    DEFAULT_LIMIT = 96 * 1024 * 1024
+
+    def __init__(self, limit: int = DEFAULT_LIMIT):
+        self.limit = limit
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items: OrderedDict[Hashable, Tuple[int, bytes]] = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key: Hashable) -> Optional[Tuple[int, bytes]]:
+        item = self._items.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return item
+
+    def put(self, key: Hashable, obj_type: int, data: bytes):
+        if key in self._items:
+            self._items.move_to_end(key)
+            return
+        if len(data) > self.limit:
+            return
+        self._items[key] = (obj_type, data)
+        self.size += len(data)
+        while self.size > self.limit:
+            _, (_, evicted) = self._items.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def clear(self):
+        self._items.clear()
+        self.size = 0
+
+    def __repr__(self):
+        return (f"DeltaBaseCache(objects={len(self)}, size={self.size}/{self.limit}, "
+                f"hits={self.hits}, misses={self.misses}, evictions={self.evictions})")
+
+
+class GitPack:
+    """读取 .pack 文件中的单个对象 (按 idx 中的偏移定位，只解压目标对象及其 delta 链)"""
+
+    PACK_SIGNATURE = b'PACK'
+
+    OBJ_COMMIT = 1
+    OBJ_TREE = 2
+    OBJ_BLOB = 3
+    OBJ_TAG = 4
+    OBJ_OFS_DELTA = 6
+    OBJ_REF_DELTA = 7
+
+    TYPE_NAMES = {OBJ_COMMIT: 'commit', OBJ_TREE: 'tree', OBJ_BLOB: 'blob', OBJ_TAG: 'tag'}
+
+    INFLATE_CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, pack_file: Path, pack_index: GitPackIndex, cache: Optional[DeltaBaseCache] = None):
+        self.pack_file = pack_file
+        self.pack_index = pack_index
+        self.cache = cache if cache is not None else DeltaBaseCache()
+        self._cache_id = pack_file.name
+        self._fp = None
+        self._data = None
+
+    def open(self):
+        if self._data is not None:
+            return
+        self._fp = open(self.pack_file, 'rb')
+        self._data = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+        assert self._data[0:4] == self.PACK_SIGNATURE, f"Not a pack file: {self.pack_file}"
+        version = struct.unpack('>I', self._data[4:8])[0]
+        assert version in (2, 3), f"Unsupported pack version: {version}"
+
+    def close(self):
+        if self._data is not None:
+            self._data.close()
+            self._fp.close()
+        self._data = None
+        self._fp = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def read_object(self, sha1: bytes) -> Optional[Tuple[str, bytes]]:
+        entry = self.pack_index.find(sha1)
+        if entry is None:
+            return None
+        return self.read_object_at(entry.offset)
+
+    def stream_object(self, sha1: bytes) -> Optional[Tuple[str, int, Iterator[bytes]]]:
+        entry = self.pack_index.find(sha1)
+        if entry is None:
+            return None
+        return self.stream_object_at(entry.offset)
+
+    def stream_object_at(self, offset: int) -> Tuple[str, int, Iterator[bytes]]:
+        # 非 delta 对象直接分块解压; delta 对象需要完整的 base，只能整体还原
+        self.open()
+        obj_type, size, pos = self._read_object_header(offset)
+        if obj_type < self.OBJ_OFS_DELTA:
+            return self.TYPE_NAMES[obj_type], size, self._iter_inflate(pos)
+        type_name, data = self.read_object_at(offset)
+        return type_name, len(data), iter((data,))
+
+    def object_info_at(self, offset: int) -> Tuple[str, int]:
+        # 只读取对象头部得到类型和大小: delta 对象沿链找到 base 的类型，大小取自 delta 数据开头的 result_size
+        self.open()
+        obj_type, size, pos = self._read_object_header(offset)
+        if obj_type < self.OBJ_OFS_DELTA:
+            return self.TYPE_NAMES[obj_type], size
+
+        if obj_type == self.OBJ_OFS_DELTA:
+            delta_pos = self._read_ofs_delta_offset(offset, pos)[1]
+        else:
+            delta_pos = pos + 20
+        # 两个变长整数最多 20 字节; 压缩数据取 1KB 足以覆盖动态 Huffman 块的头部
+        delta_head = zlib.decompressobj().decompress(self._data[delta_pos:delta_pos+1024], 32)
+        _, head_pos = _read_delta_size(delta_head, 0)
+        result_size, _ = _read_delta_size(delta_head, head_pos)
+
+        while obj_type >= self.OBJ_OFS_DELTA:
+            if obj_type == self.OBJ_OFS_DELTA:
+                offset, _ = self._read_ofs_delta_offset(offset, pos)
+            else:
+                base_entry = self.pack_index.find(self._data[pos:pos+20])
+                assert base_entry is not None, f"Cannot find delta base of object at {offset} in {self.pack_file}"
+                offset = base_entry.offset
+            obj_type, _, pos = self._read_object_header(offset)
+        return self.TYPE_NAMES[obj_type], result_size
+
+    def read_object_at(self, offset: int) -> Tuple[str, bytes]:
+        self.open()
+
+        # 1. 沿着 delta 链找到 base 对象 (或缓存中已解压的中间结果)，记录沿途的 delta
+        cache = self.cache
+        deltas = []
+        while True:
+            cached = cache.get((self._cache_id, offset))
+            if cached is not None:
+                obj_type, data = cached
+                break
+            obj_type, size, pos = self._read_object_header(offset)
+            if obj_type == self.OBJ_OFS_DELTA:
+                base_offset, pos = self._read_ofs_delta_offset(offset, pos)
+                deltas.append((offset, pos))
+                offset = base_offset
+            elif obj_type == self.OBJ_REF_DELTA:
+                base_sha1 = bytes(self._data[pos:pos+20])
+                deltas.append((offset, pos + 20))
+                base_entry = self.pack_index.find(base_sha1)
+                assert base_entry is not None, f"Cannot find delta base {base_sha1.hex()} in {self.pack_file}"
+                offset = base_entry.offset
+            else:
+                data = self._inflate(pos, size)
+                break
+
+        # 2. 由近到远依次应用 delta，沿途的 base 放入缓存
+        for delta_offset, delta_pos in reversed(deltas):
+            cache.put((self._cache_id, offset), obj_type, data)
+            data = apply_delta(data, self._inflate(delta_pos))
+            offset = delta_offset
+
+        return self.TYPE_NAMES[obj_type], data
+
+    def _read_object_header(self, offset: int) -> Tuple[int, int, int]:
+        # type(3 bit) + size(变长编码，首字节 4 bit，之后每字节 7 bit)
+        data = self._data
+        c = data[offset]
+        obj_type = (c >> 4) & 0x7
+        size = c & 0x0f
+        shift = 4
+        pos = offset + 1
+        while c & 0x80:
+            c = data[pos]
+            size |= (c & 0x7f) << shift
+            shift += 7
+            pos += 1
+        return obj_type, size, pos
+
+    def _read_ofs_delta_offset(self, offset: int, pos: int) -> Tuple[int, int]:
+        # OFS_DELTA 的 base 偏移采用 "每字节 +1" 的大端变长编码，相对于当前对象起点
+        data = self._data
+        c = data[pos]
+        pos += 1
+        rel = c & 0x7f
+        while c & 0x80:
+            c = data[pos]
+            pos += 1
+            rel = ((rel + 1) << 7) | (c & 0x7f)
+        return offset - rel, pos
+
+    def _inflate(self, pos: int, size: int = -1) -> bytes:
+        data = b''.join(self._iter_inflate(pos))
+        assert size < 0 or len(data) == size, f"Object size mismatch at {pos} in {self.pack_file}"
+        return data
+
+    def _iter_inflate(self, pos: int) -> Iterator[bytes]:
+        # 每次输出不超过 INFLATE_CHUNK_SIZE 字节，解压大对象时内存占用恒定
+        decomp = zlib.decompressobj()
+        while not decomp.eof:
+            chunk = decomp.unconsumed_tail
+            if not chunk:
+                chunk = self._data[pos:pos+self.INFLATE_CHUNK_SIZE]
+                assert chunk, f"Unexpected end of pack file: {self.pack_file}"
+                pos += len(chunk)
+            out = decomp.decompress(chunk, self.INFLATE_CHUNK_SIZE)
+            if out:
+                yield out
+
+
+def _read_delta_size(delta: bytes, pos: int) -> Tuple[int, int]:
+    size = 0
+    shift = 0
+    while True:
+        c = delta[pos]
+        pos += 1
+        size |= (c & 0x7f) << shift
+        shift += 7
+        if not c & 0x80:
+            return size, pos
+
+
+def apply_delta(base: bytes, delta: bytes) -> bytes:
+    # delta 格式: base_size, result_size, 之后是 copy / insert 指令 (patch-delta.c)
+    base_size, pos = _read_delta_size(delta, 0)
+    result_size, pos = _read_delta_size(delta, pos)
+    assert base_size == len(base), "Delta base size mismatch"
+
+    out = bytearray()
+    n = len(delta)
+    while pos < n:
+        op = delta[pos]
+        pos += 1
+        if op & 0x80:
+            # copy: 低 4 bit 指示 offset 字节，接下来 3 bit 指示 size 字节
+            cp_off = 0
+            for i in range(4):
+                if op & (1 << i):
+                    cp_off |= delta[pos] << (8 * i)
+                    pos += 1
+            cp_size = 0
+            for i in range(3):
+                if op & (1 << (4 + i)):
+                    cp_size |= delta[pos] << (8 * i)
+                    pos += 1
+            if cp_size == 0:
+                cp_size = 0x10000
+            out += base[cp_off:cp_off+cp_size]
+        elif op:
+            # insert: 直接插入接下来的 op 个字节
+            out += delta[pos:pos+op]
+            pos += op
+        else:
+            raise ValueError("Unexpected delta opcode 0")
+
+    assert len(out) == result_size, "Delta result size mismatch"
+    return bytes(out)
@@ -0,0 +1,560 @@
+from array import array
+import heapq
+import mmap
+import os
+from pathlib import Path
+import struct
+from typing import Iterator, List, Optional, Tuple
+
+from tig.core.cache import get_metadata_cache, stat_key
+from tig.core.object_database import is_object_name
+
+# 后端中保存的 ref: (sha1, 剥离后的 sha1, 符号引用的目标)，符号引用的 sha1 为 None。
+# 剥离后的 sha1 为 None 表示不知道; 已知不是标签时等于 sha1 本身
+RawRef = Tuple[Optional[str], Optional[str], Optional[str]]
+
+# 解析后的 ref: (ref 名称, sha1, 剥离后的 sha1)
+Ref = Tuple[str, str, Optional[str]]
+
+SYMREF_MAXDEPTH = 5
+
+# 每个 worktree 各自一份的 ref (refs.c 中的 is_per_worktree_ref)
+PER_WORKTREE_PREFIXES = ('refs/bisect/', 'refs/worktree/', 'refs/rewritten/')
+
+
+def _merge_sorted(streams: List[Iterator[Tuple[str, RawRef]]]) -> Iterator[Tuple[str, RawRef]]:
+    # 多个按名称排序的流合并成一个，同名的 ref 取排在前面的流中的值
+    if len(streams) == 1:
+        yield from streams[0]
+        return
+
+    def tagged(k, stream):
+        for name, raw in stream:
+            yield name, k, raw
+
+    last = None
+    for name, _, raw in heapq.merge(*(tagged(k, stream) for k, stream in enumerate(streams))):
+        if name != last:
+            last = name
+            yield name, raw
+
+
+class PackedRefs:
+    """packed-refs 文件。mmap 后直接在有序的记录上二分查找，不把 500k 个 ref 全部读进字典。
+    记录格式为 "<sha1> <名称>\\n"，附注标签后面跟一行 "^<剥离后的 sha1>\\n"。
+    文件头没有声明 sorted 时 (很旧的 git 写的) 先在内存中排好序，与 packed-backend.c 一致"""
+
+    HEADER_PREFIX = b'# pack-refs with:'
+    SCAN_CHUNK_SIZE = 1 << 20
+
+    def __init__(self, packed_refs_file: Path):
+        self.packed_refs_file = packed_refs_file
+        self.traits = set()
+        self._data = b''
+        self._map = None
+        self._start = 0
+
+    def parse(self):
+        with open(self.packed_refs_file, 'rb') as fp:
+            if os.fstat(fp.fileno()).st_size > 0:
+                self._map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        data = self._map if self._map is not None else b''
+
+        if data[:len(self.HEADER_PREFIX)] == self.HEADER_PREFIX:
+            eol = data.find(b'\n')
+            eol = len(data) if eol < 0 else eol + 1
+            self.traits = set(data[len(self.HEADER_PREFIX):eol].split())
+            self._start = eol
+        self._data = data
+
+        if b'sorted' not in self.traits:
+            # 排好序的内容可以放进元数据缓存，下次直接使用
+            cache = get_metadata_cache()
+            cached = cache.load('packed-refs', self.packed_refs_file) if cache is not None else None
+            if cached is not None:
+                self._data = cached[0].tobytes()
+                self._start = 0
+                return
+
+            records = []
+            pos = self._start
+            while pos < len(data):
+                end = self._record_end(pos)
+                records.append((self._name_at(pos), data[pos:end].rstrip(b'\n') + b'\n'))
+                pos = end
+            records.sort(key=lambda record: record[0])
+            self._data = b''.join(record for _, record in records)
+            self._start = 0
+            if cache is not None:
+                cache.store('packed-refs', self.packed_refs_file, [array('B', self._data)])
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self._map = None
+        self._data = b''
+
+    def __enter__(self):
+        self.parse()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _line_end(self, pos: int) -> int:
+        eol = self._data.find(b'\n', pos)
+        return len(self._data) if eol < 0 else eol
+
+    def _record_start(self, pos: int) -> int:
+        # pos 所在记录的起始位置，落在 "^" 行上时退回到它所属的记录
+        data = self._data
+        start = data.rfind(b'\n', self._start, pos) + 1
+        start = max(start, self._start)
+        if data[start:start+1] == b'^':
+            start = max(data.rfind(b'\n', self._start, start - 1) + 1, self._start)
+        return start
+
+    def _record_end(self, start: int) -> int:
+        # 下一条记录的起始位置 (跳过 "^" 行)
+        data = self._data
+        end = self._line_end(start) + 1
+        if data[end:end+1] == b'^':
+            end = self._line_end(end) + 1
+        return min(end, len(data))
+
+    def _name_at(self, start: int) -> bytes:
+        return self._data[start+41:self._line_end(start)]
+
+    def _peeled_default(self, name: bytes, sha1: str) -> Optional[str]:
+        # 没有 "^" 行时: fully-peeled 表示所有 ref 都不是标签，peeled 只保证 refs/tags/ 下的
+        if b'fully-peeled' in self.traits or (b'peeled' in self.traits and name.startswith(b'refs/tags/')):
+            return sha1
+        return None
+
+    def _record_at(self, start: int) -> Tuple[bytes, RawRef]:
+        data = self._data
+        eol = self._line_end(start)
+        name = data[start+41:eol]
+        sha1 = data[start:start+40].decode()
+        if data[eol+1:eol+2] == b'^':
+            peeled = data[eol+2:eol+42].decode()
+        else:
+            peeled = self._peeled_default(name, sha1)
+        return name, (sha1, peeled, None)
+
+    def _find(self, name: bytes) -> int:
+        # 第一条名称 >= name 的记录的起始位置 (find_reference_location)
+        lo, hi = self._start, len(self._data)
+        while lo < hi:
+            mid = self._record_start((lo + hi) // 2)
+            if self._name_at(mid) < name:
+                lo = self._record_end(mid)
+            else:
+                hi = mid
+        return lo
+
+    def lookup(self, refname: str) -> Optional[RawRef]:
+        name = refname.encode()
+        pos = self._find(name)
+        if pos >= len(self._data):
+            return None
+        record_name, raw = self._record_at(pos)
+        return raw if record_name == name else None
+
+    def iter_prefix(self, prefix: str = '') -> Iterator[Tuple[str, RawRef]]:
+        # 二分找到前缀范围的两端 (UTF-8 中不会出现 0xff)，中间的记录按块切出来整块拆行，
+        # 不逐条查找行尾
+        prefix_bytes = prefix.encode()
+        pos = self._find(prefix_bytes)
+        end = self._find(prefix_bytes + b'\xff') if prefix_bytes else len(self._data)
+        while pos < end:
+            chunk_end = self._record_start(pos + self.SCAN_CHUNK_SIZE) if pos + self.SCAN_CHUNK_SIZE < end else end
+            if chunk_end <= pos:
+                chunk_end = self._record_end(pos)
+            lines = self._data[pos:chunk_end].split(b'\n')
+            pos = chunk_end
+            n = len(lines)
+            k = 0
+            while k < n:
+                line = lines[k]
+                k += 1
+                if not line:
+                    continue
+                name = line[41:]
+                sha1 = line[:40].decode()
+                if k < n and lines[k][:1] == b'^':
+                    peeled = lines[k][1:41].decode()
+                    k += 1
+                else:
+                    peeled = self._peeled_default(name, sha1)
+                yield name.decode(), (sha1, peeled, None)
+
+
+class FilesRefBackend:
+    """默认的 ref 存储: $GIT_DIR 下的松散 ref 文件加上 packed-refs，松散 ref 覆盖 packed-refs 中的同名项。
+    packed-refs 的 mmap 在多次查询之间保留，文件的 stat 变化时才重新打开。
+    在 worktree 中，HEAD 和 PER_WORKTREE_PREFIXES 下的 ref 在 worktree 自己的 git_dir 中，其余的在 common_dir 中"""
+
+    def __init__(self, git_dir: Path, common_dir: Optional[Path] = None):
+        self.git_dir = git_dir
+        self.common_dir = common_dir or git_dir
+        self._packed: Optional[PackedRefs] = None
+        self._packed_stat = None
+
+    def packed_refs(self) -> Optional[PackedRefs]:
+        packed_file = self.common_dir / 'packed-refs'
+        packed_stat = stat_key(packed_file)
+        if packed_stat != self._packed_stat:
+            if self._packed is not None:
+                self._packed.close()
+            self._packed = None
+            self._packed_stat = packed_stat
+            if packed_stat is not None:
+                self._packed = PackedRefs(packed_file)
+                self._packed.parse()
+        return self._packed
+
+    @staticmethod
+    def _read_loose_file(path) -> Optional[RawRef]:
+        try:
+            with open(path, 'rb') as fp:
+                content = fp.read().strip()
+        except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+            return None
+        if content.startswith(b'ref: '):
+            return None, None, content[5:].strip().decode()
+        value = content.decode(errors='replace')
+        # 内容不是 sha1 的文件是损坏的 ref，与 git 一样忽略
+        return (value, None, None) if is_object_name(value) else None
+
+    def _ref_dir(self, refname: str) -> Path:
+        if not refname.startswith('refs/') or refname.startswith(PER_WORKTREE_PREFIXES):
+            return self.git_dir
+        return self.common_dir
+
+    def read(self, refname: str) -> Optional[RawRef]:
+        raw = self._read_loose_file(self._ref_dir(refname) / refname)
+        if raw is not None:
+            return raw
+        packed = self.packed_refs()
+        return packed.lookup(refname) if packed is not None else None
+
+    def _scan_loose(self, base_dir: Path, dir_path: str, prefix: str, refs: List[Tuple[str, RawRef]]):
+        # 递归遍历 refs/ 目录，dir_path 是相对 base_dir 的 "refs/heads/" 形式
+        try:
+            it = os.scandir(base_dir / dir_path)
+        except (FileNotFoundError, NotADirectoryError):
+            return
+        with it:
+            for entry in it:
+                name = dir_path + entry.name
+                if not (name.startswith(prefix) or prefix.startswith(name + '/')):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    self._scan_loose(base_dir, name + '/', prefix, refs)
+                elif entry.name.endswith('.lock'):
+                    continue
+                elif name.startswith(prefix):
+                    raw = self._read_loose_file(entry.path)
+                    if raw is not None:
+                        refs.append((name, raw))
+
+    def iter_prefix(self, prefix: str = 'refs/') -> Iterator[Tuple[str, RawRef]]:
+        # 从前缀中最深的完整目录开始遍历，不扫描无关的目录
+        loose: List[Tuple[str, RawRef]] = []
+        self._scan_loose(self.common_dir, prefix[:prefix.rfind('/')+1], prefix, loose)
+        if self.git_dir != self.common_dir:
+            loose = [item for item in loose if not item[0].startswith(PER_WORKTREE_PREFIXES)]
+            for worktree_prefix in PER_WORKTREE_PREFIXES:
+                if worktree_prefix.startswith(prefix) or prefix.startswith(worktree_prefix):
+                    longer = max(prefix, worktree_prefix, key=len)
+                    self._scan_loose(self.git_dir, longer[:longer.rfind('/')+1], longer, loose)
+        loose.sort(key=lambda item: item[0])
+        packed = self.packed_refs()
+        streams = [iter(loose)] if loose else []
+        if packed is not None:
+            streams.append(packed.iter_prefix(prefix))
+        return _merge_sorted(streams)
+
+    def close(self):
+        if self._packed is not None:
+            self._packed.close()
+        self._packed = None
+        self._packed_stat = None
+
+
+def _read_varint(data, pos: int) -> Tuple[int, int]:
+    # 与 pack 中 OFS_DELTA 偏移相同的变长整数 (reftable/basics.c get_var_int)
+    c = data[pos]
+    value = c & 0x7f
+    while c & 0x80:
+        pos += 1
+        c = data[pos]
+        value = ((value + 1) << 7) | (c & 0x7f)
+    return value, pos + 1
+
+
+class Reftable:
+    """单个 reftable 文件 (version 1/2, SHA-1)，只读取其中的 ref 块。
+    ref 块内的记录做了前缀压缩，每隔若干条有一个 restart 点 (不压缩的完整名称)，
+    查找时先按各块的第一个名称二分到块，再在块内的 restart 点上二分"""
+
+    MAGIC = b'REFT'
+    BLOCK_TYPE_REF = ord('r')
+    HEADER_SIZES = {1: 24, 2: 28}
+    FOOTER_EXTRA_SIZE = 5 * 8 + 4 # 5 个 uint64 位置 + CRC-32
+
+    VALUE_DELETION = 0
+    VALUE_SHA1 = 1
+    VALUE_SHA1_PEELED = 2
+    VALUE_SYMREF = 3
+
+    def __init__(self, table_file: Path):
+        self.table_file = table_file
+        self.block_size = 0
+        self._data = None
+        self._header_size = 0
+        self._blocks: List[int] = []
+        self._first_names: List[bytes] = []
+
+    def parse(self):
+        with open(self.table_file, 'rb') as fp:
+            data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self._data = data
+
+        # 1. 文件头: 'REFT', version, block_size (uint24), min/max update_index; v2 还有 hash_id
+        assert data[0:4] == self.MAGIC, f"Not a reftable: {self.table_file}"
+        version = data[4]
+        assert version in self.HEADER_SIZES, f"Unsupported reftable version: {version}"
+        self._header_size = self.HEADER_SIZES[version]
+        self.block_size = int.from_bytes(data[5:8], 'big')
+        if version == 2:
+            assert data[24:28] == b'sha1', f"Unsupported reftable hash: {data[24:28]!r}"
+
+        # 2. 文件尾: 文件头的副本之后是各个段的位置，ref 块一直持续到第一个非 0 的段位置
+        footer_pos = len(data) - self._header_size - self.FOOTER_EXTRA_SIZE
+        assert footer_pos >= self._header_size, f"Truncated reftable: {self.table_file}"
+        ref_index_pos, obj_pos, obj_index_pos, log_pos, log_index_pos = struct.unpack_from(
+            '>5Q', data, footer_pos + self._header_size)
+        ref_end = min([pos for pos in (ref_index_pos, obj_pos >> 5, obj_index_pos, log_pos, log_index_pos) if pos] + [footer_pos])
+
+        # 3. 定位每个 ref 块 (只读块头)，并记下各块第一条记录的名称
+        self._blocks = []
+        self._first_names = []
+        block_pos = 0
+        while block_pos < ref_end:
+            header_pos = block_pos + (self._header_size if block_pos == 0 else 0)
+            if data[header_pos] != self.BLOCK_TYPE_REF:
+                break
+            block_len = int.from_bytes(data[header_pos+1:header_pos+4], 'big')
+            self._blocks.append(block_pos)
+            self._first_names.append(self._record_at(header_pos + 4, b'')[0])
+            next_pos = block_pos + block_len
+            # 块被 0 填充到 block_size
+            if self.block_size and next_pos < ref_end and data[next_pos] == 0:
+                next_pos = block_pos + self.block_size
+            block_pos = next_pos
+
+    def close(self):
+        if self._data is not None:
+            self._data.close()
+        self._data = None
+
+    def __enter__(self):
+        self.parse()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _block_bounds(self, block_pos: int) -> Tuple[int, int, List[int]]:
+        # 返回 (第一条记录的位置, restart 表的位置, restart 点列表)，restart 偏移相对块的起始位置 (第一个块包含文件头)
+        data = self._data
+        header_pos = block_pos + (self._header_size if block_pos == 0 else 0)
+        block_len = int.from_bytes(data[header_pos+1:header_pos+4], 'big')
+        block_end = block_pos + block_len
+        restart_count = struct.unpack_from('>H', data, block_end - 2)[0]
+        restart_table = block_end - 2 - 3 * restart_count
+        restarts = [block_pos + int.from_bytes(data[pos:pos+3], 'big') for pos in range(restart_table, block_end - 2, 3)]
+        return header_pos + 4, restart_table, restarts
+
+    def _record_at(self, pos: int, prev_name: bytes) -> Tuple[bytes, RawRef, int]:
+        data = self._data
+        prefix_len, pos = _read_varint(data, pos)
+        suffix_and_type, pos = _read_varint(data, pos)
+        suffix_len, value_type = suffix_and_type >> 3, suffix_and_type & 0x7
+        name = prev_name[:prefix_len] + data[pos:pos+suffix_len]
+        pos += suffix_len
+        _, pos = _read_varint(data, pos) # update_index_delta
+
+        raw: Optional[RawRef] = None
+        if value_type == self.VALUE_SHA1:
+            sha1 = data[pos:pos+20].hex()
+            # reftable 总会为标签写入剥离后的值，只有一个值的 ref 不是标签
+            raw = sha1, sha1, None
+            pos += 20
+        elif value_type == self.VALUE_SHA1_PEELED:
+            raw = data[pos:pos+20].hex(), data[pos+20:pos+40].hex(), None
+            pos += 40
+        elif value_type == self.VALUE_SYMREF:
+            target_len, pos = _read_varint(data, pos)
+            raw = None, None, data[pos:pos+target_len].decode()
+            pos += target_len
+        else:
+            assert value_type == self.VALUE_DELETION, f"Bad reftable value type {value_type} in {self.table_file}"
+        return name, raw, pos
+
+    def _iter_block(self, block_pos: int, name: bytes = b'') -> Iterator[Tuple[bytes, Optional[RawRef]]]:
+        # 从块中第一条名称 >= name 的 restart 点之前的那个 restart 点开始顺序读取
+        pos, restart_table, restarts = self._block_bounds(block_pos)
+        if name and restarts:
+            lo, hi = 0, len(restarts)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self._record_at(restarts[mid], b'')[0] <= name:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            if lo > 0:
+                pos = restarts[lo - 1]
+        prev_name = b''
+        while pos < restart_table:
+            prev_name, raw, pos = self._record_at(pos, prev_name)
+            yield prev_name, raw
+
+    def _seek_block(self, name: bytes) -> int:
+        # 最后一个第一条名称 <= name 的块
+        lo, hi = 0, len(self._first_names)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._first_names[mid] <= name:
+                lo = mid + 1
+            else:
+                hi = mid
+        return max(lo - 1, 0)
+
+    def iter_prefix(self, prefix: str = '') -> Iterator[Tuple[str, Optional[RawRef]]]:
+        # 删除记录的值为 None，由 ReftableStack 用来遮盖旧表中的同名 ref
+        prefix_bytes = prefix.encode()
+        if not self._blocks:
+            return
+        first = self._seek_block(prefix_bytes)
+        for k in range(first, len(self._blocks)):
+            for name, raw in self._iter_block(self._blocks[k], prefix_bytes if k == first else b''):
+                if name < prefix_bytes:
+                    continue
+                if not name.startswith(prefix_bytes):
+                    return
+                yield name.decode(), raw
+
+    def lookup(self, refname: str) -> Tuple[bool, Optional[RawRef]]:
+        # (是否有这条记录, 值)，删除记录返回 (True, None)
+        name = refname.encode()
+        if not self._blocks:
+            return False, None
+        for record_name, raw in self._iter_block(self._blocks[self._seek_block(name)], name):
+            if record_name == name:
+                return True, raw
+            if record_name > name:
+                break
+        return False, None
+
+
+class ReftableStack:
+    """$GIT_DIR/reftable/ 中的一组 reftable，tables.list 按从旧到新的顺序列出，新表中的记录覆盖旧表。
+    tables.list 的 stat 变化时 (有新的写入或压缩) 才重新打开"""
+
+    def __init__(self, reftable_dir: Path):
+        self.reftable_dir = reftable_dir
+        self._tables: List[Reftable] = []
+        self._list_stat = None
+
+    def tables(self) -> List[Reftable]:
+        list_file = self.reftable_dir / 'tables.list'
+        list_stat = stat_key(list_file)
+        if list_stat != self._list_stat:
+            self.close()
+            self._list_stat = list_stat
+            names = list_file.read_text().split() if list_stat is not None else []
+            for name in reversed(names):
+                table = Reftable(self.reftable_dir / name)
+                table.parse()
+                self._tables.append(table)
+        return self._tables
+
+    def read(self, refname: str) -> Optional[RawRef]:
+        for table in self.tables():
+            found, raw = table.lookup(refname)
+            if found:
+                return raw
+        return None
+
+    def iter_prefix(self, prefix: str = 'refs/') -> Iterator[Tuple[str, RawRef]]:
+        for name, raw in _merge_sorted([table.iter_prefix(prefix) for table in self.tables()]):
+            if raw is not None:
+                yield name, raw
+
+    def close(self):
+        for table in self._tables:
+            table.close()
+        self._tables = []
+        self._list_stat = None
+
+
+class RefStore:
+    """仓库中所有 ref 的统一入口，根据 $GIT_DIR/reftable 是否存在选择后端。
+    符号引用最多跟随 SYMREF_MAXDEPTH 层，名称都是完整的 ref 名称 (refs/heads/main、HEAD)"""
+
+    def __init__(self, git_dir: Path, common_dir: Optional[Path] = None):
+        self.git_dir = git_dir
+        self.common_dir = common_dir or git_dir
+        if (self.common_dir / 'reftable' / 'tables.list').exists():
+            self.backend = ReftableStack(self.common_dir / 'reftable')
+        else:
+            self.backend = FilesRefBackend(git_dir, self.common_dir)
+
+    def read_raw(self, refname: str) -> Optional[RawRef]:
+        if not refname or '..' in refname or refname.startswith('/'):
+            return None
+        return self.backend.read(refname)
+
+    def _follow(self, raw: Optional[RawRef]) -> Optional[Tuple[str, Optional[str]]]:
+        # 沿符号引用链找到最终的 (sha1, 剥离后的 sha1)，链太长或者目标不存在时返回 None
+        for _ in range(SYMREF_MAXDEPTH + 1):
+            if raw is None:
+                return None
+            sha1, peeled, target = raw
+            if target is None:
+                return sha1, peeled
+            raw = self.read_raw(target)
+        return None
+
+    def resolve(self, refname: str) -> Optional[str]:
+        resolved = self._follow(self.read_raw(refname))
+        return resolved[0] if resolved is not None else None
+
+    def symref_target(self, refname: str) -> Optional[str]:
+        # 只解析一层，例如 HEAD -> refs/heads/main
+        raw = self.read_raw(refname)
+        return raw[2] if raw is not None else None
+
+    def peeled(self, refname: str) -> Optional[str]:
+        # packed-refs / reftable 中记录的剥离后的 sha1，不读取对象
+        resolved = self._follow(self.read_raw(refname))
+        return resolved[1] if resolved is not None else None
+
+    def iter_refs(self, prefix: str = 'refs/') -> Iterator[Ref]:
+        """按名称排序返回所有以 prefix 开头的 ref，符号引用解析为目标的值，悬空的符号引用被跳过"""
+        for name, raw in self.backend.iter_prefix(prefix):
+            resolved = self._follow(raw)
+            if resolved is not None:
+                yield name, resolved[0], resolved[1]
+
+    def close(self):
+        self.backend.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,15 +1,102 @@
-
+import os
 from pathlib import Path
-from typing import Optional
-
-
-def get_repo_root(path: Path = None) -> Optional[Path]:
-    if path is None:
-        path = Path.cwd()
-    
-    while path != path.parent:
-        if (path / '.git').exists():
-            return path
-        path = path.parent
-    
-    return None
+from typing import List, Optional
+
+
+def read_gitfile(path: Path) -> Optional[Path]:
+    # 子模块和 git worktree 中的 .git 是文件，内容为 "gitdir: <路径>"，相对路径相对于文件所在目录
+    try:
+        content = path.read_text().strip()
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        return None
+    assert content.startswith('gitdir: '), f"Invalid gitfile format: {path}"
+    git_dir = path.parent / content[8:].strip()
+    assert git_dir.is_dir(), f"Not a git repository: {git_dir}"
+    return git_dir
+
+
+def read_commondir(git_dir: Path) -> Path:
+    # worktree 的私有目录中 commondir 文件指向主仓库的 .git，objects、refs、packed-refs 都在那里
+    try:
+        content = (git_dir / 'commondir').read_text().strip()
+    except FileNotFoundError:
+        return git_dir
+    return (git_dir / content).resolve()
+
+
+def is_git_directory(git_dir: Path) -> bool:
+    # 与 setup.c 的 is_git_directory 一致: 有 HEAD 文件，公共目录中有 objects 和 refs
+    common_dir = read_commondir(git_dir)
+    return (git_dir / 'HEAD').is_file() and (common_dir / 'objects').is_dir() and (common_dir / 'refs').is_dir()
+
+
+class Repository:
+    """一个仓库的各个目录: git_dir 中有 HEAD 和 index (worktree 中是 .git/worktrees/<名称>)，
+    common_dir 中有 objects、refs 和 packed-refs，work_tree 是工作区 (bare 仓库为 None)"""
+
+    def __init__(self, git_dir: Path, work_tree: Optional[Path] = None):
+        self.git_dir = git_dir
+        self.common_dir = read_commondir(git_dir)
+        self.work_tree = work_tree
+
+    @property
+    def objects_dir(self) -> Path:
+        return Path(os.environ.get('GIT_OBJECT_DIRECTORY') or self.common_dir / 'objects')
+
+    @property
+    def index_file(self) -> Path:
+        return Path(os.environ.get('GIT_INDEX_FILE') or self.git_dir / 'index')
+
+    @classmethod
+    def discover(cls, path: Optional[Path] = None) -> Optional['Repository']:
+        """与 git 一样查找仓库: 优先使用 GIT_DIR; 否则从 path 开始逐级向上查找 .git (目录或 gitfile)，
+        或者本身就是 bare 仓库的目录，不进入 GIT_CEILING_DIRECTORIES 中的目录及其上级"""
+        if path is None:
+            path = Path.cwd()
+        work_tree_env = os.environ.get('GIT_WORK_TREE')
+
+        git_dir_env = os.environ.get('GIT_DIR')
+        if git_dir_env:
+            git_dir = path / git_dir_env
+            if git_dir.is_file():
+                git_dir = read_gitfile(git_dir)
+            if not is_git_directory(git_dir):
+                return None
+            # 设置了 GIT_DIR 而没有设置 GIT_WORK_TREE 时，当前目录就是工作区
+            return cls(git_dir, Path(work_tree_env) if work_tree_env else path)
+
+        for current in cls._discovery_candidates(path):
+            dot_git = current / '.git'
+            git_dir = read_gitfile(dot_git) if dot_git.is_file() else dot_git
+            if git_dir is not None and is_git_directory(git_dir):
+                return cls(git_dir, Path(work_tree_env) if work_tree_env else current)
+            if is_git_directory(current):
+                return cls(current, Path(work_tree_env) if work_tree_env else None)
+        return None
+
+    @staticmethod
+    def _discovery_candidates(path: Path) -> List[Path]:
+        # 起始目录总会被检查，之后只检查比最长的上限目录更深的上级目录
+        ceilings = []
+        for ceiling in os.environ.get('GIT_CEILING_DIRECTORIES', '').split(os.pathsep):
+            if ceiling and os.path.isabs(ceiling):
+                ceilings.append(Path(os.path.realpath(ceiling)))
+        ceiling_depth = max((len(ceiling.parts) for ceiling in ceilings if ceiling in path.parents), default=0)
+
+        candidates = [path]
+        for parent in path.parents:
+            if len(parent.parts) <= ceiling_depth:
+                break
+            candidates.append(parent)
+        return candidates
+
+
+def get_repository(path: Optional[Path] = None) -> Repository:
+    repo = Repository.discover(path)
+    assert repo is not None, "Not a git repository (or any of the parent directories)"
+    return repo
+
+
+def get_repo_root(path: Optional[Path] = None) -> Optional[Path]:
+    repo = Repository.discover(path)
+    return repo.work_tree if repo is not None else None
@@ -0,0 +1,410 @@
+import heapq
+from itertools import count
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from tig.core.commit_graph import CommitGraph
+from tig.core.object_database import ObjectDatabase, is_object_name
+from tig.core.refs import RefStore
+from tig.core.tree import MODE_GITLINK, MODE_TREE
+
+# 不在 commit-graph 中的提交的 generation (与 git 一致)，比 graph 中任何提交的都大
+GENERATION_NUMBER_INFINITY = (1 << 63) - 1
+
+# 与 git 的 ref 简写规则一致，按顺序尝试
+REF_RULES = ('{}', 'refs/{}', 'refs/tags/{}', 'refs/heads/{}', 'refs/remotes/{}', 'refs/remotes/{}/HEAD')
+
+
+def resolve_revision(refs: RefStore, name: str) -> Optional[str]:
+    if is_object_name(name):
+        return name
+    for rule in REF_RULES:
+        sha1 = refs.resolve(rule.format(name))
+        if sha1 is not None:
+            return sha1
+    return None
+
+
+def peel_to_commit(odb: ObjectDatabase, file_hash: str, tags: Optional[List[Tuple[bytes, bytes]]] = None) -> Optional[str]:
+    # 附注标签指向的对象写在 "object <sha1>" 行中，可能嵌套多层; tags 不为 None 时收集经过的 (标签, 标签名)
+    while True:
+        info = odb.info(file_hash)
+        if info is None:
+            return None
+        if info[0] == 'commit':
+            return file_hash
+        if info[0] != 'tag':
+            return None
+        content = odb.read(file_hash)[1]
+        assert content.startswith(b'object '), f"Bad tag object: {file_hash}"
+        if tags is not None:
+            name_idx = content.find(b'\ntag ')
+            name = content[name_idx+5:content.index(b'\n', name_idx+5)] if name_idx >= 0 else b''
+            tags.append((bytes.fromhex(file_hash), name))
+        file_hash = content[7:47].decode()
+
+
+class Commit:
+    """遍历历史时需要的提交信息，parents 为 None 表示还没有解析; tree 只在需要时读取"""
+
+    __slots__ = ('sha1', 'graph_pos', 'parents', 'commit_time', 'tree', 'flags')
+
+    def __init__(self, sha1: bytes, graph_pos: int = -1):
+        self.sha1 = sha1
+        self.graph_pos = graph_pos
+        self.parents: Optional[Tuple['Commit', ...]] = None
+        self.commit_time = 0
+        self.tree: Optional[bytes] = None
+        self.flags = 0
+
+    def __repr__(self):
+        return f"Commit({self.sha1.hex()})"
+
+
+def parse_commit_header(content: bytes) -> Tuple[bytes, List[bytes], int]:
+    # 只读取头部中的 tree、parent 和 committer 时间 (committer 行的格式: name <email> timestamp tz)
+    assert content.startswith(b'tree '), "Bad commit object"
+    tree = bytes.fromhex(content[5:45].decode())
+    parents = []
+    commit_time = 0
+    for line in content[:content.find(b'\n\n')].split(b'\n'):
+        if line.startswith(b'parent '):
+            parents.append(bytes.fromhex(line[7:47].decode()))
+        elif line.startswith(b'committer '):
+            commit_time = int(line[line.rfind(b'>')+1:].split()[0])
+    return tree, parents, commit_time
+
+
+class CommitCache:
+    """按 sha1 (以及 commit-graph 下标) 缓存 Commit。
+    在 commit-graph 中的提交直接从 graph 读取父提交和时间，只有不在 graph 中的提交才需要解压"""
+
+    def __init__(self, odb: ObjectDatabase, graph: Optional[CommitGraph] = None):
+        self.odb = odb
+        self.graph = graph
+        self._by_sha1: Dict[bytes, Commit] = {}
+        self._by_pos: Dict[int, Commit] = {}
+        self.num_inflated = 0
+
+    def lookup(self, sha1: bytes) -> Commit:
+        commit = self._by_sha1.get(sha1)
+        if commit is None:
+            pos = self.graph.find(sha1) if self.graph is not None else -1
+            if pos >= 0:
+                return self.lookup_pos(pos)
+            commit = Commit(sha1)
+            self._by_sha1[sha1] = commit
+        return commit
+
+    def lookup_pos(self, pos: int) -> Commit:
+        commit = self._by_pos.get(pos)
+        if commit is None:
+            commit = Commit(self.graph.sha1_at(pos), pos)
+            self._by_pos[pos] = commit
+            self._by_sha1[commit.sha1] = commit
+        return commit
+
+    def parse(self, commit: Commit):
+        if commit.parents is not None:
+            return
+        if commit.graph_pos >= 0:
+            parents, commit.commit_time = self.graph.read_commit(commit.graph_pos)
+            commit.parents = tuple(self.lookup_pos(pos) for pos in parents)
+            return
+
+        obj = self.odb.read(commit.sha1.hex())
+        assert obj is not None, f"Cannot find commit: {commit.sha1.hex()}"
+        assert obj[0] == 'commit', f"Object {commit.sha1.hex()} is a {obj[0]}, not a commit"
+        self.num_inflated += 1
+        commit.tree, parents, commit.commit_time = parse_commit_header(obj[1])
+        commit.parents = tuple(self.lookup(sha1) for sha1 in parents)
+
+    def parents(self, commit: Commit) -> Tuple[Commit, ...]:
+        self.parse(commit)
+        return commit.parents
+
+    def tree(self, commit: Commit) -> bytes:
+        if commit.tree is None:
+            if commit.graph_pos >= 0:
+                commit.tree = self.graph.tree_at(commit.graph_pos)
+            else:
+                self.parse(commit)
+        return commit.tree
+
+    def generation(self, commit: Commit) -> int:
+        # commit-graph 包含其中所有提交的祖先，所以 graph 外的提交不可能是 graph 中提交的祖先
+        if commit.graph_pos >= 0:
+            return self.graph.generation(commit.graph_pos)
+        return GENERATION_NUMBER_INFINITY
+
+
+class RevisionWalker:
+    """按提交时间从新到旧遍历 include 可达、exclude 不可达的提交 (revision.c 中的 get_revision)。
+    没有 exclude 时边遍历边输出; 有 exclude 时需要先确定哪些提交不可达 (limit_list)"""
+
+    SEEN = 1 << 0
+    UNINTERESTING = 1 << 1
+
+    SLOP = 5 # 所有待处理的提交都不可达后，再多处理几个，以应对时间戳不准确的提交
+
+    def __init__(self, cache: CommitCache, first_parent: bool = False):
+        self.cache = cache
+        self.first_parent = first_parent
+        self._queue = []
+        self._counter = count()
+        self._starts: List[Commit] = []
+        self._interesting_cache: Optional[Commit] = None # 队列中的一个可达提交
+
+    def add(self, commit: Commit, exclude: bool = False):
+        if exclude:
+            commit.flags |= self.UNINTERESTING
+            self.cache.parse(commit)
+            self._mark_parents_uninteresting(commit)
+        self._starts.append(commit)
+
+    def _push(self, commit: Commit):
+        # 提交时间相同的按加入顺序出队 (与 commit_list_insert_by_date 一致)
+        heapq.heappush(self._queue, (-commit.commit_time, next(self._counter), commit))
+
+    def _pop(self) -> Commit:
+        return heapq.heappop(self._queue)[2]
+
+    def _mark_parents_uninteresting(self, commit: Commit):
+        # 只沿着已经解析过的提交向下标记
+        pending = [commit]
+        while pending:
+            for parent in pending.pop().parents or ():
+                if parent.flags & self.UNINTERESTING:
+                    continue
+                parent.flags |= self.UNINTERESTING
+                if parent.parents is not None:
+                    pending.append(parent)
+
+    def _process_parents(self, commit: Commit):
+        if commit.flags & self.UNINTERESTING:
+            # 不可达提交的所有父提交都不可达 (--first-parent 也不影响这一点)
+            for parent in commit.parents:
+                parent.flags |= self.UNINTERESTING
+                self.cache.parse(parent)
+                self._mark_parents_uninteresting(parent)
+                if not parent.flags & self.SEEN:
+                    parent.flags |= self.SEEN
+                    self._push(parent)
+            return
+
+        parents = commit.parents[:1] if self.first_parent else commit.parents
+        for parent in parents:
+            if not parent.flags & self.SEEN:
+                parent.flags |= self.SEEN
+                self.cache.parse(parent)
+                self._push(parent)
+
+    def _prepare(self) -> bool:
+        limited = False
+        for commit in self._starts:
+            limited |= bool(commit.flags & self.UNINTERESTING)
+            if not commit.flags & self.SEEN:
+                commit.flags |= self.SEEN
+                self.cache.parse(commit)
+                self._push(commit)
+        self._starts = []
+        return limited
+
+    def _everybody_uninteresting(self) -> bool:
+        cached = self._interesting_cache
+        if cached is not None and not cached.flags & self.UNINTERESTING:
+            return False
+        for item in self._queue:
+            if not item[2].flags & self.UNINTERESTING:
+                self._interesting_cache = item[2]
+                return False
+        return True
+
+    def _limit(self) -> List[Commit]:
+        result = []
+        slop = self.SLOP
+        while self._queue:
+            commit = self._pop()
+            if commit is self._interesting_cache:
+                self._interesting_cache = None
+            self._process_parents(commit)
+            if commit.flags & self.UNINTERESTING:
+                if not self._queue:
+                    break
+                if commit.commit_time <= -self._queue[0][0] or not self._everybody_uninteresting():
+                    slop = self.SLOP
+                else:
+                    slop -= 1
+                    if not slop:
+                        break
+                continue
+            result.append(commit)
+        # 时间戳不准确时，先输出的提交可能在后面才被标记为不可达
+        return [commit for commit in result if not commit.flags & self.UNINTERESTING]
+
+    def __iter__(self) -> Iterator[Commit]:
+        if self._prepare():
+            yield from self._limit()
+            return
+        while self._queue:
+            commit = self._pop()
+            self._process_parents(commit)
+            yield commit
+
+
+class ObjectWalker:
+    """rev-list --objects 中提交之后的 tree 和 blob (list-objects.c)。
+    每个对象只输出一次，已经输出或标记为不可达的子树不再展开; 每个 tree 只读取一次，不需要缓存解析结果"""
+
+    def __init__(self, odb: ObjectDatabase):
+        self.odb = odb
+        self.seen: Set[bytes] = set()
+
+    def _read_tree(self, sha1: bytes) -> bytes:
+        obj = self.odb.read(sha1.hex())
+        assert obj is not None, f"Cannot find tree: {sha1.hex()}"
+        assert obj[0] == 'tree', f"Object {sha1.hex()} is a {obj[0]}, not a tree"
+        return obj[1]
+
+    def _unseen_entries(self, sha1: bytes) -> Iterator[Tuple[bytes, bytes, bytes]]:
+        # 大部分 entry 在之前的提交中已经见过，先只切出 sha1 判断，没见过的才解析 mode 和名字，并标记为已见
+        content = self._read_tree(sha1)
+        seen = self.seen
+        i, n = 0, len(content)
+        while i < n:
+            null_idx = content.index(b'\x00', i)
+            entry_sha1 = content[null_idx+1:null_idx+21]
+            if entry_sha1 not in seen:
+                space_idx = content.index(b' ', i)
+                mode = content[i:space_idx]
+                if mode != MODE_GITLINK:
+                    seen.add(entry_sha1)
+                    yield mode, content[space_idx+1:null_idx], entry_sha1
+            i = null_idx + 21
+
+    def mark_uninteresting(self, sha1: bytes):
+        # mark_tree_uninteresting: tree 中的所有对象都不输出
+        if sha1 in self.seen:
+            return
+        self.seen.add(sha1)
+        pending = [sha1]
+        while pending:
+            for mode, _, entry_sha1 in self._unseen_entries(pending.pop()):
+                if mode == MODE_TREE:
+                    pending.append(entry_sha1)
+
+    def walk(self, sha1: bytes, path: bytes = b'') -> Iterator[Tuple[bytes, bytes]]:
+        # 先输出 tree 本身，再按 tree 中的顺序输出 entry，子树深度优先; 根 tree 的路径为空，子模块不输出
+        if sha1 in self.seen:
+            return
+        self.seen.add(sha1)
+        yield from self._walk(sha1, path)
+
+    def _walk(self, sha1: bytes, path: bytes) -> Iterator[Tuple[bytes, bytes]]:
+        yield sha1, path
+        base = path + b'/' if path else b''
+        for mode, name, entry_sha1 in self._unseen_entries(sha1):
+            if mode == MODE_TREE:
+                yield from self._walk(entry_sha1, base + name)
+            else:
+                yield entry_sha1, base + name
+
+
+def traverse_objects(cache: CommitCache, commits: Iterable[Commit],
+                     tags: Optional[List[Tuple[bytes, bytes]]] = None) -> Iterator[Tuple[bytes, Optional[bytes]]]:
+    """rev-list --objects 的输出 (traverse_commit_list): 先是所有提交 (名字为 None)，然后是起点中的标签，
+    最后按提交的顺序输出其 tree 中的对象。输出的提交的不可达父提交 (边界) 的 tree 事先整个标记为不可达"""
+    walker = ObjectWalker(cache.odb)
+    shown = []
+    for commit in commits:
+        shown.append(commit)
+        yield commit.sha1, None
+
+    for commit in shown:
+        for parent in commit.parents:
+            if parent.flags & RevisionWalker.UNINTERESTING:
+                walker.mark_uninteresting(cache.tree(parent))
+    for sha1, name in tags or []:
+        if sha1 not in walker.seen:
+            walker.seen.add(sha1)
+            yield sha1, name
+    for commit in shown:
+        yield from walker.walk(cache.tree(commit))
+
+
+def is_ancestor(cache: CommitCache, ancestor: Commit, descendant: Commit) -> bool:
+    """ancestor 是否可以从 descendant 沿父提交到达 (包括二者相同)，generation 小于 ancestor 的提交不再展开"""
+    min_generation = cache.generation(ancestor)
+    if cache.generation(descendant) < min_generation:
+        return False
+    stack = [descendant]
+    seen = {descendant}
+    while stack:
+        commit = stack.pop()
+        if commit is ancestor:
+            return True
+        for parent in cache.parents(commit):
+            if parent not in seen and cache.generation(parent) >= min_generation:
+                seen.add(parent)
+                stack.append(parent)
+    return False
+
+
+def merge_bases(cache: CommitCache, one: Commit, two: Commit) -> List[Commit]:
+    """one 和 two 的所有最佳公共祖先 (paint_down_to_common in commit-reach.c)"""
+    if one is two:
+        return [one]
+
+    PARENT1, PARENT2, STALE, RESULT = 1, 2, 4, 8
+    flags: Dict[Commit, int] = {}
+    queue = []
+    counter = count()
+    in_queue: Dict[Commit, int] = {} # 提交在队列中出现的次数 (同一提交可能因为新增标记被多次入队)
+    non_stale = 0 # 队列中未被标记为 STALE 的项数，为 0 时结束
+
+    def add_flags(commit: Commit, new_flags: int):
+        nonlocal non_stale
+        old_flags = flags.get(commit, 0)
+        if new_flags & STALE and not old_flags & STALE:
+            non_stale -= in_queue.get(commit, 0)
+        flags[commit] = old_flags | new_flags
+
+    def push(commit: Commit):
+        nonlocal non_stale
+        # 按 generation 从大到小出队，相同时按提交时间从新到旧 (graph 外的提交 generation 相同，只按时间)
+        cache.parse(commit)
+        heapq.heappush(queue, (-cache.generation(commit), -commit.commit_time, next(counter), commit))
+        in_queue[commit] = in_queue.get(commit, 0) + 1
+        if not flags[commit] & STALE:
+            non_stale += 1
+
+    add_flags(one, PARENT1)
+    add_flags(two, PARENT2)
+    push(one)
+    push(two)
+    result = []
+    while non_stale:
+        commit = heapq.heappop(queue)[3]
+        in_queue[commit] -= 1
+        if not flags[commit] & STALE:
+            non_stale -= 1
+
+        paint = flags[commit] & (PARENT1 | PARENT2 | STALE)
+        if paint == PARENT1 | PARENT2:
+            if not flags[commit] & RESULT:
+                add_flags(commit, RESULT)
+                result.append(commit)
+            paint |= STALE
+        for parent in commit.parents:
+            if flags.get(parent, 0) & paint == paint:
+                continue
+            add_flags(parent, paint)
+            push(parent)
+    return remove_redundant(cache, result)
+
+
+def remove_redundant(cache: CommitCache, commits: List[Commit]) -> List[Commit]:
+    # 去掉是其他候选提交祖先的候选提交
+    return [
+        commit for commit in commits
+        if not any(other is not commit and is_ancestor(cache, commit, other) for other in commits)
+    ]
@@ -0,0 +1,212 @@
+from binascii import hexlify
+from collections import OrderedDict
+from fnmatch import fnmatchcase
+from typing import Iterator, List, Optional, Tuple
+
+from tig.core.object_database import ObjectDatabase
+
+MODE_TREE = b'40000'
+MODE_GITLINK = b'160000'
+S_IFMT = 0o170000
+
+# (mode, name, sha1)，都是 tree 对象内容上的 memoryview 切片
+TreeEntry = Tuple[memoryview, memoryview, memoryview]
+
+
+def iter_tree_entries(content: bytes) -> Iterator[TreeEntry]:
+    # tree entry format: mode name\0sha1，在 bytes 上查找分隔符，在 memoryview 上切片，不复制数据
+    view = memoryview(content)
+    i, n = 0, len(content)
+    while i < n:
+        space_idx = content.index(b' ', i)
+        null_idx = content.index(b'\x00', space_idx)
+        yield view[i:space_idx], view[space_idx+1:null_idx], view[null_idx+1:null_idx+21]
+        i = null_idx + 21
+
+
+def object_type_of_mode(mode) -> str:
+    if mode == MODE_TREE:
+        return 'tree'
+    if mode == MODE_GITLINK:
+        return 'commit'
+    return 'blob'
+
+
+def peel_to_tree(odb: ObjectDatabase, file_hash: str) -> Optional[str]:
+    # 标签 -> 提交 -> tree
+    while True:
+        obj = odb.read(file_hash)
+        if obj is None:
+            return None
+        object_type, content = obj
+        if object_type == 'tree':
+            return file_hash
+        if object_type == 'tag':
+            assert content.startswith(b'object '), f"Bad tag object: {file_hash}"
+            file_hash = content[7:47].decode()
+        elif object_type == 'commit':
+            assert content.startswith(b'tree '), f"Bad commit object: {file_hash}"
+            return content[5:45].decode()
+        else:
+            return None
+
+
+def _is_wildcard(pattern: bytes) -> bool:
+    return any(c in pattern for c in b'*?[')
+
+
+class Pathspec:
+    """路径过滤: 与某个模式相同或位于模式目录下的路径被选中，含 * ? [ 的模式按 fnmatch 匹配完整路径 (* 可以匹配 /)"""
+
+    def __init__(self, patterns: List[str]):
+        self.patterns = [pattern.encode().rstrip(b'/') for pattern in patterns]
+        self.match_all = not self.patterns or any(pattern in (b'', b'.') for pattern in self.patterns)
+
+    def matches(self, path: bytes) -> bool:
+        if self.match_all:
+            return True
+        for pattern in self.patterns:
+            if path == pattern or path.startswith(pattern + b'/'):
+                return True
+            if _is_wildcard(pattern) and fnmatchcase(path, pattern):
+                return True
+        return False
+
+    def may_contain(self, dir_path: bytes) -> bool:
+        # 目录本身被选中，或者目录下可能有被选中的路径时才需要展开
+        if self.matches(dir_path):
+            return True
+        dir_prefix = dir_path + b'/'
+        for pattern in self.patterns:
+            literal = pattern
+            if _is_wildcard(pattern):
+                literal = pattern[:min(pattern.find(c) for c in (b'*', b'?', b'[') if c in pattern)]
+                if dir_prefix.startswith(literal):
+                    return True
+            if literal.startswith(dir_prefix):
+                return True
+        return False
+
+
+# (状态, 旧 mode, 新 mode, 旧 sha1, 新 sha1, 路径)，不存在的一边 mode 为 b'0'、sha1 为 None
+TreeChange = Tuple[str, bytes, bytes, Optional[bytes], Optional[bytes], bytes]
+
+NULL_SHA1_HEX = b'0' * 40
+
+OUTPUT_RAW = 'raw'
+OUTPUT_NAME_ONLY = 'name-only'
+OUTPUT_NAME_STATUS = 'name-status'
+
+
+def format_change(change: TreeChange, output_format: str) -> bytes:
+    status, old_mode, new_mode, old_sha1, new_sha1, path = change
+    if output_format == OUTPUT_NAME_ONLY:
+        return path + b'\n'
+    if output_format == OUTPUT_NAME_STATUS:
+        return b'%s\t%s\n' % (status.encode(), path)
+    # :<旧 mode> <新 mode> <旧 sha1> <新 sha1> <状态>\t<路径>
+    return b':%06o %06o %s %s %s\t%s\n' % (
+        int(old_mode, 8), int(new_mode, 8),
+        hexlify(old_sha1) if old_sha1 else NULL_SHA1_HEX,
+        hexlify(new_sha1) if new_sha1 else NULL_SHA1_HEX,
+        status.encode(), path,
+    )
+
+
+def _sort_key(mode, name) -> bytes:
+    # tree 中的排序规则: 目录名按末尾带 '/' 比较
+    return bytes(name) + b'/' if mode == MODE_TREE else bytes(name)
+
+
+class TreeWalker:
+    """递归展开 tree 对象。按 sha1 缓存解析后的 entry 列表，连续遍历多个版本时，相同的子树不会被重复展开;
+    与 DeltaBaseCache 一样按 LRU 淘汰，缓存的 tree 内容总字节数不超过 cache_limit"""
+
+    DEFAULT_CACHE_LIMIT = 32 * 1024 * 1024
+
+    def __init__(self, odb: ObjectDatabase, cache_limit: int = DEFAULT_CACHE_LIMIT):
+        self.odb = odb
+        self.cache_limit = cache_limit
+        self.cache_size = 0
+        self._trees: OrderedDict[bytes, Tuple[int, List[TreeEntry]]] = OrderedDict() # sha1 -> (tree 大小, entry 列表)
+
+    def entries(self, sha1: bytes) -> List[TreeEntry]:
+        item = self._trees.get(sha1)
+        if item is not None:
+            self._trees.move_to_end(sha1)
+            return item[1]
+
+        obj = self.odb.read(sha1.hex())
+        assert obj is not None, f"Cannot find tree: {sha1.hex()}"
+        assert obj[0] == 'tree', f"Object {sha1.hex()} is a {obj[0]}, not a tree"
+        entries = list(iter_tree_entries(obj[1]))
+        size = len(obj[1])
+        if size <= self.cache_limit:
+            self._trees[sha1] = (size, entries)
+            self.cache_size += size
+            while self.cache_size > self.cache_limit:
+                _, (evicted_size, _) = self._trees.popitem(last=False)
+                self.cache_size -= evicted_size
+        return entries
+
+    def walk(self, sha1: bytes, recursive: bool = False, show_trees: bool = False,
+             prefix: bytes = b'') -> Iterator[Tuple[memoryview, bytes, memoryview]]:
+        # 按 tree 中的顺序 (即 git 的路径顺序) 返回 (mode, 完整路径, sha1)
+        for mode, name, entry_sha1 in self.entries(sha1):
+            path = prefix + name
+            if recursive and mode == MODE_TREE:
+                if show_trees:
+                    yield mode, path, entry_sha1
+                yield from self.walk(bytes(entry_sha1), True, show_trees, path + b'/')
+            else:
+                yield mode, path, entry_sha1
+
+    def diff(self, old_sha1: Optional[bytes], new_sha1: Optional[bytes], recursive: bool = False,
+             pathspec: Optional[Pathspec] = None, prefix: bytes = b'') -> Iterator[TreeChange]:
+        """同时遍历两个有序的 entry 列表 (tree-diff.c)。两边 sha1 相同的子树直接跳过，
+        代价只与改动的大小有关; 只读取 tree 对象，从不解压 blob"""
+        if old_sha1 == new_sha1:
+            return
+        old_entries = self.entries(old_sha1) if old_sha1 is not None else []
+        new_entries = self.entries(new_sha1) if new_sha1 is not None else []
+        old_keys = [_sort_key(mode, name) for mode, name, _ in old_entries]
+        new_keys = [_sort_key(mode, name) for mode, name, _ in new_entries]
+
+        i = j = 0
+        while i < len(old_entries) or j < len(new_entries):
+            if j == len(new_entries) or (i < len(old_entries) and old_keys[i] < new_keys[j]):
+                old, new = old_entries[i], None
+                i += 1
+            elif i == len(old_entries) or old_keys[i] > new_keys[j]:
+                old, new = None, new_entries[j]
+                j += 1
+            else:
+                old, new = old_entries[i], new_entries[j]
+                i += 1
+                j += 1
+                if old[2] == new[2] and old[0] == new[0]:
+                    continue
+
+            mode, name, _ = old or new
+            path = prefix + name
+            is_tree = mode == MODE_TREE
+            if pathspec is not None and not (pathspec.may_contain(path) if is_tree else pathspec.matches(path)):
+                continue
+            if is_tree and recursive:
+                yield from self.diff(bytes(old[2]) if old else None, bytes(new[2]) if new else None,
+                                     True, pathspec, path + b'/')
+                continue
+
+            if old is None:
+                yield 'A', b'0', bytes(new[0]), None, bytes(new[2]), path
+            elif new is None:
+                yield 'D', bytes(old[0]), b'0', bytes(old[2]), None, path
+            else:
+                old_mode, new_mode = bytes(old[0]), bytes(new[0])
+                status = 'T' if int(old_mode, 8) & S_IFMT != int(new_mode, 8) & S_IFMT else 'M'
+                yield status, old_mode, new_mode, bytes(old[2]), bytes(new[2]), path
+
+    def clear(self):
+        self._trees.clear()
+        self.cache_size = 0
+